@@ -1,525 +1,1217 @@
-import tkinter as tk
-from tkinter import ttk, messagebox
-import json
-import os
-
-class HospitalApp(tk.Tk):
-    def __init__(self):
-        super().__init__()
-        self.theme = "light"
-        self.current_page = "Dashboard"
-        self._set_theme_colors()
-        self.title("Daniel's Hospital Appointment Booking System")
-        self.geometry("1000x650")
-        self.configure(bg=self.BG)
-        self.patients = []
-        self.doctors = []
-        self.appointments = []
-        self.trash = {
-            "patients": [],
-            "doctors": [],
-            "appointments": []
-        }
-        self.load_data()  # <-- Add this line
-        self._setup_styles()
-        self._build_layout()
-
-    def _set_theme_colors(self):
-        if self.theme == "light":
-            self.PRIMARY = "#1565c0"
-            self.ACCENT = "#43a047"
-            self.BG = "#f4faff"
-            self.SIDEBAR_BG = "#e3eafc"
-            self.CARD_BG = "#ffffff"
-            self.FG = "#222"
-        else:
-            self.PRIMARY = "#90caf9"
-            self.ACCENT = "#66bb6a"
-            self.BG = "#23272e"
-            self.SIDEBAR_BG = "#2c313a"
-            self.CARD_BG = "#323842"
-            self.FG = "#f4faff"
-
-    def _setup_styles(self):
-        style = ttk.Style(self)
-        style.theme_use('clam')
-        style.configure('Sidebar.TFrame', background=self.SIDEBAR_BG)
-        style.configure('Sidebar.TButton', background=self.SIDEBAR_BG, foreground=self.PRIMARY, font=('Arial', 12, 'bold'), borderwidth=0)
-        style.map('Sidebar.TButton', background=[('active', self.PRIMARY)], foreground=[('active', 'white')])
-        style.configure('Header.TLabel', font=('Arial', 20, 'bold'), foreground=self.PRIMARY, background=self.BG)
-        style.configure('Card.TFrame', background=self.CARD_BG, relief='raised', borderwidth=1)
-        style.configure('CardHeader.TLabel', font=('Arial', 14, 'bold'), foreground=self.PRIMARY, background=self.CARD_BG)
-        style.configure('TLabel', background=self.CARD_BG, font=('Arial', 11), foreground=self.FG)
-        style.configure('TButton', font=('Arial', 11), padding=6)
-        style.configure('Accent.TButton', background=self.ACCENT, foreground='white', font=('Arial', 11, 'bold'))
-        style.map('Accent.TButton', background=[('active', self.PRIMARY)])
-
-    def _build_layout(self):
-        # Sidebar
-        sidebar = ttk.Frame(self, style='Sidebar.TFrame', width=200)
-        sidebar.pack(side='left', fill='y')
-        logo = ttk.Label(sidebar, text="🏥", font=('Arial', 32), background=self.SIDEBAR_BG)
-        logo.pack(pady=(30, 10))
-        ttk.Label(sidebar, text="Daniel's Hospital", font=('Arial', 14, 'bold'), background=self.SIDEBAR_BG, foreground=self.PRIMARY).pack(pady=(0, 30))
-        self.menu_buttons = []
-        menu_items = [
-            ("Dashboard", self.show_dashboard),
-            ("Patients", self.show_patients),
-            ("Doctors", self.show_doctors),
-            ("Appointments", self.show_appointments),
-            ("Schedules", self.show_schedules),
-            ("Settings", self.show_settings),  # Added Settings
-            ("Trash", self.show_trash),
-        ]
-        for text, cmd in menu_items:
-            btn = ttk.Button(sidebar, text=text, style='Sidebar.TButton', command=cmd)
-            btn.pack(fill='x', padx=20, pady=8)
-            self.menu_buttons.append(btn)
-
-        # Main content area
-        self.content = ttk.Frame(self, style='Card.TFrame')
-        self.content.pack(side='left', fill='both', expand=True, padx=30, pady=30)
-        # self.show_dashboard()
-
-        page_map = {
-            "Dashboard": self.show_dashboard,
-            "Patients": self.show_patients,
-            "Doctors": self.show_doctors,
-            "Appointments": self.show_appointments,
-            "Schedules": self.show_schedules,
-            "Settings": self.show_settings,
-            "Trash": self.show_trash,
-        }
-        page_map.get(self.current_page, self.show_dashboard)()
-
-    def clear_content(self):
-        for widget in self.content.winfo_children():
-            widget.destroy()
-
-    def show_dashboard(self):
-        self.current_page = "Dashboard"
-        self.clear_content()
-        ttk.Label(self.content, text="Welcome to Daniel's Hospital", style='Header.TLabel').pack(pady=(10, 5))
-        ttk.Label(self.content, text="Select a section from the sidebar to manage patients, doctors, appointments, or schedules.", background=self.CARD_BG).pack(pady=10)
-
-    def show_patients(self):
-        self.current_page = "Patients"
-        self.clear_content()
-        self.edit_patient_idx = None  # Track editing index
-        ttk.Label(self.content, text="Patient Registration", style='CardHeader.TLabel').pack(anchor='w', pady=(10, 5), padx=20)
-        form = ttk.Frame(self.content, style='Card.TFrame')
-        form.pack(anchor='w', padx=20, pady=10)
-        ttk.Label(form, text="Name:").grid(row=0, column=0, sticky='e', pady=5)
-        name_entry = ttk.Entry(form, width=30)
-        name_entry.grid(row=0, column=1, pady=5, padx=5)
-        ttk.Label(form, text="Age:").grid(row=1, column=0, sticky='e', pady=5)
-        age_entry = ttk.Entry(form, width=30)
-        age_entry.grid(row=1, column=1, pady=5, padx=5)
-
-        def register():
-            name = name_entry.get().strip()
-            age = age_entry.get().strip()
-            if not name or not age.isdigit():
-                messagebox.showerror("Error", "Enter valid name and age.")
-                return
-            if self.edit_patient_idx is not None:
-                # Update existing
-                self.patients[self.edit_patient_idx] = {'name': name, 'age': int(age)}
-                self.edit_patient_idx = None
-            else:
-                # Add new
-                self.patients.append({'name': name, 'age': int(age)})
-            self.save_data()
-            update_list()
-            name_entry.delete(0, tk.END)
-            age_entry.delete(0, tk.END)
-
-        ttk.Button(form, text="Register", style='Accent.TButton', command=register).grid(row=2, column=0, columnspan=2, pady=10)
-        ttk.Label(self.content, text="Registered Patients:", font=('Arial', 11, 'bold')).pack(anchor='w', padx=20, pady=(10, 0))
-        patient_list = tk.Listbox(self.content, width=50, font=('Arial', 10))
-        patient_list.pack(anchor='w', padx=20, pady=5)
-
-        def update_list():
-            patient_list.delete(0, tk.END)
-            for p in self.patients:
-                patient_list.insert(tk.END, f"{p['name']} (Age: {p['age']})")
-        update_list()
-
-        btn_frame = ttk.Frame(self.content)
-        btn_frame.pack(anchor='w', padx=20, pady=5)
-        def delete_patient():
-            idx = patient_list.curselection()
-            if not idx:
-                messagebox.showerror("Error", "Select a patient to delete.")
-                return
-            confirm = messagebox.askyesno("Confirm Delete", "Are you sure you want to delete this patient?")
-            if not confirm:
-                return
-            self.trash["patients"].append(self.patients[idx[0]])
-            del self.patients[idx[0]]
-            self.save_data()
-            update_list()
-        def edit_patient():
-            idx = patient_list.curselection()
-            if not idx:
-                messagebox.showerror("Error", "Select a patient to edit.")
-                return
-            patient = self.patients[idx[0]]
-            name_entry.delete(0, tk.END)
-            name_entry.insert(0, patient['name'])
-            age_entry.delete(0, tk.END)
-            age_entry.insert(0, str(patient['age']))
-            self.edit_patient_idx = idx[0]  # Set editing index
-
-        ttk.Button(btn_frame, text="Edit", command=edit_patient).pack(side='left', padx=5)
-        ttk.Button(btn_frame, text="Delete", command=delete_patient).pack(side='left', padx=5)
-
-    def show_doctors(self):
-        self.current_page = "Doctors"
-        self.clear_content()
-        self.edit_doctor_idx = None  # Track editing index
-        ttk.Label(self.content, text="Doctor Management", style='CardHeader.TLabel').pack(anchor='w', pady=(10, 5), padx=20)
-        form = ttk.Frame(self.content, style='Card.TFrame')
-        form.pack(anchor='w', padx=20, pady=10)
-        ttk.Label(form, text="Name:").grid(row=0, column=0, sticky='e', pady=5)
-        name_entry = ttk.Entry(form, width=30)
-        name_entry.grid(row=0, column=1, pady=5, padx=5)
-        ttk.Label(form, text="Specialty:").grid(row=1, column=0, sticky='e', pady=5)
-        spec_entry = ttk.Entry(form, width=30)
-        spec_entry.grid(row=1, column=1, pady=5, padx=5)
-        ttk.Label(form, text="Slots (comma separated):").grid(row=2, column=0, sticky='e', pady=5)
-        slot_entry = ttk.Entry(form, width=30)
-        slot_entry.grid(row=2, column=1, pady=5, padx=5)
-
-        def add_doctor():
-            name = name_entry.get().strip()
-            spec = spec_entry.get().strip()
-            slots = [s.strip() for s in slot_entry.get().split(",") if s.strip()]
-            if not name or not spec or not slots:
-                messagebox.showerror("Error", "Fill all fields and at least one slot.")
-                return
-            if self.edit_doctor_idx is not None:
-                self.doctors[self.edit_doctor_idx] = {'name': name, 'spec': spec, 'slots': slots}
-                self.edit_doctor_idx = None
-            else:
-                self.doctors.append({'name': name, 'spec': spec, 'slots': slots})
-            self.save_data()
-            update_list()
-            name_entry.delete(0, tk.END)
-            spec_entry.delete(0, tk.END)
-            slot_entry.delete(0, tk.END)
-
-        ttk.Button(form, text="Add Doctor", style='Accent.TButton', command=add_doctor).grid(row=3, column=0, columnspan=2, pady=10)
-        ttk.Label(self.content, text="Doctors & Slots:", font=('Arial', 11, 'bold')).pack(anchor='w', padx=20, pady=(10, 0))
-        doc_list = tk.Listbox(self.content, width=70, font=('Arial', 10))
-        doc_list.pack(anchor='w', padx=20, pady=5)
-
-        def update_list():
-            doc_list.delete(0, tk.END)
-            for d in self.doctors:
-                doc_list.insert(tk.END, f"{d['name']} ({d['spec']}) - Slots: {', '.join(d['slots'])}")
-        update_list()
-
-        btn_frame = ttk.Frame(self.content)
-        btn_frame.pack(anchor='w', padx=20, pady=5)
-        def delete_doctor():
-            idx = doc_list.curselection()
-            if not idx:
-                messagebox.showerror("Error", "Select a doctor to delete.")
-                return
-            confirm = messagebox.askyesno("Confirm Delete", "Are you sure you want to delete this doctor?")
-            if not confirm:
-                return
-            self.trash["doctors"].append(self.doctors[idx[0]])  # Move to trash
-            del self.doctors[idx[0]]
-            self.save_data()
-            update_list()
-        def edit_doctor():
-            idx = doc_list.curselection()
-            if not idx:
-                messagebox.showerror("Error", "Select a doctor to edit.")
-                return
-            doctor = self.doctors[idx[0]]
-            name_entry.delete(0, tk.END)
-            name_entry.insert(0, doctor['name'])
-            spec_entry.delete(0, tk.END)
-            spec_entry.insert(0, doctor['spec'])
-            slot_entry.delete(0, tk.END)
-            slot_entry.insert(0, ", ".join(doctor['slots']))
-            self.edit_doctor_idx = idx[0]  # Set editing index
-
-        ttk.Button(btn_frame, text="Edit", command=edit_doctor).pack(side='left', padx=5)
-        ttk.Button(btn_frame, text="Delete", command=delete_doctor).pack(side='left', padx=5)
-
-    def show_appointments(self):
-        self.current_page = "Appointments"
-        self.clear_content()
-        self.edit_appointment_idx = None  # Track editing index
-        ttk.Label(self.content, text="Book/Cancel Appointment", style='CardHeader.TLabel').pack(anchor='w', pady=(10, 5), padx=20)
-        form = ttk.Frame(self.content, style='Card.TFrame')
-        form.pack(anchor='w', padx=20, pady=10)
-        ttk.Label(form, text="Patient:").grid(row=0, column=0, sticky='e', pady=5)
-        patient_combo = ttk.Combobox(form, state="readonly", width=28, values=[f"{p['name']} (Age: {p['age']})" for p in self.patients])
-        patient_combo.grid(row=0, column=1, pady=5, padx=5)
-        ttk.Label(form, text="Doctor:").grid(row=1, column=0, sticky='e', pady=5)
-        doctor_combo = ttk.Combobox(form, state="readonly", width=28, values=[f"{d['name']} ({d['spec']})" for d in self.doctors])
-        doctor_combo.grid(row=1, column=1, pady=5, padx=5)
-        ttk.Label(form, text="Slot:").grid(row=2, column=0, sticky='e', pady=5)
-        slot_combo = ttk.Combobox(form, state="readonly", width=28)
-        slot_combo.grid(row=2, column=1, pady=5, padx=5)
-        def update_slots(event=None):
-            idx = doctor_combo.current()
-            if idx >= 0:
-                slots = self.doctors[idx]['slots']
-                booked = [a['slot'] for a in self.appointments if a['doctor'] == self.doctors[idx]]
-                available = [s for s in slots if s not in booked]
-                slot_combo['values'] = available
-            else:
-                slot_combo['values'] = []
-        doctor_combo.bind("<<ComboboxSelected>>", update_slots)
-        def book():
-            p_idx = patient_combo.current()
-            d_idx = doctor_combo.current()
-            slot = slot_combo.get()
-            if p_idx < 0 or d_idx < 0 or not slot:
-                messagebox.showerror("Error", "Select patient, doctor, and slot.")
-                return
-            patient = self.patients[p_idx]
-            doctor = self.doctors[d_idx]
-            for a in self.appointments:
-                if a['doctor'] == doctor and a['slot'] == slot:
-                    messagebox.showerror("Error", "Slot already booked.")
-                    return
-            if self.edit_appointment_idx is not None:
-                self.appointments[self.edit_appointment_idx] = {'patient': patient, 'doctor': doctor, 'slot': slot}
-                self.edit_appointment_idx = None
-            else:
-                self.appointments.append({'patient': patient, 'doctor': doctor, 'slot': slot})
-            self.save_data()
-            update_list()
-            update_slots()
-        ttk.Button(form, text="Book Appointment", style='Accent.TButton', command=book).grid(row=3, column=0, columnspan=2, pady=10)
-        ttk.Label(self.content, text="Appointments:", font=('Arial', 11, 'bold')).pack(anchor='w', padx=20, pady=(10, 0))
-        appt_list = tk.Listbox(self.content, width=80, font=('Arial', 10))
-        appt_list.pack(anchor='w', padx=20, pady=5)
-        def update_list():
-            appt_list.delete(0, tk.END)
-            for a in self.appointments:
-                appt_list.insert(tk.END, f"{a['patient']['name']} with Dr. {a['doctor']['name']} at {a['slot']}")
-        def cancel():
-            idx = appt_list.curselection()
-            if not idx:
-                messagebox.showerror("Error", "Select an appointment to cancel.")
-                return
-            self.appointments.pop(idx[0])
-            self.save_data()
-            update_list()
-            update_slots()
-        ttk.Button(self.content, text="Cancel Appointment", command=cancel).pack(anchor='w', padx=20, pady=5)
-        update_list()
-        btn_frame = ttk.Frame(self.content)
-        btn_frame.pack(anchor='w', padx=20, pady=5)
-        def delete_appointment():
-            idx = appt_list.curselection()
-            if not idx:
-                messagebox.showerror("Error", "Select an appointment to delete.")
-                return
-            confirm = messagebox.askyesno("Confirm Delete", "Are you sure you want to delete this appointment?")
-            if not confirm:
-                return
-            self.trash["appointments"].append(self.appointments[idx[0]])  # Move to trash
-            self.appointments.pop(idx[0])
-            self.save_data()
-            update_list()
-            update_slots()
-        def edit_appointment():
-            idx = appt_list.curselection()
-            if not idx:
-                messagebox.showerror("Error", "Select an appointment to edit.")
-                return
-            appt = self.appointments[idx[0]]
-            patient_combo.set(f"{appt['patient']['name']} (Age: {appt['patient']['age']})")
-            doctor_combo.set(f"{appt['doctor']['name']} ({appt['doctor']['spec']})")
-            slot_combo.set(appt['slot'])
-            self.edit_appointment_idx = idx[0]  # Set editing index
-        ttk.Button(btn_frame, text="Edit", command=edit_appointment).pack(side='left', padx=5)
-        ttk.Button(btn_frame, text="Delete", command=delete_appointment).pack(side='left', padx=5)
-
-    def show_schedules(self):
-        self.current_page = "Schedules"
-        self.clear_content()
-        ttk.Label(self.content, text="Upcoming Appointments", style='CardHeader.TLabel').pack(anchor='w', pady=(10, 5), padx=20)
-        sched_list = tk.Listbox(self.content, width=90, font=('Arial', 10))
-        sched_list.pack(anchor='w', padx=20, pady=10)
-        for a in self.appointments:
-            sched_list.insert(tk.END, f"{a['patient']['name']} with Dr. {a['doctor']['name']} ({a['doctor']['spec']}) at {a['slot']}")
-        def export():
-            try:
-                with open("appointments_schedule.txt", "w") as f:
-                    for a in self.appointments:
-                        f.write(
-                            f"Dear {a['patient']['name']},\n"
-                            f"You have an appointment with Dr. {a['doctor']['name']} ({a['doctor']['spec']}) at {a['slot']}.\n"
-                            "Please arrive 10 minutes early and bring any necessary documents.\n"
-                            "Thank you for choosing Daniel's Hospital.\n"
-                            "---------------------------------------------\n\n"
-                        )
-                messagebox.showinfo("Exported", "Schedule exported to appointments_schedule.txt")
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to export: {e}")
-        ttk.Button(self.content, text="Export Schedule", style='Accent.TButton', command=export).pack(anchor='w', padx=20, pady=10)
-
-    def show_settings(self):
-        self.current_page = "Settings"
-        self.clear_content()
-        ttk.Label(self.content, text="Settings", style='Header.TLabel').pack(pady=(10, 5))
-        ttk.Label(self.content, text="Theme:", style='CardHeader.TLabel').pack(anchor='w', padx=20, pady=(20, 5))
-        theme_frame = ttk.Frame(self.content, style='Card.TFrame')
-        theme_frame.pack(anchor='w', padx=20, pady=5)
-        theme_var = tk.StringVar(value=self.theme)
-        def set_theme():
-            self.theme = theme_var.get()
-            self._set_theme_colors()
-            self._setup_styles()
-            self.configure(bg=self.BG)
-            # Destroy all widgets before rebuilding layout
-            for widget in self.winfo_children():
-                widget.destroy()
-            self._build_layout()
-        ttk.Radiobutton(theme_frame, text="Light", variable=theme_var, value="light", command=set_theme).pack(side='left', padx=10)
-        ttk.Radiobutton(theme_frame, text="Dark", variable=theme_var, value="dark", command=set_theme).pack(side='left', padx=10)
-
-    def save_data(self):
-        data = {
-            "patients": self.patients,
-            "doctors": self.doctors,
-            "appointments": self.appointments,
-            "trash": self.trash
-        }
-        with open("hospital_data.json", "w") as f:
-            json.dump(data, f)
-
-    def load_data(self):
-        if os.path.exists("hospital_data.json"):
-            with open("hospital_data.json", "r") as f:
-                data = json.load(f)
-                self.patients = data.get("patients", [])
-                self.doctors = data.get("doctors", [])
-                self.appointments = data.get("appointments", [])
-                self.trash = data.get("trash", {"patients": [], "doctors": [], "appointments": []})
-
-    def show_trash(self):
-        self.current_page = "Trash"
-        self.clear_content()
-        main_frame = ttk.Frame(self.content, style='Card.TFrame')
-        main_frame.pack(fill='both', expand=True, padx=30, pady=20)
-
-        ttk.Label(main_frame, text="🗑️ Trash Bin", style='Header.TLabel', font=('Arial', 22, 'bold')).grid(row=0, column=0, columnspan=3, pady=(0, 20))
-
-        # --- Patients Trash ---
-        patient_section = ttk.LabelFrame(main_frame, text="Deleted Patients")
-        patient_section.grid(row=1, column=0, sticky='nsew', padx=10, pady=10)
-        patient_trash = tk.Listbox(patient_section, width=35, font=('Arial', 10))
-        patient_trash.pack(padx=10, pady=10)
-        for p in self.trash["patients"]:
-            patient_trash.insert(tk.END, f"{p['name']} (Age: {p['age']})")
-        btns = ttk.Frame(patient_section)
-        btns.pack(pady=(0, 10))
-        def recover_patient():
-            idx = patient_trash.curselection()
-            if not idx:
-                messagebox.showerror("Error", "Select a patient to recover.")
-                return
-            confirm = messagebox.askyesno("Recover Patient", "Restore this patient to the main list?")
-            if not confirm:
-                return
-            self.patients.append(self.trash["patients"].pop(idx[0]))
-            self.save_data()
-            self.show_trash()
-        def empty_patients():
-            if not self.trash["patients"]:
-                messagebox.showinfo("Empty", "No deleted patients to remove.")
-                return
-            confirm = messagebox.askyesno("Empty Patient Trash", "This will permanently delete all deleted patients. Continue?")
-            if not confirm:
-                return
-            self.trash["patients"].clear()
-            self.save_data()
-            self.show_trash()
-        ttk.Button(btns, text="Recover", command=recover_patient).pack(side='left', padx=1)
-        ttk.Button(btns, text="Empty", command=empty_patients).pack(side='left', padx=1)
-
-        # --- Doctors Trash ---
-        doctor_section = ttk.LabelFrame(main_frame, text="Deleted Doctors")
-        doctor_section.grid(row=1, column=1, sticky='nsew', padx=10, pady=10)
-        doctor_trash = tk.Listbox(doctor_section, width=45, font=('Arial', 10))
-        doctor_trash.pack(padx=10, pady=10)
-        for d in self.trash["doctors"]:
-            doctor_trash.insert(tk.END, f"{d['name']} ({d['spec']}) - Slots: {', '.join(d['slots'])}")
-        btns = ttk.Frame(doctor_section)
-        btns.pack(pady=(0, 10))
-        def recover_doctor():
-            idx = doctor_trash.curselection()
-            if not idx:
-                messagebox.showerror("Error", "Select a doctor to recover.")
-                return
-            confirm = messagebox.askyesno("Recover Doctor", "Restore this doctor to the main list?")
-            if not confirm:
-                return
-            self.doctors.append(self.trash["doctors"].pop(idx[0]))
-            self.save_data()
-            self.show_trash()
-        def empty_doctors():
-            if not self.trash["doctors"]:
-                messagebox.showinfo("Empty", "No deleted doctors to remove.")
-                return
-            confirm = messagebox.askyesno("Empty Doctor Trash", "This will permanently delete all deleted doctors. Continue?")
-            if not confirm:
-                return
-            self.trash["doctors"].clear()
-            self.save_data()
-            self.show_trash()
-        ttk.Button(btns, text="Recover", command=recover_doctor).pack(side='left', padx=1)
-        ttk.Button(btns, text="Empty", command=empty_doctors).pack(side='left', padx=1)
-
-        # --- Appointments Trash ---
-        appt_section = ttk.LabelFrame(main_frame, text="Deleted Appointments")
-        appt_section.grid(row=1, column=2, sticky='nsew', padx=10, pady=10)
-        appt_trash = tk.Listbox(appt_section, width=55, font=('Arial', 10))
-        appt_trash.pack(padx=10, pady=10)
-        for a in self.trash["appointments"]:
-            appt_trash.insert(tk.END, f"{a['patient']['name']} with Dr. {a['doctor']['name']} at {a['slot']}")
-        btns = ttk.Frame(appt_section)
-        btns.pack(pady=(0, 10))
-        def recover_appt():
-            idx = appt_trash.curselection()
-            if not idx:
-                messagebox.showerror("Error", "Select an appointment to recover.")
-                return
-            confirm = messagebox.askyesno("Recover Appointment", "Restore this appointment to the main list?")
-            if not confirm:
-                return
-            self.appointments.append(self.trash["appointments"].pop(idx[0]))
-            self.save_data()
-            self.show_trash()
-        def empty_appts():
-            if not self.trash["appointments"]:
-                messagebox.showinfo("Empty", "No deleted appointments to remove.")
-                return
-            confirm = messagebox.askyesno("Empty Appointment Trash", "This will permanently delete all deleted appointments. Continue?")
-            if not confirm:
-                return
-            self.trash["appointments"].clear()
-            self.save_data()
-            self.show_trash()
-        ttk.Button(btns, text="Recover", command=recover_appt).pack(side='left', padx=1)
-        ttk.Button(btns, text="Empty", command=empty_appts).pack(side='left', padx=1)
-
-        # Make columns expand equally
-        main_frame.columnconfigure(0, weight=1)
-        main_frame.columnconfigure(1, weight=1)
-        main_frame.columnconfigure(2, weight=1)
-
-if __name__ == "__main__":
-    app = HospitalApp()
+import queue
+import sys
+import tkinter as tk
+from dataclasses import replace
+from datetime import datetime, timedelta
+from tkinter import ttk, messagebox, filedialog
+from client import RemoteHospital, RemoteStore
+from diagnostics import ACTIONS, STATS, timed
+from export import FORMATS, SHARDS, ExportJob, schedule_rows
+from hospital import Conflict, Hospital, doctor_record, patient_record, waitlist_record
+from importer import IMPORT_TYPES, ImportJob, summary
+from models import ATTENDED, BOOKED, CANCELLED, NO_SHOW, ROUTINE, URGENCIES, Appointment
+from server import PORT
+from slots import LEAVE_FORMAT_HELP, RULE_FORMAT_HELP, SLOT_FORMAT_HELP, WEEK, parse_slot, week_of
+from storage import SNAPSHOT_FILE, BackgroundWriter, open_storage
+from widgets import PagedList, SearchBox, VirtualList
+
+COMPACT_INTERVAL_MS = 60000
+ERROR_POLL_MS = 250
+EXPORT_POLL_MS = 100
+IMPORT_POLL_MS = 100
+FREE_SLOT_RESULTS = 200
+TRASH_PAGE_SIZE = 50
+TRASH_PURGE_MS = 60000
+SERVER_POLL_MS = 100
+DIAGNOSTICS_POLL_MS = 1000
+# Positions of the records being edited on each page, kept in step with other desks' changes
+EDIT_INDEX = {"patients": "edit_patient_idx", "doctors": "edit_doctor_idx", "appointments": "edit_appointment_idx"}
+
+class HospitalApp(tk.Tk):
+    def __init__(self, data_file=SNAPSHOT_FILE, server=None):
+        super().__init__()
+        self.theme = "light"
+        self.current_page = "Dashboard"
+        self.export_job = None
+        self.import_job = None
+        self.pages = {}
+        self.list_views = []
+        self._set_theme_colors()
+        self.title("Daniel's Hospital Appointment Booking System")
+        self.geometry("1000x650")
+        self.configure(bg=self.BG)
+        if server is None:
+            self.hospital = Hospital(BackgroundWriter(open_storage(data_file)))
+        else:
+            # Shared with other desks through a booking server on this port
+            self.hospital = RemoteHospital(RemoteStore(server))
+            self.hospital.on_change = self._remote_change
+        self.hospital.on_loaded = self._history_loaded
+        self.load_data()  # <-- Add this line
+        self._setup_styles()
+        self._build_layout()
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
+        self.after(COMPACT_INTERVAL_MS, self._compact_tick)
+        self.after(ERROR_POLL_MS, self._poll_storage_errors)
+        if server is None:
+            self.after(TRASH_PURGE_MS, self._purge_tick)
+        else:
+            # The server purges the trash itself
+            self.after(SERVER_POLL_MS, self._poll_server)
+        # Once the window is up, rather than before it
+        self.after_idle(self.hospital.build_search_indexes)
+
+    @property
+    def patients(self):
+        return self.hospital.patients
+
+    @property
+    def doctors(self):
+        return self.hospital.doctors
+
+    @property
+    def appointments(self):
+        return self.hospital.appointments
+
+    def _set_theme_colors(self):
+        if self.theme == "light":
+            self.PRIMARY = "#1565c0"
+            self.ACCENT = "#43a047"
+            self.BG = "#f4faff"
+            self.SIDEBAR_BG = "#e3eafc"
+            self.CARD_BG = "#ffffff"
+            self.FG = "#222"
+        else:
+            self.PRIMARY = "#90caf9"
+            self.ACCENT = "#66bb6a"
+            self.BG = "#23272e"
+            self.SIDEBAR_BG = "#2c313a"
+            self.CARD_BG = "#323842"
+            self.FG = "#f4faff"
+
+    def _setup_styles(self):
+        style = ttk.Style(self)
+        style.theme_use('clam')
+        style.configure('Sidebar.TFrame', background=self.SIDEBAR_BG)
+        style.configure('Sidebar.TLabel', background=self.SIDEBAR_BG, foreground=self.PRIMARY)
+        style.configure('Sidebar.TButton', background=self.SIDEBAR_BG, foreground=self.PRIMARY, font=('Arial', 12, 'bold'), borderwidth=0)
+        style.map('Sidebar.TButton', background=[('active', self.PRIMARY)], foreground=[('active', 'white')])
+        style.configure('Header.TLabel', font=('Arial', 20, 'bold'), foreground=self.PRIMARY, background=self.BG)
+        style.configure('Card.TFrame', background=self.CARD_BG, relief='raised', borderwidth=1)
+        style.configure('CardHeader.TLabel', font=('Arial', 14, 'bold'), foreground=self.PRIMARY, background=self.CARD_BG)
+        style.configure('TLabel', background=self.CARD_BG, font=('Arial', 11), foreground=self.FG)
+        style.configure('TButton', font=('Arial', 11), padding=6)
+        style.configure('Accent.TButton', background=self.ACCENT, foreground='white', font=('Arial', 11, 'bold'))
+        style.map('Accent.TButton', background=[('active', self.PRIMARY)])
+
+    def _build_layout(self):
+        # Sidebar
+        sidebar = ttk.Frame(self, style='Sidebar.TFrame', width=200)
+        sidebar.pack(side='left', fill='y')
+        logo = ttk.Label(sidebar, text="🏥", font=('Arial', 32), style='Sidebar.TLabel')
+        logo.pack(pady=(30, 10))
+        ttk.Label(sidebar, text="Daniel's Hospital", font=('Arial', 14, 'bold'), style='Sidebar.TLabel').pack(pady=(0, 30))
+        self.menu_buttons = []
+        menu_items = [
+            ("Dashboard", self.show_dashboard),
+            ("Patients", self.show_patients),
+            ("Doctors", self.show_doctors),
+            ("Appointments", self.show_appointments),
+            ("Schedules", self.show_schedules),
+            ("Waitlist", self.show_waitlist),
+            ("Settings", self.show_settings),  # Added Settings
+            ("Trash", self.show_trash),
+        ]
+        for text, cmd in menu_items:
+            btn = ttk.Button(sidebar, text=text, style='Sidebar.TButton', command=cmd)
+            btn.pack(fill='x', padx=20, pady=8)
+            self.menu_buttons.append(btn)
+
+        # Main content area
+        self.content = ttk.Frame(self, style='Card.TFrame')
+        self.content.pack(side='left', fill='both', expand=True, padx=30, pady=30)
+        # self.show_dashboard()
+
+        page_map = {
+            "Dashboard": self.show_dashboard,
+            "Patients": self.show_patients,
+            "Doctors": self.show_doctors,
+            "Appointments": self.show_appointments,
+            "Schedules": self.show_schedules,
+            "Waitlist": self.show_waitlist,
+            "Settings": self.show_settings,
+            "Trash": self.show_trash,
+        }
+        page_map.get(self.current_page, self.show_dashboard)()
+
+    def _show_page(self, name, build, depends):
+        # Pages are built once and kept; re-showing one only refreshes the
+        # widgets fed by lists that changed since it was last on screen
+        self.current_page = name
+        for other in self.pages.values():
+            other["frame"].pack_forget()
+        versions = self.hospital.versions
+        cached = self.pages.get(name)
+        if cached is None:
+            frame = ttk.Frame(self.content, style='Card.TFrame')
+            cached = self.pages[name] = {"frame": frame, "refresh": build(frame), "depends": depends}
+            cached["seen"] = {n: versions[n] for n in depends}
+        else:
+            self._refresh_page(cached)
+        cached["frame"].pack(fill='both', expand=True)
+
+    def _refresh_page(self, cached):
+        versions = self.hospital.versions
+        changed = {n for n in cached["depends"] if versions[n] != cached["seen"][n]}
+        if changed and cached["refresh"] is not None:
+            with STATS.measure("update_list"):
+                cached["refresh"](changed)
+        cached["seen"] = {n: versions[n] for n in cached["depends"]}
+
+    def _list_view(self, parent, items, formatter, **options):
+        view = VirtualList(parent, items, formatter, **options)
+        self._style_list(view)
+        self.list_views.append(view)
+        return view
+
+    def _trash_list(self, parent, kind, formatter, **options):
+        # The trash stays on disk until the Trash page first asks for it,
+        # and then only one page of it is shown at a time
+        view = PagedList(parent, lambda offset, limit: self.hospital.trash.page(kind, offset, limit),
+                         lambda: self.hospital.trash.count(kind), formatter, page_size=TRASH_PAGE_SIZE, **options)
+        self._style_list(view)
+        self.list_views.append(view)
+        return view
+
+    def _search_box(self, parent, kind, formatter, on_pick=None):
+        box = SearchBox(parent, lambda query, limit: self.hospital.search(kind, query, limit), formatter,
+                        on_pick=on_pick, font=('Arial', 10))
+        self._style_list(box)
+        self.list_views.append(box)
+        return box
+
+    def _import_button(self, parent, kind, done):
+        # Bulk import for one list; `done` refreshes the page's widgets
+        status = ttk.Label(parent)
+        ttk.Button(parent, text=f"Import {kind.title()}...", command=lambda: self._import(kind, status, done)).pack(side='left', padx=5)
+        status.pack(side='left', padx=5)
+
+    def _import(self, kind, status, done):
+        if self.import_job is not None and not self.import_job.finished:
+            messagebox.showerror("Error", "An import is already running.")
+            return
+        paths = filedialog.askopenfilenames(title=f"Import {kind}", filetypes=IMPORT_TYPES)
+        if not paths:
+            return
+        self.import_job = ImportJob(self.hospital, list(paths), kind)
+        self.import_job.start()
+        self.after(IMPORT_POLL_MS, lambda: self._poll_import(status, done))
+
+    def _poll_import(self, status, done):
+        job = self.import_job
+        status.configure(text=f"Read {job.rows} rows...")
+        if not job.finished:
+            self.after(IMPORT_POLL_MS, lambda: self._poll_import(status, done))
+            return
+        status.configure(text="")
+        if job.error is not None:
+            messagebox.showerror("Error", f"Failed to import: {job.error}")
+            return
+        if job.importer.cancelled:
+            return
+        importer = job.importer
+        counts = importer.commit()
+        done()
+        text = summary(counts, importer.rejected)
+        if not importer.rejected:
+            messagebox.showinfo("Imported", text)
+            return
+        reasons = "\n".join(f"Row {number}: {reason}" for _, number, reason, _ in importer.rejected[:10])
+        if messagebox.askyesno("Imported", f"{text}\n\n{reasons}\n\nSave the rejected rows to a file?"):
+            path = filedialog.asksaveasfilename(initialfile="rejected_rows.csv", defaultextension=".csv",
+                                                filetypes=[("CSV", "*.csv"), ("All files", "*.*")])
+            if path:
+                importer.write_rejected(path)
+
+    def _style_list(self, view):
+        view.listbox.configure(background=self.CARD_BG, foreground=self.FG,
+                               selectbackground=self.PRIMARY, selectforeground='white')
+
+    @timed("show_dashboard")
+    def show_dashboard(self):
+        self._show_page("Dashboard", self._build_dashboard, ("patients", "doctors", "appointments"))
+
+    def _build_dashboard(self, page):
+        ttk.Label(page, text="Welcome to Daniel's Hospital", style='Header.TLabel').pack(pady=(10, 5))
+        ttk.Label(page, text="Select a section from the sidebar to manage patients, doctors, appointments, or schedules.").pack(pady=10)
+        # Every figure is kept up to date by the Hospital as records change
+        # (see analytics.py); the lists only format the rows on screen
+        stats = self.hospital.analytics
+        totals = ttk.Label(page, font=('Arial', 11, 'bold'))
+        totals.pack(anchor='w', padx=20, pady=(10, 5))
+        rates = ttk.Label(page)
+        rates.pack(anchor='w', padx=20)
+        def percent(rate):
+            return "n/a" if rate is None else f"{rate:.1%}"
+        def format_load(d):
+            text = f"{d.name} ({d.spec}): {stats.booked(d.id)} booked, {stats.free(d.id)} free"
+            if d.weekly:
+                text += " + weekly hours"
+            return text
+        ttk.Label(page, text="Doctors:", font=('Arial', 11, 'bold')).pack(anchor='w', padx=20, pady=(10, 0))
+        load_list = self._list_view(page, self.doctors, format_load, height=8, width=70, font=('Arial', 10))
+        load_list.pack(anchor='w', padx=20, pady=5)
+        ttk.Label(page, text="Demand by specialty:", font=('Arial', 11, 'bold')).pack(anchor='w', padx=20, pady=(10, 0))
+        demand = []
+        demand_list = self._list_view(page, demand, lambda row: f"{row[0]}: {row[1]} appointments",
+                                      height=5, width=70, font=('Arial', 10))
+        demand_list.pack(anchor='w', padx=20, pady=5)
+        def refresh(changed=()):
+            totals.configure(text=f"Patients: {stats.patients} registered, {len(stats.booked_patients)} with appointments"
+                                  f"    Doctors: {len(self.doctors)}    Appointments: {stats.appointments()}")
+            rates.configure(text=f"Cancelled: {percent(stats.cancel_rate())}    "
+                                 f"No-shows: {percent(stats.no_show_rate())} of attended or missed")
+            demand[:] = stats.specialties()
+            demand_list.refresh()
+            load_list.refresh()
+        refresh()
+        return refresh
+
+    @timed("show_patients")
+    def show_patients(self):
+        self._show_page("Patients", self._build_patients, ("patients",))
+
+    def _build_patients(self, page):
+        self.edit_patient_idx = None  # Track editing index
+        ttk.Label(page, text="Patient Registration", style='CardHeader.TLabel').pack(anchor='w', pady=(10, 5), padx=20)
+        form = ttk.Frame(page, style='Card.TFrame')
+        form.pack(anchor='w', padx=20, pady=10)
+        ttk.Label(form, text="Name:").grid(row=0, column=0, sticky='e', pady=5)
+        name_entry = ttk.Entry(form, width=30)
+        name_entry.grid(row=0, column=1, pady=5, padx=5)
+        ttk.Label(form, text="Age:").grid(row=1, column=0, sticky='e', pady=5)
+        age_entry = ttk.Entry(form, width=30)
+        age_entry.grid(row=1, column=1, pady=5, padx=5)
+
+        def register():
+            try:
+                patient = patient_record(name_entry.get(), age_entry.get())
+            except ValueError as e:
+                messagebox.showerror("Error", str(e))
+                return
+            if self.edit_patient_idx is not None:
+                # Update existing
+                self.hospital.update("patients", self.edit_patient_idx, patient)
+                patient_list.row_updated(self.edit_patient_idx)
+                self.edit_patient_idx = None
+            else:
+                # Add new
+                self.hospital.add("patients", patient)
+                patient_list.row_inserted(len(self.patients) - 1)
+            patient_search.refresh()
+            name_entry.delete(0, tk.END)
+            age_entry.delete(0, tk.END)
+
+        ttk.Button(form, text="Register", style='Accent.TButton', command=register).grid(row=2, column=0, columnspan=2, pady=10)
+        ttk.Label(page, text="Find Patient:", font=('Arial', 11, 'bold')).pack(anchor='w', padx=20, pady=(10, 0))
+        patient_search = self._search_box(page, "patients", self.format_patient,
+                                          on_pick=lambda p: patient_list.select(self.hospital.index_of("patients", p)))
+        patient_search.pack(anchor='w', padx=20, pady=5)
+        ttk.Label(page, text="Registered Patients:", font=('Arial', 11, 'bold')).pack(anchor='w', padx=20, pady=(10, 0))
+        patient_list = self._list_view(page, self.patients, self.format_patient, width=50, font=('Arial', 10))
+        patient_list.pack(anchor='w', padx=20, pady=5)
+
+        btn_frame = ttk.Frame(page)
+        btn_frame.pack(anchor='w', padx=20, pady=5)
+        def delete_patient():
+            idx = patient_list.curselection()
+            if not idx:
+                messagebox.showerror("Error", "Select a patient to delete.")
+                return
+            confirm = messagebox.askyesno("Confirm Delete", "Are you sure you want to delete this patient?")
+            if not confirm:
+                return
+            self.hospital.delete("patients", idx[0])
+            patient_list.row_deleted(idx[0])
+            patient_search.refresh()
+        def edit_patient():
+            idx = patient_list.curselection()
+            if not idx:
+                messagebox.showerror("Error", "Select a patient to edit.")
+                return
+            patient = self.patients[idx[0]]
+            name_entry.delete(0, tk.END)
+            name_entry.insert(0, patient.name)
+            age_entry.delete(0, tk.END)
+            age_entry.insert(0, str(patient.age))
+            self.edit_patient_idx = idx[0]  # Set editing index
+
+        ttk.Button(btn_frame, text="Edit", command=edit_patient).pack(side='left', padx=5)
+        ttk.Button(btn_frame, text="Delete", command=delete_patient).pack(side='left', padx=5)
+
+        def refresh(changed):
+            # Positions may have moved, so a pending edit can't be trusted
+            self.edit_patient_idx = None
+            patient_list.refresh()
+            patient_search.refresh()
+        self._import_button(btn_frame, "patients", lambda: refresh({"patients"}))
+        return refresh
+
+    @timed("show_doctors")
+    def show_doctors(self):
+        self._show_page("Doctors", self._build_doctors, ("doctors",))
+
+    def _build_doctors(self, page):
+        self.edit_doctor_idx = None  # Track editing index
+        ttk.Label(page, text="Doctor Management", style='CardHeader.TLabel').pack(anchor='w', pady=(10, 5), padx=20)
+        form = ttk.Frame(page, style='Card.TFrame')
+        form.pack(anchor='w', padx=20, pady=10)
+        ttk.Label(form, text="Name:").grid(row=0, column=0, sticky='e', pady=5)
+        name_entry = ttk.Entry(form, width=30)
+        name_entry.grid(row=0, column=1, pady=5, padx=5)
+        ttk.Label(form, text="Specialty:").grid(row=1, column=0, sticky='e', pady=5)
+        spec_entry = ttk.Entry(form, width=30)
+        spec_entry.grid(row=1, column=1, pady=5, padx=5)
+        ttk.Label(form, text=f"Slots ({SLOT_FORMAT_HELP}, comma separated):").grid(row=2, column=0, sticky='e', pady=5)
+        slot_entry = ttk.Entry(form, width=30)
+        slot_entry.grid(row=2, column=1, pady=5, padx=5)
+        ttk.Label(form, text=f"Weekly hours ({RULE_FORMAT_HELP}, comma separated):").grid(row=3, column=0, sticky='e', pady=5)
+        weekly_entry = ttk.Entry(form, width=30)
+        weekly_entry.grid(row=3, column=1, pady=5, padx=5)
+        ttk.Label(form, text=f"Leave ({LEAVE_FORMAT_HELP}, comma separated):").grid(row=4, column=0, sticky='e', pady=5)
+        leave_entry = ttk.Entry(form, width=30)
+        leave_entry.grid(row=4, column=1, pady=5, padx=5)
+        entries = (name_entry, spec_entry, slot_entry, weekly_entry, leave_entry)
+
+        def add_doctor():
+            slots, weekly, leave = ([s.strip() for s in e.get().split(",") if s.strip()]
+                                    for e in (slot_entry, weekly_entry, leave_entry))
+            # Slots kept as labels when older data was migrated can stay
+            keep = self.doctors[self.edit_doctor_idx].slots if self.edit_doctor_idx is not None else ()
+            try:
+                doctor = doctor_record(name_entry.get(), spec_entry.get(), slots, weekly, leave, keep)
+            except ValueError as e:
+                messagebox.showerror("Error", str(e))
+                return
+            if self.edit_doctor_idx is not None:
+                self.hospital.update("doctors", self.edit_doctor_idx, doctor)
+                doc_list.row_updated(self.edit_doctor_idx)
+                self.edit_doctor_idx = None
+            else:
+                self.hospital.add("doctors", doctor)
+                doc_list.row_inserted(len(self.doctors) - 1)
+            doctor_search.refresh()
+            for entry in entries:
+                entry.delete(0, tk.END)
+
+        ttk.Button(form, text="Add Doctor", style='Accent.TButton', command=add_doctor).grid(row=5, column=0, columnspan=2, pady=10)
+        ttk.Label(page, text="Find Doctor (name or specialty):", font=('Arial', 11, 'bold')).pack(anchor='w', padx=20, pady=(10, 0))
+        doctor_search = self._search_box(page, "doctors", self.format_doctor,
+                                         on_pick=lambda d: doc_list.select(self.hospital.index_of("doctors", d)))
+        doctor_search.pack(anchor='w', padx=20, pady=5)
+        ttk.Label(page, text="Doctors & Slots:", font=('Arial', 11, 'bold')).pack(anchor='w', padx=20, pady=(10, 0))
+        doc_list = self._list_view(page, self.doctors, self.format_doctor, width=70, font=('Arial', 10))
+        doc_list.pack(anchor='w', padx=20, pady=5)
+
+        btn_frame = ttk.Frame(page)
+        btn_frame.pack(anchor='w', padx=20, pady=5)
+        def delete_doctor():
+            idx = doc_list.curselection()
+            if not idx:
+                messagebox.showerror("Error", "Select a doctor to delete.")
+                return
+            confirm = messagebox.askyesno("Confirm Delete", "Are you sure you want to delete this doctor?")
+            if not confirm:
+                return
+            self.hospital.delete("doctors", idx[0])  # Move to trash
+            doc_list.row_deleted(idx[0])
+            doctor_search.refresh()
+        def edit_doctor():
+            idx = doc_list.curselection()
+            if not idx:
+                messagebox.showerror("Error", "Select a doctor to edit.")
+                return
+            doctor = self.doctors[idx[0]]
+            values = (doctor.name, doctor.spec, ", ".join(doctor.slots),
+                      ", ".join(doctor.weekly), ", ".join(doctor.leave))
+            for entry, value in zip(entries, values):
+                entry.delete(0, tk.END)
+                entry.insert(0, value)
+            self.edit_doctor_idx = idx[0]  # Set editing index
+
+        ttk.Button(btn_frame, text="Edit", command=edit_doctor).pack(side='left', padx=5)
+        ttk.Button(btn_frame, text="Delete", command=delete_doctor).pack(side='left', padx=5)
+
+        def refresh(changed):
+            self.edit_doctor_idx = None
+            doc_list.refresh()
+            doctor_search.refresh()
+        self._import_button(btn_frame, "doctors", lambda: refresh({"doctors"}))
+        return refresh
+
+    @timed("show_appointments")
+    def show_appointments(self):
+        self._show_page("Appointments", self._build_appointments, ("patients", "doctors", "appointments"))
+
+    def _build_appointments(self, page):
+        self.edit_appointment_idx = None  # Track editing index
+        ttk.Label(page, text="Book/Cancel Appointment", style='CardHeader.TLabel').pack(anchor='w', pady=(10, 5), padx=20)
+        form = ttk.Frame(page, style='Card.TFrame')
+        form.pack(anchor='w', padx=20, pady=10)
+        ttk.Label(form, text="Patient:").grid(row=0, column=0, sticky='ne', pady=5)
+        patient_search = self._search_box(form, "patients", self.format_patient)
+        patient_search.grid(row=0, column=1, pady=5, padx=5)
+        ttk.Label(form, text="Doctor:").grid(row=1, column=0, sticky='ne', pady=5)
+        doctor_search = self._search_box(form, "doctors", lambda d: f"{d.name} ({d.spec})",
+                                         on_pick=lambda d: update_slots())
+        doctor_search.grid(row=1, column=1, pady=5, padx=5)
+        ttk.Label(form, text="Slot:").grid(row=2, column=0, sticky='e', pady=5)
+        slot_combo = ttk.Combobox(form, state="readonly", width=28)
+        slot_combo.grid(row=2, column=1, pady=5, padx=5)
+        # Weekly hours are expanded one week at a time, for the week shown here
+        week_frame = ttk.Frame(form, style='Card.TFrame')
+        week_frame.grid(row=2, column=2, pady=5, padx=5)
+        slot_week = [week_of(datetime.now())]
+        week_label = ttk.Label(week_frame, width=16)
+        def show_week(week):
+            slot_week[0] = week
+            week_label.configure(text=f"Week of {week:%Y-%m-%d}")
+            update_slots()
+        ttk.Button(week_frame, text="◀", width=2, command=lambda: show_week(slot_week[0] - WEEK)).pack(side='left')
+        week_label.pack(side='left', padx=5)
+        ttk.Button(week_frame, text="▶", width=2, command=lambda: show_week(slot_week[0] + WEEK)).pack(side='left')
+        def show_slot_week(slot):
+            interval = parse_slot(slot)
+            if interval is not None:
+                show_week(week_of(interval[0]))
+        def chosen(box, kind):
+            # The picked record may have been edited or deleted since
+            if box.choice is None:
+                return None
+            return self.hospital.ids[kind].get(box.choice.id)
+        @timed("update_slots")
+        def update_slots(event=None):
+            doctor = chosen(doctor_search, "doctors")
+            if doctor is not None:
+                slot_combo['values'] = self.hospital.available_slots(doctor, slot_week[0])
+            else:
+                slot_combo['values'] = []
+        @timed("book")
+        def book():
+            patient = chosen(patient_search, "patients")
+            doctor = chosen(doctor_search, "doctors")
+            slot = slot_combo.get()
+            editing = None
+            if self.edit_appointment_idx is not None:
+                editing = self.appointments[self.edit_appointment_idx]
+            try:
+                self.hospital.check_booking(patient, doctor, slot, ignore=editing)
+            except ValueError as e:
+                messagebox.showerror("Error", str(e))
+                return
+            if self.edit_appointment_idx is not None:
+                # Only the booking changes; the status stays what it was
+                self.hospital.update("appointments", self.edit_appointment_idx,
+                                     replace(editing, patient_id=patient.id, doctor_id=doctor.id, slot=slot))
+                appt_list.row_updated(self.edit_appointment_idx)
+                self.edit_appointment_idx = None
+                # The slot it moved from may be wanted
+                if self._offer_freed_slots():
+                    appt_list.refresh()
+            else:
+                self.hospital.add("appointments", Appointment(None, patient.id, doctor.id, slot))
+                appt_list.row_inserted(len(self.appointments) - 1)
+            clear_found()
+            update_slots()
+        ttk.Button(form, text="Book Appointment", style='Accent.TButton', command=book).grid(row=3, column=0, columnspan=2, pady=10)
+
+        # Free slot finder across all doctors, optionally of one specialty
+        ttk.Label(page, text="Find Free Slot:", font=('Arial', 11, 'bold')).pack(anchor='w', padx=20, pady=(10, 0))
+        finder = ttk.Frame(page, style='Card.TFrame')
+        finder.pack(anchor='w', padx=20, pady=5)
+        ttk.Label(finder, text="Specialty:").grid(row=0, column=0, sticky='e', pady=5)
+        spec_combo = ttk.Combobox(finder, state="readonly", width=20)
+        spec_combo.grid(row=0, column=1, pady=5, padx=5)
+        ttk.Label(finder, text="From:").grid(row=0, column=2, sticky='e', pady=5)
+        from_entry = ttk.Entry(finder, width=18)
+        from_entry.grid(row=0, column=3, pady=5, padx=5)
+        ttk.Label(finder, text="To:").grid(row=0, column=4, sticky='e', pady=5)
+        to_entry = ttk.Entry(finder, width=18)
+        to_entry.grid(row=0, column=5, pady=5, padx=5)
+        free_found = []
+        free_list = self._list_view(page, free_found, lambda f: f"{f[1]} - Dr. {f[0].name} ({f[0].spec})",
+                                    height=5, width=80, font=('Arial', 10))
+        def update_specialties():
+            spec_combo['values'] = ["Any"] + self.hospital.specialties()
+            if spec_combo.get() not in spec_combo['values']:
+                spec_combo.set("Any")
+        def read_time(entry, default):
+            text = entry.get().strip()
+            if not text:
+                return default
+            interval = parse_slot(text)
+            if interval is None:
+                messagebox.showerror("Error", "Enter times as YYYY-MM-DD HH:MM.")
+                return None
+            return interval[0]
+        def chosen_spec():
+            return None if spec_combo.get() in ("", "Any") else spec_combo.get()
+        def show_found(found):
+            free_found[:] = found
+            free_list.set_items(free_found)
+            if not found:
+                messagebox.showinfo("Find Free Slot", "No free slots found.")
+        def clear_found():
+            free_found.clear()
+            free_list.set_items(free_found)
+        def earliest_free():
+            after = read_time(from_entry, datetime.now())
+            if after is None:
+                return
+            found = self.hospital.earliest_free(chosen_spec(), after)
+            show_found([found] if found else [])
+            if found:
+                use_found(0)
+        def free_in_window():
+            start = read_time(from_entry, datetime.now())
+            if start is None:
+                return
+            end = read_time(to_entry, start + timedelta(days=7))
+            if end is None:
+                return
+            show_found(self.hospital.free_slots(start, end, chosen_spec(), FREE_SLOT_RESULTS))
+        def use_found(index):
+            doctor, slot = free_found[index]
+            doctor_search.set_choice(doctor)
+            show_slot_week(slot)
+            slot_combo.set(slot)
+        def use_selected():
+            idx = free_list.curselection()
+            if not idx:
+                messagebox.showerror("Error", "Select a free slot to use.")
+                return
+            use_found(idx[0])
+        ttk.Button(finder, text="Earliest Free", command=earliest_free).grid(row=1, column=1, pady=5)
+        ttk.Button(finder, text="All Free In Window", command=free_in_window).grid(row=1, column=3, pady=5)
+        ttk.Button(finder, text="Use Selected Slot", command=use_selected).grid(row=1, column=5, pady=5)
+        free_list.pack(anchor='w', padx=20, pady=5)
+        update_specialties()
+        show_week(slot_week[0])
+
+        ttk.Label(page, text="Appointments:", font=('Arial', 11, 'bold')).pack(anchor='w', padx=20, pady=(10, 0))
+        appt_list = self._list_view(page, self.appointments, self.describe_appointment, width=80, font=('Arial', 10))
+        appt_list.pack(anchor='w', padx=20, pady=5)
+        def cancel():
+            idx = appt_list.curselection()
+            if not idx:
+                messagebox.showerror("Error", "Select an appointment to cancel.")
+                return
+            # Kept on the list, marked cancelled, and its slot is free again
+            self.hospital.set_status(idx[0], CANCELLED)
+            appt_list.row_updated(idx[0])
+            if self._offer_freed_slots():
+                appt_list.refresh()
+            update_slots()
+        def mark(status):
+            idx = appt_list.curselection()
+            if not idx:
+                messagebox.showerror("Error", "Select an appointment to mark.")
+                return
+            try:
+                self.hospital.set_status(idx[0], status)
+            except ValueError as e:
+                messagebox.showerror("Error", str(e))
+                return
+            self._offer_freed_slots()
+            appt_list.refresh()
+            update_slots()
+        status_frame = ttk.Frame(page)
+        status_frame.pack(anchor='w', padx=20, pady=5)
+        ttk.Button(status_frame, text="Cancel Appointment", command=cancel).pack(side='left')
+        ttk.Button(status_frame, text="Mark Attended", command=lambda: mark(ATTENDED)).pack(side='left', padx=5)
+        ttk.Button(status_frame, text="Mark No-Show", command=lambda: mark(NO_SHOW)).pack(side='left', padx=5)
+        ttk.Button(status_frame, text="Mark Booked", command=lambda: mark(BOOKED)).pack(side='left', padx=5)
+        btn_frame = ttk.Frame(page)
+        btn_frame.pack(anchor='w', padx=20, pady=5)
+        def delete_appointment():
+            idx = appt_list.curselection()
+            if not idx:
+                messagebox.showerror("Error", "Select an appointment to delete.")
+                return
+            confirm = messagebox.askyesno("Confirm Delete", "Are you sure you want to delete this appointment?")
+            if not confirm:
+                return
+            self.hospital.delete("appointments", idx[0])  # Move to trash
+            appt_list.row_deleted(idx[0])
+            if self._offer_freed_slots():
+                appt_list.refresh()
+            update_slots()
+        def edit_appointment():
+            idx = appt_list.curselection()
+            if not idx:
+                messagebox.showerror("Error", "Select an appointment to edit.")
+                return
+            appt = self.appointments[idx[0]]
+            patient = self.hospital.patient_of(appt)
+            doctor = self.hospital.doctor_of(appt)
+            patient_search.set_choice(patient)
+            doctor_search.set_choice(doctor)
+            show_slot_week(appt.slot)
+            update_slots()
+            slot_combo.set(appt.slot)
+            self.edit_appointment_idx = idx[0]  # Set editing index
+        def show_past():
+            self.hospital.loaded("appointments")
+            past_button.pack_forget()
+            appt_list.refresh()
+        ttk.Button(btn_frame, text="Edit", command=edit_appointment).pack(side='left', padx=5)
+        ttk.Button(btn_frame, text="Delete", command=delete_appointment).pack(side='left', padx=5)
+        # Appointments from before the last save are read in on request
+        past_button = ttk.Button(btn_frame, text="Show Past Appointments", command=show_past)
+        if self.hospital.history is not None:
+            past_button.pack(side='left', padx=5)
+
+        def refresh(changed):
+            self.edit_appointment_idx = None
+            if "patients" in changed:
+                patient_search.refresh()
+            if "doctors" in changed:
+                doctor_search.refresh()
+                update_specialties()
+            # Found slots may have been booked or their doctor edited since
+            clear_found()
+            update_slots()
+            if self.hospital.history is None:
+                past_button.pack_forget()
+            appt_list.refresh()
+        self._import_button(btn_frame, "appointments", lambda: refresh({"appointments"}))
+        return refresh
+
+    @timed("show_schedules")
+    def show_schedules(self):
+        self._show_page("Schedules", self._build_schedules, ("patients", "doctors", "appointments"))
+
+    def _build_schedules(self, page):
+        ttk.Label(page, text="Upcoming Appointments", style='CardHeader.TLabel').pack(anchor='w', pady=(10, 5), padx=20)
+        sched_list = self._list_view(page, self.appointments, self.format_schedule, width=90, font=('Arial', 10))
+        sched_list.pack(anchor='w', padx=20, pady=10)
+        options = ttk.Frame(page, style='Card.TFrame')
+        options.pack(anchor='w', padx=20, pady=(0, 5))
+        ttk.Label(options, text="Format:").pack(side='left')
+        format_combo = ttk.Combobox(options, state="readonly", width=10, values=list(FORMATS))
+        format_combo.set("letters")
+        format_combo.pack(side='left', padx=5)
+        ttk.Label(options, text="One file per:").pack(side='left', padx=(10, 0))
+        shard_combo = ttk.Combobox(options, state="readonly", width=10, values=list(SHARDS))
+        shard_combo.set("none")
+        shard_combo.pack(side='left', padx=5)
+
+        def export():
+            if self.export_job is not None and not self.export_job.finished:
+                messagebox.showerror("Error", "An export is already running.")
+                return
+            fmt = format_combo.get()
+            ext = FORMATS[fmt]
+            path = filedialog.asksaveasfilename(initialfile="appointments_schedule" + ext, defaultextension=ext,
+                                                filetypes=[(fmt.upper(), "*" + ext), ("All files", "*.*")])
+            if not path:
+                return
+            # Copy the references only; rows are built as the worker goes.
+            # Cancelled appointments get no letter
+            appointments = [a for a in self.hospital.loaded("appointments") if a.holds_slot]
+            self.export_job = ExportJob(schedule_rows(self.hospital, appointments), len(appointments),
+                                        path, fmt, shard_combo.get())
+            progress['maximum'] = max(1, len(appointments))
+            progress['value'] = 0
+            self.export_job.start()
+            self.after(EXPORT_POLL_MS, poll_export)
+
+        def poll_export():
+            job = self.export_job
+            if progress.winfo_exists():
+                progress['value'] = job.done
+            if not job.finished:
+                self.after(EXPORT_POLL_MS, poll_export)
+            elif job.error is not None:
+                messagebox.showerror("Error", f"Failed to export: {job.error}")
+            elif job.cancelled:
+                messagebox.showinfo("Export Cancelled", "The export was cancelled; no files were written.")
+            elif len(job.files) == 1:
+                messagebox.showinfo("Exported", f"Schedule exported to {job.files[0]}")
+            else:
+                messagebox.showinfo("Exported", f"Schedule exported to {len(job.files)} files next to {job.path}")
+
+        def cancel_export():
+            if self.export_job is not None and not self.export_job.finished:
+                self.export_job.cancel()
+
+        btns = ttk.Frame(page, style='Card.TFrame')
+        btns.pack(anchor='w', padx=20, pady=10)
+        ttk.Button(btns, text="Export Schedule", style='Accent.TButton', command=export).pack(side='left')
+        ttk.Button(btns, text="Cancel Export", command=cancel_export).pack(side='left', padx=5)
+        progress = ttk.Progressbar(page, length=300, mode='determinate')
+        progress.pack(anchor='w', padx=20)
+        return lambda changed: sched_list.refresh()
+
+    @timed("show_waitlist")
+    def show_waitlist(self):
+        self._show_page("Waitlist", self._build_waitlist, ("patients", "doctors", "waitlist"))
+
+    def _build_waitlist(self, page):
+        ttk.Label(page, text="Waitlist", style='CardHeader.TLabel').pack(anchor='w', pady=(10, 5), padx=20)
+        ttk.Label(page, text="When a slot is freed, the most urgent patient waiting longest for that doctor or specialty is offered it.").pack(anchor='w', padx=20)
+        form = ttk.Frame(page, style='Card.TFrame')
+        form.pack(anchor='w', padx=20, pady=10)
+        ttk.Label(form, text="Patient:").grid(row=0, column=0, sticky='ne', pady=5)
+        patient_search = self._search_box(form, "patients", self.format_patient)
+        patient_search.grid(row=0, column=1, pady=5, padx=5)
+        ttk.Label(form, text="Doctor:").grid(row=1, column=0, sticky='ne', pady=5)
+        doctor_search = self._search_box(form, "doctors", lambda d: f"{d.name} ({d.spec})",
+                                         on_pick=lambda d: spec_combo.set(""))
+        doctor_search.grid(row=1, column=1, pady=5, padx=5)
+        ttk.Label(form, text="Or any doctor of:").grid(row=2, column=0, sticky='e', pady=5)
+        spec_combo = ttk.Combobox(form, state="readonly", width=28)
+        spec_combo.grid(row=2, column=1, pady=5, padx=5)
+        spec_combo.bind("<<ComboboxSelected>>", lambda e: doctor_search.clear())
+        ttk.Label(form, text="Urgency:").grid(row=3, column=0, sticky='e', pady=5)
+        urgency_combo = ttk.Combobox(form, state="readonly", width=28, values=list(URGENCIES.values()))
+        urgency_combo.set(URGENCIES[ROUTINE])
+        urgency_combo.grid(row=3, column=1, pady=5, padx=5)
+        def update_specialties():
+            spec_combo['values'] = [""] + self.hospital.specialties()
+        def add_entry():
+            patient = patient_search.choice and self.hospital.ids["patients"].get(patient_search.choice.id)
+            doctor = doctor_search.choice and self.hospital.ids["doctors"].get(doctor_search.choice.id)
+            urgency = {name: level for level, name in URGENCIES.items()}.get(urgency_combo.get())
+            try:
+                entry = waitlist_record(patient, doctor, spec_combo.get(), urgency)
+            except ValueError as e:
+                messagebox.showerror("Error", str(e))
+                return
+            self.hospital.add("waitlist", entry)
+            wait_list.row_inserted(len(self.hospital.waitlist) - 1)
+            patient_search.clear()
+            doctor_search.clear()
+            spec_combo.set("")
+        ttk.Button(form, text="Add to Waitlist", style='Accent.TButton', command=add_entry).grid(row=4, column=0, columnspan=2, pady=10)
+
+        ttk.Label(page, text="Waiting:", font=('Arial', 11, 'bold')).pack(anchor='w', padx=20, pady=(10, 0))
+        wait_list = self._list_view(page, self.hospital.waitlist, self.format_waiting, width=80, font=('Arial', 10))
+        wait_list.pack(anchor='w', padx=20, pady=5)
+        def remove_entry():
+            idx = wait_list.curselection()
+            if not idx:
+                messagebox.showerror("Error", "Select a waiting patient to remove.")
+                return
+            self.hospital.remove("waitlist", idx[0])
+            wait_list.row_deleted(idx[0])
+        btn_frame = ttk.Frame(page)
+        btn_frame.pack(anchor='w', padx=20, pady=5)
+        ttk.Button(btn_frame, text="Remove", command=remove_entry).pack(side='left', padx=5)
+        update_specialties()
+
+        def refresh(changed):
+            if "patients" in changed:
+                patient_search.refresh()
+            if "doctors" in changed:
+                doctor_search.refresh()
+                update_specialties()
+            wait_list.refresh()
+        return refresh
+
+    def _offer_freed_slots(self):
+        # Slots freed by the change just made go to whoever is first in
+        # line for them, then the next until one says yes; returns how
+        # many were booked
+        booked = 0
+        offers = self.hospital.take_offers()
+        while offers:
+            for entry, doctor, slot in offers:
+                patient = self.hospital.patient_of(entry)
+                if not messagebox.askyesno("Slot Freed", f"{slot} with Dr. {doctor.name} ({doctor.spec}) is free.\n\n"
+                                           f"Book it for {patient.name} ({URGENCIES[entry.urgency]}, waiting since {entry.requested})?"):
+                    self.hospital.decline_offer(entry, doctor, slot)
+                    continue
+                try:
+                    self.hospital.book_offer(entry, doctor, slot)
+                except Conflict:
+                    raise
+                except ValueError as e:
+                    messagebox.showerror("Error", str(e))
+                    self.hospital.decline_offer(entry, doctor, slot)
+                    continue
+                booked += 1
+            offers = self.hospital.take_offers()
+        return booked
+
+    @timed("show_settings")
+    def show_settings(self):
+        self._show_page("Settings", self._build_settings, ())
+
+    def _build_settings(self, page):
+        ttk.Label(page, text="Settings", style='Header.TLabel').pack(pady=(10, 5))
+        ttk.Label(page, text="Theme:", style='CardHeader.TLabel').pack(anchor='w', padx=20, pady=(20, 5))
+        theme_frame = ttk.Frame(page, style='Card.TFrame')
+        theme_frame.pack(anchor='w', padx=20, pady=5)
+        theme_var = tk.StringVar(value=self.theme)
+        def set_theme():
+            self.theme = theme_var.get()
+            self._set_theme_colors()
+            self._setup_styles()
+            self.configure(bg=self.BG)
+            # ttk widgets pick the new styles up by themselves; only the
+            # plain tk listboxes need their colours set
+            for view in self.list_views:
+                self._style_list(view)
+        ttk.Radiobutton(theme_frame, text="Light", variable=theme_var, value="light", command=set_theme).pack(side='left', padx=10)
+        ttk.Radiobutton(theme_frame, text="Dark", variable=theme_var, value="dark", command=set_theme).pack(side='left', padx=10)
+
+        ttk.Label(page, text="Trash retention:", style='CardHeader.TLabel').pack(anchor='w', padx=20, pady=(20, 5))
+        retention = ttk.Frame(page, style='Card.TFrame')
+        retention.pack(anchor='w', padx=20, pady=5)
+        max_age_days, max_count = self.hospital.trash.policy()
+        days_var = tk.StringVar(value=str(max_age_days))
+        count_var = tk.StringVar(value=str(max_count))
+        ttk.Label(retention, text="Keep for (days):").pack(side='left')
+        ttk.Entry(retention, textvariable=days_var, width=6).pack(side='left', padx=5)
+        ttk.Label(retention, text="At most (entries per list):").pack(side='left', padx=(10, 0))
+        ttk.Entry(retention, textvariable=count_var, width=8).pack(side='left', padx=5)
+        def set_retention():
+            try:
+                self.hospital.set_trash_policy(int(days_var.get()), int(count_var.get()))
+            except ValueError:
+                messagebox.showerror("Error", "Enter whole numbers, 0 for no limit.")
+                return
+            purged = sum(self.hospital.purge_trash().values())
+            messagebox.showinfo("Trash Retention", f"Saved. {purged} expired trash entries removed.")
+        ttk.Button(retention, text="Apply", command=set_retention).pack(side='left', padx=10)
+
+        ttk.Label(page, text="Diagnostics:", style='CardHeader.TLabel').pack(anchor='w', padx=20, pady=(20, 5))
+        diagnostics = ttk.Frame(page, style='Card.TFrame')
+        diagnostics.pack(anchor='w', padx=20, pady=5)
+        recording_var = tk.BooleanVar(value=STATS.enabled)
+        def set_recording():
+            STATS.enabled = recording_var.get()
+            show_stats()
+        def reset_stats():
+            STATS.reset()
+            show_stats()
+        def export_stats():
+            path = filedialog.asksaveasfilename(initialfile="habs_stats.json", defaultextension=".json",
+                                                filetypes=[("JSON", "*.json"), ("CSV", "*.csv")])
+            if not path:
+                return
+            try:
+                STATS.export(path)
+            except OSError as e:
+                messagebox.showerror("Error", f"Failed to export: {e}")
+                return
+            messagebox.showinfo("Exported", f"Stats exported to {path}")
+        ttk.Checkbutton(diagnostics, text="Record timings", variable=recording_var, command=set_recording).pack(side='left')
+        ttk.Button(diagnostics, text="Reset", command=reset_stats).pack(side='left', padx=5)
+        ttk.Button(diagnostics, text="Export Stats...", command=export_stats).pack(side='left', padx=5)
+        columns = "{:<18} {:>7} {:>10} {:>10} {:>10} {:>10}"
+        ttk.Label(page, text=columns.format("Action", "Count", "p50 ms", "p90 ms", "p99 ms", "Max ms"),
+                  font=('Courier', 10)).pack(anchor='w', padx=20)
+        stats_rows = []
+        stats_list = self._list_view(page, stats_rows, lambda r: columns.format(
+            r["action"], r["count"], f"{r['p50_ms']:.2f}", f"{r['p90_ms']:.2f}", f"{r['p99_ms']:.2f}", f"{r['max_ms']:.2f}"),
+            height=8, width=75, font=('Courier', 10))
+        stats_list.pack(anchor='w', padx=20, pady=5)
+        written_label = ttk.Label(page)
+        written_label.pack(anchor='w', padx=20)
+        def show_stats():
+            stats_rows[:] = STATS.summary()
+            stats_list.refresh()
+            written = ", ".join(f"{name} {n / 1024:.1f} KB" for name, n in sorted(STATS.written().items()))
+            written_label.configure(text=f"Written: {written or 'nothing yet'}")
+
+        # cProfile one chosen action while the box is ticked
+        profile = ttk.Frame(page, style='Card.TFrame')
+        profile.pack(anchor='w', padx=20, pady=5)
+        ttk.Label(profile, text="Profile:").pack(side='left')
+        action_combo = ttk.Combobox(profile, state="readonly", width=18, values=list(ACTIONS))
+        action_combo.set(STATS.profile_action or "book")
+        action_combo.pack(side='left', padx=5)
+        profile_var = tk.BooleanVar(value=STATS.profile_action is not None)
+        def set_profiling():
+            if profile_var.get():
+                recording_var.set(True)
+                STATS.enabled = True
+                STATS.profile(action_combo.get())
+            else:
+                STATS.profile(None)
+        def save_profile():
+            path = filedialog.asksaveasfilename(initialfile=f"habs_{action_combo.get()}.txt", defaultextension=".txt",
+                                                filetypes=[("Text report", "*.txt"), ("pstats data", "*.prof")])
+            if not path:
+                return
+            try:
+                STATS.save_profile(path)
+            except (OSError, ValueError) as e:
+                messagebox.showerror("Error", f"Failed to save the profile: {e}")
+                return
+            messagebox.showinfo("Saved", f"Profile saved to {path}")
+        ttk.Checkbutton(profile, text="Capture", variable=profile_var, command=set_profiling).pack(side='left', padx=5)
+        ttk.Button(profile, text="Save Profile...", command=save_profile).pack(side='left', padx=5)
+
+        def tick():
+            if self.current_page == "Settings" and STATS.enabled:
+                show_stats()
+            self.after(DIAGNOSTICS_POLL_MS, tick)
+        show_stats()
+        self.after(DIAGNOSTICS_POLL_MS, tick)
+
+    def format_patient(self, p):
+        return f"{p.name} (Age: {p.age})"
+
+    def format_doctor(self, d):
+        text = f"{d.name} ({d.spec})"
+        if d.slots or not d.weekly:
+            text += f" - Slots: {', '.join(d.slots)}"
+        if d.weekly:
+            text += f" - Weekly: {', '.join(d.weekly)}"
+        if d.leave:
+            text += f" - Leave: {', '.join(d.leave)}"
+        return text
+
+    def format_waiting(self, w):
+        wanted = f"any {w.spec} doctor" if w.doctor_id is None else f"Dr. {self.hospital.doctor_of(w).name} ({w.spec})"
+        return f"[{URGENCIES[w.urgency]}] {self.hospital.patient_of(w).name} for {wanted}, waiting since {w.requested}"
+
+    def describe_appointment(self, a):
+        text = f"{self.hospital.patient_of(a).name} with Dr. {self.hospital.doctor_of(a).name} at {a.slot}"
+        return text if a.status == BOOKED else f"{text} ({a.status})"
+
+    def format_schedule(self, a):
+        doctor = self.hospital.doctor_of(a)
+        text = f"{self.hospital.patient_of(a).name} with Dr. {doctor.name} ({doctor.spec}) at {a.slot}"
+        return text if a.status == BOOKED else f"{text} ({a.status})"
+
+    @timed("save_data")
+    def save_data(self, *changes):
+        self.hospital.save(*changes)
+
+    @timed("load_data")
+    def load_data(self):
+        self.hospital.load()
+
+    def _compact_tick(self):
+        # After a failed write the journal count can be 0 while a full
+        # snapshot is still owed
+        store = self.hospital.store
+        if store.records or store.needs_compaction():
+            self.save_data()
+        self.after(COMPACT_INTERVAL_MS, self._compact_tick)
+
+    def _purge_tick(self):
+        # Expired trash entries are dropped as the app runs; the writes
+        # go through the background writer like any other
+        if self.hospital.purge_trash() and self.current_page == "Trash":
+            self.show_trash()
+        self.after(TRASH_PURGE_MS, self._purge_tick)
+
+    def _poll_server(self):
+        # Other desks' changes; their rows were already updated by
+        # _remote_change, the rest of the page catches up here
+        if self.hospital.poll():
+            # Pending edits were kept pointing at the same records
+            editing = {name: getattr(self, name, None) for name in EDIT_INDEX.values()}
+            self._refresh_page(self.pages[self.current_page])
+            for name, index in editing.items():
+                setattr(self, name, index)
+        self.after(SERVER_POLL_MS, self._poll_server)
+
+    def _remote_change(self, c):
+        items = getattr(self.hospital, c["kind"])
+        index = c["index"] if c.get("index") is not None else len(items) - 1
+        for view in self.list_views:
+            if isinstance(view, VirtualList) and view.items is items:
+                if c["op"] == "append":
+                    view.row_inserted(index, see=False)
+                elif c["op"] == "replace":
+                    view.row_updated(index)
+                else:
+                    view.row_deleted(index)
+        name = EDIT_INDEX.get(c["kind"])
+        editing = getattr(self, name, None) if name is not None else None
+        if c["op"] == "remove" and editing is not None:
+            setattr(self, name, None if editing == index else editing - (index < editing))
+
+    def _history_loaded(self, name):
+        # Past records are read in at the end of the list, so positions
+        # (selections, the one being edited) still hold; just show them
+        items = getattr(self.hospital, name)
+        for view in self.list_views:
+            if isinstance(view, VirtualList) and view.items is items:
+                view.refresh()
+
+    def report_callback_exception(self, exc, value, tb):
+        if isinstance(value, Conflict):
+            # Another desk got there first; show what it did
+            self.hospital.poll()
+            self._refresh_page(self.pages[self.current_page])
+            messagebox.showerror("Changed at Another Desk", str(value))
+        elif isinstance(value, ConnectionError):
+            messagebox.showerror("Connection Lost", str(value))
+        else:
+            super().report_callback_exception(exc, value, tb)
+
+    def _poll_storage_errors(self):
+        # Saves run on the writer thread; report their failures from the Tk loop
+        try:
+            error = self.hospital.store.errors.get_nowait()
+        except queue.Empty:
+            pass
+        else:
+            if isinstance(error, ConnectionError):
+                messagebox.showerror("Connection Lost", f"{error} Restart the app once the server is running again.")
+            else:
+                messagebox.showerror("Save Failed", f"Changes could not be written to disk and will be retried on the next save: {error}")
+        self.after(ERROR_POLL_MS, self._poll_storage_errors)
+
+    def _on_close(self):
+        # An unfinished import has not touched the data yet; just stop it
+        if self.import_job is not None:
+            self.import_job.cancel()
+        store = self.hospital.store
+        store.flush()
+        if store.records or store.needs_compaction():
+            # A full snapshot makes up for any write that failed so far
+            while not store.errors.empty():
+                store.errors.get_nowait()
+            self.save_data()
+        store.close()
+        # The error poll won't run again, so say now what wasn't saved
+        while not store.errors.empty():
+            messagebox.showerror("Save Failed", f"Changes could not be written to disk: {store.errors.get_nowait()}")
+        self.destroy()
+
+    @timed("show_trash")
+    def show_trash(self):
+        self._show_page("Trash", self._build_trash, ("trash.patients", "trash.doctors", "trash.appointments", "patients", "doctors"))
+
+    def _build_trash(self, page):
+        main_frame = ttk.Frame(page, style='Card.TFrame')
+        main_frame.pack(fill='both', expand=True, padx=30, pady=20)
+
+        ttk.Label(main_frame, text="🗑️ Trash Bin", style='Header.TLabel', font=('Arial', 22, 'bold')).grid(row=0, column=0, columnspan=3, pady=(0, 20))
+
+        # --- Patients Trash ---
+        patient_section = ttk.LabelFrame(main_frame, text="Deleted Patients")
+        patient_section.grid(row=1, column=0, sticky='nsew', padx=10, pady=10)
+        patient_trash = self._trash_list(patient_section, "patients", self.format_patient, width=35, font=('Arial', 10))
+        patient_trash.pack(padx=10, pady=10)
+        btns = ttk.Frame(patient_section)
+        btns.pack(pady=(0, 10))
+        def recover_patient():
+            record = patient_trash.selected()
+            if record is None:
+                messagebox.showerror("Error", "Select a patient to recover.")
+                return
+            confirm = messagebox.askyesno("Recover Patient", "Restore this patient to the main list?")
+            if not confirm:
+                return
+            self.hospital.recover("patients", record.id)
+            patient_trash.refresh()
+        def empty_patients():
+            if not self.hospital.trash.count("patients"):
+                messagebox.showinfo("Empty", "No deleted patients to remove.")
+                return
+            confirm = messagebox.askyesno("Empty Patient Trash", "This will permanently delete all deleted patients. Continue?")
+            if not confirm:
+                return
+            self.hospital.empty_trash("patients")
+            patient_trash.refresh()
+        ttk.Button(btns, text="Recover", command=recover_patient).pack(side='left', padx=1)
+        ttk.Button(btns, text="Empty", command=empty_patients).pack(side='left', padx=1)
+
+        # --- Doctors Trash ---
+        doctor_section = ttk.LabelFrame(main_frame, text="Deleted Doctors")
+        doctor_section.grid(row=1, column=1, sticky='nsew', padx=10, pady=10)
+        doctor_trash = self._trash_list(doctor_section, "doctors", self.format_doctor, width=45, font=('Arial', 10))
+        doctor_trash.pack(padx=10, pady=10)
+        btns = ttk.Frame(doctor_section)
+        btns.pack(pady=(0, 10))
+        def recover_doctor():
+            record = doctor_trash.selected()
+            if record is None:
+                messagebox.showerror("Error", "Select a doctor to recover.")
+                return
+            confirm = messagebox.askyesno("Recover Doctor", "Restore this doctor to the main list?")
+            if not confirm:
+                return
+            self.hospital.recover("doctors", record.id)
+            doctor_trash.refresh()
+        def empty_doctors():
+            if not self.hospital.trash.count("doctors"):
+                messagebox.showinfo("Empty", "No deleted doctors to remove.")
+                return
+            confirm = messagebox.askyesno("Empty Doctor Trash", "This will permanently delete all deleted doctors. Continue?")
+            if not confirm:
+                return
+            self.hospital.empty_trash("doctors")
+            doctor_trash.refresh()
+        ttk.Button(btns, text="Recover", command=recover_doctor).pack(side='left', padx=1)
+        ttk.Button(btns, text="Empty", command=empty_doctors).pack(side='left', padx=1)
+
+        # --- Appointments Trash ---
+        appt_section = ttk.LabelFrame(main_frame, text="Deleted Appointments")
+        appt_section.grid(row=1, column=2, sticky='nsew', padx=10, pady=10)
+        appt_trash = self._trash_list(appt_section, "appointments", self.describe_appointment, width=55, font=('Arial', 10))
+        appt_trash.pack(padx=10, pady=10)
+        btns = ttk.Frame(appt_section)
+        btns.pack(pady=(0, 10))
+        def recover_appt():
+            record = appt_trash.selected()
+            if record is None:
+                messagebox.showerror("Error", "Select an appointment to recover.")
+                return
+            confirm = messagebox.askyesno("Recover Appointment", "Restore this appointment to the main list?")
+            if not confirm:
+                return
+            if record.holds_slot and self.hospital.is_slot_booked(record.doctor_id, record.slot):
+                messagebox.showerror("Error", "That slot has been booked again since this appointment was deleted.")
+                return
+            self.hospital.recover("appointments", record.id)
+            appt_trash.refresh()
+        def empty_appts():
+            if not self.hospital.trash.count("appointments"):
+                messagebox.showinfo("Empty", "No deleted appointments to remove.")
+                return
+            confirm = messagebox.askyesno("Empty Appointment Trash", "This will permanently delete all deleted appointments. Continue?")
+            if not confirm:
+                return
+            self.hospital.empty_trash("appointments")
+            appt_trash.refresh()
+        ttk.Button(btns, text="Recover", command=recover_appt).pack(side='left', padx=1)
+        ttk.Button(btns, text="Empty", command=empty_appts).pack(side='left', padx=1)
+
+        # Make columns expand equally
+        main_frame.columnconfigure(0, weight=1)
+        main_frame.columnconfigure(1, weight=1)
+        main_frame.columnconfigure(2, weight=1)
+
+        def refresh(changed):
+            if "trash.patients" in changed:
+                patient_trash.refresh()
+            if "trash.doctors" in changed:
+                doctor_trash.refresh()
+            # Deleted appointments show the current patient and doctor names
+            if changed & {"trash.appointments", "patients", "doctors"}:
+                appt_trash.refresh()
+        return refresh
+
+if __name__ == "__main__":
+    # Optional argument: the data file, e.g. hospital.db for the SQLite backend,
+    # or --connect [port] to share a booking server (server.py) with other desks
+    args = sys.argv[1:]
+    if args[:1] == ["--connect"]:
+        port = int(args[1]) if len(args) > 1 else PORT
+        try:
+            app = HospitalApp(server=port)
+        except OSError as e:
+            sys.exit(f"No booking server on port {port} ({e}); start one with python server.py")
+    else:
+        app = HospitalApp(*args[:1])
     app.mainloop()
\ No newline at end of file
@@ -0,0 +1,171 @@
+from collections import Counter
+
+from models import ATTENDED, CANCELLED, NO_SHOW
+
+# Specialty counted for appointments whose doctor is not active and was
+# deleted before its specialty was saved with the data
+UNKNOWN_SPEC = "(removed doctor)"
+
+
+def summarize(appointments, doctors, week):
+    """What Analytics needs to know of appointments kept on disk, as JSON.
+
+    Per doctor, the number of appointments in each status and the slots
+    they hold that are the doctor's own (explicit) or start from `week`
+    (the Monday of the cutoff's week) on; per patient, the appointments
+    held. That is enough to tell which slots of the current week are free
+    without reading them in. Deleted doctors' slots aren't known here, so
+    all the slots their appointments hold are kept in case the doctor is
+    recovered.
+    """
+    explicit = {d.id: set(d.slots) for d in doctors}
+    statuses, slots, patients = {}, {}, {}
+    for a in appointments:
+        counts = statuses.setdefault(str(a.doctor_id), {})
+        counts[a.status] = counts.get(a.status, 0) + 1
+        if a.holds_slot:
+            patients[str(a.patient_id)] = patients.get(str(a.patient_id), 0) + 1
+            own = explicit.get(a.doctor_id)
+            if own is None or a.slot in own or a.slot >= week:
+                slots.setdefault(str(a.doctor_id), []).append(a.slot)
+    return {"statuses": statuses, "slots": slots, "patients": patients, "week": week}
+
+
+class Analytics:
+    """Dashboard figures, kept up to date change by change.
+
+    Hospital calls the hooks below from _index/_unindex, so nothing here
+    ever scans the lists and every figure is a lookup. Appointments still
+    on disk (see Hospital.loaded) are counted from the summary saved with
+    the snapshot until they are read in. An appointment holds its slot
+    unless cancelled; doctors are booked for appointments holding a slot,
+    and free for their own slots that none holds.
+    """
+
+    def __init__(self):
+        self.patients = 0
+        self.statuses = Counter()
+        # doctor id -> appointments holding a slot, and the same by specialty
+        self.held = Counter()
+        self.demand = Counter()
+        # patient id -> appointments holding a slot
+        self.booked_patients = Counter()
+        # doctor id -> specialty; kept once the doctor is deleted, since
+        # its appointments stay (and saved with the data, see removed_specs)
+        self.spec = {}
+        # doctor id -> appointments in any status
+        self.by_doctor = Counter()
+        # active doctor id -> its own slots, and how many of those are held
+        self.offered = {}
+        self.taken = {}
+        # doctor id -> its slots held by appointments still on disk
+        self.history_slots = {}
+
+    # --- Hooks ---
+
+    def patient(self, delta):
+        self.patients += delta
+
+    def doctor_added(self, doctor, booked):
+        """`booked` is the doctor's {slot: count} from Hospital.booked_slots."""
+        self._set_spec(doctor.id, doctor.spec)
+        history = self.history_slots.get(doctor.id, ())
+        self.offered[doctor.id] = len(doctor.slots)
+        self.taken[doctor.id] = sum(1 for s in doctor.slots if s in booked or s in history)
+
+    def doctor_removed(self, doctor):
+        self.offered.pop(doctor.id, None)
+        self.taken.pop(doctor.id, None)
+
+    def appointment(self, appt, delta):
+        self.statuses[appt.status] += delta
+        self.by_doctor[appt.doctor_id] += delta
+        if appt.holds_slot:
+            self._hold(appt.doctor_id, appt.patient_id, delta)
+
+    def slot_booked(self, doctor, slot, delta):
+        """A slot of `doctor` (None if not active) went from free to held (1) or back (-1)."""
+        if doctor is None or slot in self.history_slots.get(doctor.id, ()):
+            return
+        if slot in doctor.slots:
+            self.taken[doctor.id] += delta
+
+    def add_summary(self, summary, doctors, sign=1):
+        """Count (sign 1) or stop counting (-1) the appointments summarized on disk.
+
+        `doctors` maps id to active doctor; the summary is added before
+        they are indexed and taken back out after.
+        """
+        for doctor_id, counts in summary["statuses"].items():
+            doctor_id = int(doctor_id)
+            for status, n in counts.items():
+                self.statuses[status] += sign * n
+                self.by_doctor[doctor_id] += sign * n
+                if status != CANCELLED:
+                    self.held[doctor_id] += sign * n
+                    self.demand[self.spec.get(doctor_id, UNKNOWN_SPEC)] += sign * n
+        for patient_id, n in summary["patients"].items():
+            self.booked_patients[int(patient_id)] += sign * n
+            if not self.booked_patients[int(patient_id)]:
+                del self.booked_patients[int(patient_id)]
+        for doctor_id, slots in summary["slots"].items():
+            doctor_id = int(doctor_id)
+            slots = frozenset(slots)
+            doctor = doctors.get(doctor_id)
+            if sign > 0:
+                self.history_slots[doctor_id] = slots
+            else:
+                self.history_slots.pop(doctor_id, None)
+            if doctor is not None:
+                self.taken[doctor_id] += sign * sum(1 for s in doctor.slots if s in slots)
+
+    def add_specs(self, specs):
+        """Specialties of deleted doctors, as saved by removed_specs(); call before counting."""
+        for doctor_id, spec in specs.items():
+            self._set_spec(int(doctor_id), spec)
+
+    def removed_specs(self, doctors):
+        """{id: specialty} of the doctors not in `doctors` whose appointments remain."""
+        return {doctor_id: spec for doctor_id, spec in self.spec.items()
+                if doctor_id not in doctors and self.by_doctor[doctor_id]}
+
+    def _hold(self, doctor_id, patient_id, delta):
+        self.held[doctor_id] += delta
+        self.demand[self.spec.get(doctor_id, UNKNOWN_SPEC)] += delta
+        self.booked_patients[patient_id] += delta
+        if not self.booked_patients[patient_id]:
+            del self.booked_patients[patient_id]
+
+    def _set_spec(self, doctor_id, spec):
+        old = self.spec.get(doctor_id, UNKNOWN_SPEC)
+        self.spec[doctor_id] = spec
+        if old != spec:
+            n = self.held[doctor_id]
+            self.demand[old] -= n
+            self.demand[spec] += n
+
+    # --- Figures ---
+
+    def booked(self, doctor_id):
+        return self.held[doctor_id]
+
+    def free(self, doctor_id):
+        """The doctor's own slots no appointment holds."""
+        return self.offered.get(doctor_id, 0) - self.taken.get(doctor_id, 0)
+
+    def specialties(self, limit=None):
+        """(specialty, appointments) pairs, busiest first."""
+        return [(spec, n) for spec, n in self.demand.most_common(limit) if n > 0]
+
+    def appointments(self):
+        return sum(self.statuses.values())
+
+    def cancel_rate(self):
+        """Share of all appointments that were cancelled, or None without any."""
+        total = self.appointments()
+        return self.statuses[CANCELLED] / total if total else None
+
+    def no_show_rate(self):
+        """Share of attended-or-missed appointments that were missed, or None before any."""
+        seen = self.statuses[ATTENDED] + self.statuses[NO_SHOW]
+        return self.statuses[NO_SHOW] / seen if seen else None
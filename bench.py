@@ -0,0 +1,337 @@
+"""Synthetic data generator and benchmarks for the data layer and views.
+
+    python bench.py --size medium --backend both --out results.json
+
+Results are written as JSON (timings in seconds) so runs can be diffed.
+Tk view benchmarks run when a display is available and are reported as
+skipped otherwise.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import replace
+from datetime import datetime, timedelta
+
+from export import ExportJob, schedule_rows
+from hospital import Hospital, waitlist_record
+from models import CANCELLED, URGENCIES, Appointment, Doctor, Patient, decode_all, rows, to_dict
+from slots import WEEK, Availability, format_slot, week_of
+from storage import JournalStore, SqliteStorage, change
+from trash import Trash, add_ops
+
+SIZES = {
+    "small": (1000, 10),
+    "medium": (50000, 200),
+    "large": (250000, 1000),
+    "huge": (1000000, 5000),
+}
+SPECIALTIES = ["Cardiology", "Dermatology", "General Practice", "Neurology", "Obstetrics",
+               "Oncology", "Ophthalmology", "Orthopaedics", "Paediatrics", "Psychiatry"]
+FIRST_NAMES = ["Abena", "Akosua", "Ama", "Daniel", "Esi", "Grace", "John", "Kofi", "Kwame",
+               "Mary", "Michael", "Peter", "Sarah", "Yaw", "Yaa"]
+LAST_NAMES = ["Agyekum", "Asante", "Boateng", "Darko", "Mensah", "Osei", "Owusu", "Smith", "Tetteh"]
+# Patients put on the waitlist by bench_data
+WAITLIST = 5000
+
+
+def generate(patients=1000, doctors=10, slots_per_doctor=20, booked=0.6, trashed=0.01, seed=0,
+             start=None, weekly=False):
+    """Build a reproducible hospital state dict of records.
+
+    Slots cover the two weeks from `start`, by default 08:00 next Monday,
+    so they are upcoming appointments that startup reads rather than past
+    ones left on disk. With `weekly`, doctors get weekly hours instead of
+    slot lists and appointments are booked from the first two weeks of them.
+    """
+    rnd = random.Random(seed)
+    start = start or next_monday()
+    state = {"patients": [], "doctors": [], "appointments": [],
+             "trash": {"patients": [], "doctors": [], "appointments": []}}
+    for i in range(1, patients + 1):
+        record = Patient(i, f"{rnd.choice(FIRST_NAMES)} {rnd.choice(LAST_NAMES)} {i}", rnd.randint(0, 95))
+        (state["trash"]["patients"] if rnd.random() < trashed else state["patients"]).append(record)
+    appt_id = 1
+    for i in range(1, doctors + 1):
+        # Half-hour slots spread over the working days of two weeks
+        times = sorted(rnd.sample(range(14 * 16), min(slots_per_doctor, 14 * 16)))
+        starts = [start + timedelta(days=t // 16, minutes=30 * (t % 16)) for t in times]
+        slots = [format_slot(s, s + timedelta(minutes=30)) for s in starts]
+        doctor = Doctor(i, f"{rnd.choice(FIRST_NAMES)} {rnd.choice(LAST_NAMES)}", rnd.choice(SPECIALTIES), slots)
+        if weekly:
+            hours = rnd.choice(["Mon-Fri 08:00-16:00/30", "Mon-Thu 09:00-13:00/20", "Tue-Sat 10:00-18:00/30"])
+            doctor = Doctor(doctor.id, doctor.name, doctor.spec, weekly=[hours])
+            week = week_of(start)
+            slots = [e[2] for e in Availability().between(doctor, week, week + 2 * WEEK)]
+        state["doctors"].append(doctor)
+        for slot in slots:
+            if state["patients"] and rnd.random() < booked:
+                patient = rnd.choice(state["patients"])
+                appt = Appointment(appt_id, patient.id, i, slot)
+                appt_id += 1
+                (state["trash"]["appointments"] if rnd.random() < trashed else state["appointments"]).append(appt)
+    state["next_ids"] = {"patients": patients + 1, "doctors": doctors + 1, "appointments": appt_id}
+    return state
+
+
+def next_monday():
+    """08:00 on the Monday after this week, where generate() starts by default."""
+    return week_of(datetime.now()) + WEEK + timedelta(hours=8)
+
+
+def _stats(samples, ops=1):
+    per_op = [s / ops for s in samples]
+    return {
+        "runs": len(samples),
+        "ops_per_run": ops,
+        "min": min(per_op),
+        "median": statistics.median(per_op),
+        "mean": statistics.fmean(per_op),
+        "max": max(per_op),
+    }
+
+
+def timed(fn, repeat=5, ops=1):
+    samples = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t)
+    return _stats(samples, ops)
+
+
+def _open(backend, workdir):
+    if backend == "sqlite":
+        return SqliteStorage(os.path.join(workdir, "hospital.db"))
+    return JournalStore(os.path.join(workdir, "hospital_data.json"))
+
+
+def bench_data(state, backend, repeat=5, queries=10000, seed=0, start=None):
+    """Startup, persistence, booking and availability timings for one backend.
+
+    `start` is what the state was generated with.
+    """
+    rnd = random.Random(seed)
+    week = week_of(start or next_monday())
+    results = {}
+    workdir = tempfile.mkdtemp(prefix="habs-bench-")
+    try:
+        store = _open(backend, workdir)
+        store.compact(state)
+        store.compact_trash(add_ops(state["trash"]))
+        store.close()
+        results["data_file_bytes"] = sum(os.path.getsize(os.path.join(workdir, f)) for f in os.listdir(workdir))
+
+        hospitals = []
+
+        def load():
+            h = Hospital(_open(backend, workdir))
+            h.load()
+            hospitals.append(h)
+        results["load_data"] = timed(load, repeat)
+        for h in hospitals[:-1]:
+            h.store.close()
+        hospital = hospitals[-1]
+
+        n = 50
+        results["save_data.append"] = timed(
+            lambda: [hospital.add("patients", Patient(None, "Bench Patient", 40)) for _ in range(n)], repeat, n)
+        results["save_data.compact"] = timed(lambda: hospital.save(), max(1, repeat // 2))
+
+        doctors = hospital.doctors
+        if doctors:
+            picks = [rnd.choice(doctors) for _ in range(queries)]
+            probes = [(d.id, rnd.choice(slots)) for d in picks
+                      for slots in [d.slots or hospital.available_slots(d, week)] if slots]
+            if probes:
+                results["book.conflict_check"] = timed(
+                    lambda: [hospital.is_slot_booked(did, slot) for did, slot in probes], repeat, len(probes))
+            results["update_slots"] = timed(
+                lambda: [hospital.available_slots(d, week) for d in picks], repeat, len(picks))
+
+            def book():
+                for d in picks[:n]:
+                    free = hospital.available_slots(d, week)
+                    if free:
+                        hospital.add("appointments", Appointment(None, hospital.patients[0].id, d.id, free[0]))
+            results["book"] = timed(book, 1, n)
+
+            # Half wait for one doctor, half for any doctor of a specialty;
+            # each cancellation is then matched against all of them
+            waiting = [waitlist_record(p, d if i % 2 else None, d.spec, i % len(URGENCIES),
+                                       week - timedelta(days=5) + timedelta(seconds=i))
+                       for i, (p, d) in enumerate(zip(hospital.patients[:WAITLIST], picks))]
+            hospital.commit(*[change("append", "waitlist", value=replace(w, id=hospital.next_ids["waitlist"] + i))
+                              for i, w in enumerate(waiting)])
+            held = [i for i, a in enumerate(hospital.appointments) if a.holds_slot][-n:]
+
+            def cancel_and_offer():
+                for i in held:
+                    hospital.set_status(i, CANCELLED)
+                    hospital.take_offers(now=week)
+            results["waitlist.cancel_and_offer"] = timed(cancel_and_offer, 1, len(held))
+
+            specs = [d.spec for d in picks]
+            horizon = [week + timedelta(minutes=rnd.randrange(14 * 24 * 60)) for _ in picks]
+            results["earliest_free"] = timed(
+                lambda: [hospital.earliest_free(spec, t) for spec, t in zip(specs, horizon)], repeat, len(picks))
+            results["free_slots.day"] = timed(
+                lambda: [hospital.free_slots(t, t + timedelta(days=1), spec, 50) for spec, t in zip(specs[:1000], horizon)],
+                repeat, min(1000, len(picks)))
+
+        # Read in on first use, then one page of it
+        results["trash.first_page"] = timed(
+            lambda: Trash(hospital.store).page("patients", 0, 50), repeat)
+
+        results["search.build"] = timed(hospital.build_search_indexes, 1)
+        prefixes = [p.name[:rnd.randint(1, 6)] for p in rnd.sample(hospital.patients, min(len(hospital.patients), 1000))]
+        if prefixes:
+            results["search.patients"] = timed(lambda: [hospital.search("patients", q, 10) for q in prefixes], repeat, len(prefixes))
+
+        for fmt in ("letters", "csv", "json"):
+            path = os.path.join(workdir, "export" + {"letters": ".txt", "csv": ".csv", "json": ".json"}[fmt])
+
+            def export():
+                appointments = list(hospital.appointments)
+                job = ExportJob(schedule_rows(hospital, appointments), len(appointments), path, fmt)
+                job.run()
+                if job.error is not None:
+                    raise job.error
+            results["export." + fmt] = timed(export, max(1, repeat // 2))
+        hospital.store.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def _allocated(build):
+    # Bytes still allocated by what build() returns
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        kept = build()
+        size = tracemalloc.get_traced_memory()[0] - before
+        del kept
+        return size
+    finally:
+        tracemalloc.stop()
+
+
+def bench_memory(state):
+    """Bytes per loaded record, as plain dicts (the old format) and as models."""
+    results = {}
+    for kind in ("patients", "doctors", "appointments"):
+        records = state[kind]
+        if not records:
+            continue
+        as_dicts = json.dumps([to_dict(r) for r in records])
+        as_rows = json.dumps(rows(records))
+        results[kind] = {
+            "dict": _allocated(lambda: json.loads(as_dicts)) / len(records),
+            "model": _allocated(lambda: decode_all(kind, json.loads(as_rows))) / len(records),
+        }
+    return results
+
+
+def bench_views(state, repeat=5):
+    """Windowed list rendering; needs a display, so it may be skipped."""
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+    except Exception as e:
+        return {"skipped": f"no Tk display available ({e})"}
+    from widgets import SearchBox, VirtualList
+    workdir = tempfile.mkdtemp(prefix="habs-bench-")
+    try:
+        root.withdraw()
+        store = JournalStore(os.path.join(workdir, "hospital_data.json"))
+        store.compact(state)
+        store.compact_trash(add_ops(state["trash"]))
+        hospital = Hospital(store)
+        hospital.load()
+        patients = hospital.patients
+        fmt = lambda p: f"{p.name} (Age: {p.age})"
+        results = {}
+        view = VirtualList(root, patients, fmt, width=50)
+        results["update_list.build"] = timed(lambda: VirtualList(root, patients, fmt, width=50).destroy(), repeat)
+        results["update_list.refresh"] = timed(view.refresh, repeat)
+
+        def scroll():
+            for _ in range(100):
+                view.scroll(view.height)
+        results["update_list.scroll_page"] = timed(scroll, repeat, 100)
+        results["update_list.row_updated"] = timed(lambda: view.row_updated(view.top), repeat)
+        box = SearchBox(root, lambda q, limit: hospital.search("patients", q, limit), fmt)
+        results["search_box.keystroke"] = timed(lambda: box.var.set(patients[0].name[:3] if patients else "a"), repeat)
+        return results
+    finally:
+        root.destroy()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run(patients, doctors, slots_per_doctor=20, backends=("json",), repeat=5, seed=0, views=True, weekly=False):
+    start = next_monday()
+    t = time.perf_counter()
+    state = generate(patients, doctors, slots_per_doctor, seed=seed, start=start, weekly=weekly)
+    generate_seconds = time.perf_counter() - t
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "seed": seed,
+            "repeat": repeat,
+            "start": start.isoformat(timespec="minutes"),
+        },
+        "dataset": {
+            "patients": len(state["patients"]),
+            "doctors": len(state["doctors"]),
+            "slots": sum(len(d.slots) for d in state["doctors"]),
+            "weekly": weekly,
+            "appointments": len(state["appointments"]),
+            "trash": {kind: len(records) for kind, records in state["trash"].items()},
+            "generate_seconds": generate_seconds,
+        },
+        "backends": {backend: bench_data(state, backend, repeat, seed=seed, start=start) for backend in backends},
+        "memory_bytes_per_record": bench_memory(state),
+    }
+    if views:
+        report["views"] = bench_views(state, repeat)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the hospital data layer and views.")
+    parser.add_argument("--size", choices=SIZES, default="small", help="preset patient/doctor counts")
+    parser.add_argument("--patients", type=int, help="override the preset patient count")
+    parser.add_argument("--doctors", type=int, help="override the preset doctor count")
+    parser.add_argument("--slots", type=int, default=20, help="slots per doctor")
+    parser.add_argument("--weekly", action="store_true", help="give doctors weekly hours instead of slot lists")
+    parser.add_argument("--backend", choices=("json", "sqlite", "both"), default="json")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-views", action="store_true", help="skip the Tk view benchmarks")
+    parser.add_argument("--out", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+    patients, doctors = SIZES[args.size]
+    backends = ("json", "sqlite") if args.backend == "both" else (args.backend,)
+    report = run(args.patients or patients, args.doctors or doctors, args.slots, backends,
+                 args.repeat, args.seed, not args.no_views, args.weekly)
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
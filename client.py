@@ -0,0 +1,223 @@
+import json
+import queue
+import socket
+import threading
+
+from hospital import BULK_CHANGES, Conflict, Hospital
+from models import decode, encode
+from server import HOST, PORT
+from storage import Storage, empty_state
+from trash import Trash
+
+TIMEOUT = 10
+
+
+class RemoteStore(Storage):
+    """A connection to a booking server (server.py), standing in for a store.
+
+    request() sends one request and waits for its reply. Changes the
+    server sends out are queued in `events` for RemoteHospital to apply
+    on the UI thread; a lost connection is reported through `errors`,
+    like a failed save of the local stores.
+    """
+
+    def __init__(self, port=PORT, host=HOST, timeout=TIMEOUT):
+        self.timeout = timeout
+        self.sock = socket.create_connection((host, port), timeout)
+        self.sock.settimeout(None)
+        self.errors = queue.Queue()
+        self.events = queue.Queue()
+        # The last server change applied here
+        self.seq = 0
+        self.closed = False
+        self._replies = {}
+        self._next_id = 0
+        self._cond = threading.Condition()
+        self._send_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._read, name="server-reader", daemon=True)
+        self._thread.start()
+
+    def _read(self):
+        try:
+            with self.sock.makefile("rb") as f:
+                for line in f:
+                    message = json.loads(line)
+                    if "id" not in message:
+                        self.events.put(message)
+                        continue
+                    with self._cond:
+                        self._replies[message["id"]] = message
+                        self._cond.notify_all()
+        except (OSError, ValueError):
+            pass
+        with self._cond:
+            lost = not self.closed
+            self.closed = True
+            self._cond.notify_all()
+        if lost:
+            self.errors.put(ConnectionError("Lost the connection to the booking server."))
+
+    def request(self, op, **args):
+        with self._cond:
+            self._next_id += 1
+            request_id = self._next_id
+        line = json.dumps(dict(args, id=request_id, op=op), separators=(",", ":"), default=encode)
+        try:
+            with self._send_lock:
+                self.sock.sendall(line.encode("utf-8") + b"\n")
+        except OSError as e:
+            raise ConnectionError(f"Lost the connection to the booking server: {e}") from e
+        with self._cond:
+            self._cond.wait_for(lambda: request_id in self._replies or self.closed, self.timeout)
+            reply = self._replies.pop(request_id, None)
+            closed = self.closed
+        if reply is None:
+            raise ConnectionError("Lost the connection to the booking server." if closed
+                                  else "The booking server did not answer.")
+        if reply.get("conflict"):
+            error = Conflict(reply["error"])
+            error.seq = reply["seq"]
+            raise error
+        if "error" in reply:
+            raise ValueError(reply["error"])
+        return reply["result"]
+
+    def next_event(self):
+        try:
+            return self.events.get(timeout=self.timeout)
+        except queue.Empty:
+            raise ConnectionError("The booking server did not send the change.") from None
+
+    def load(self):
+        result = self.request("load")
+        self.seq = result["seq"]
+        state = empty_state()
+        state.update(result["state"])
+        return state
+
+    def load_trash(self):
+        return self.request("trash")["ops"]
+
+    def compact(self, state):
+        # The server saves
+        pass
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        self._thread.join()
+
+
+class RemoteHospital(Hospital):
+    """A Hospital kept in step with a booking server shared by several desks.
+
+    Changes are sent to the server rather than saved. The lists only
+    change by applying the server's changes, in the server's order, so
+    every desk ends up with the same lists at the same positions. Own
+    changes are applied as soon as the server has accepted them; other
+    desks' are applied by poll(), which calls `on_change(change)` after
+    each one so views can update just that row. Changes the server
+    refuses raise Conflict.
+    """
+
+    def __init__(self, store):
+        super().__init__(store)
+        self.on_change = None
+
+    def _reset(self):
+        super()._reset()
+        # Only ever filled from the server, which drops stale entries itself
+        self.trash = Trash(self.store)
+
+    def save(self, *changes):
+        pass
+
+    def _apply_event(self, event, notify):
+        changes = [dict(c, value=decode(c["kind"], c["value"])) if "value" in c else c for c in event["changes"]]
+        if notify and len(changes) <= BULK_CHANGES:
+            for c in changes:
+                self.apply(c)
+                if self.on_change is not None:
+                    self.on_change(c)
+        elif changes:
+            self.apply(*changes)
+            if notify and self.on_change is not None:
+                # Reported afterwards, so only what moves rows: the
+                # lists are re-rendered once the page refreshes anyway
+                for c in changes:
+                    if c["op"] != "replace":
+                        self.on_change(c)
+        if notify:
+            # Slots another desk freed are offered to the waitlist there
+            self.released.clear()
+        self.trash.replay(event["trash"])
+        for kind in {op["kind"] for op in event["trash"] if "kind" in op}:
+            self.versions["trash." + kind] += 1
+        self.store.seq = event["seq"]
+        return changes
+
+    def poll(self):
+        """Apply the changes other desks made since the last call; True if there were any."""
+        applied = False
+        while True:
+            try:
+                event = self.store.events.get_nowait()
+            except queue.Empty:
+                return applied
+            if event["seq"] > self.store.seq:
+                self._apply_event(event, notify=True)
+                applied = True
+
+    def _sync(self, seq, own=None):
+        # Apply the server's changes up to `seq`; returns those of change `own`
+        changes = []
+        while self.store.seq < seq:
+            event = self.store.next_event()
+            if event["seq"] > self.store.seq:
+                applied = self._apply_event(event, notify=event["seq"] != own)
+                if event["seq"] == own:
+                    changes = applied
+        return changes
+
+    def _request(self, op, **args):
+        # Other desks' changes made before this one are applied first
+        try:
+            result = self.store.request(op, **args)
+        except Conflict as e:
+            # Catch up, so the desk shows what got in first
+            self._sync(e.seq)
+            raise
+        return result, self._sync(result["seq"], own=result["seq"] if result["changed"] else None)
+
+    def commit(self, *changes):
+        # Each change carries the record it replaces, for the server to compare
+        sent = [dict(c, id=c["value"].id, expect=self.ids[c["kind"]][c["value"].id]) if c["op"] == "replace"
+                else dict(c, expect=self.ids[c["kind"]][c["id"]]) if c["op"] == "remove" else c
+                for c in changes]
+        return self._request("commit", changes=sent)[1]
+
+    def delete(self, kind, index):
+        record = getattr(self, kind)[index]
+        self._request("delete", kind=kind, record_id=record.id, expect=record)
+
+    def recover(self, kind, record_id):
+        self._request("recover", kind=kind, record_id=record_id)
+        return self.ids[kind][record_id]
+
+    def empty_trash(self, kind):
+        self._request("empty_trash", kind=kind)
+
+    def set_trash_policy(self, max_age_days, max_count):
+        if max_age_days < 0 or max_count < 0:
+            raise ValueError("Retention limits can't be negative.")
+        self._request("policy", max_age_days=max_age_days, max_count=max_count)
+
+    def purge_trash(self, now=None):
+        # The server purges on its own timer too
+        result, _ = self._request("purge")
+        return result["purged"]
@@ -0,0 +1,199 @@
+import cProfile
+import csv
+import io
+import json
+import math
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# Actions timed by the app, in the order the Settings page lists them
+ACTIONS = ("load_data", "save_data", "show_dashboard", "show_patients", "show_doctors", "show_appointments",
+           "show_schedules", "show_waitlist", "show_settings", "show_trash", "update_list", "update_slots", "book",
+           "export")
+PERCENTILES = (50, 90, 99)
+
+# Latencies are counted in buckets 2**(1/4) apart from 1 µs up, so a
+# percentile is off by at most ~19% and a histogram is a fixed 128 ints
+BUCKETS_PER_DOUBLING = 4
+SMALLEST = 1e-6
+BUCKETS = 128
+
+
+class Histogram:
+    """Count, total, max and log-bucketed counts of one action's latencies."""
+
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * BUCKETS
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        index = int(math.log2(seconds / SMALLEST) * BUCKETS_PER_DOUBLING) if seconds > SMALLEST else 0
+        self.buckets[min(index, BUCKETS - 1)] += 1
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the p-th percentile, in seconds."""
+        if not self.count:
+            return 0.0
+        rank = math.ceil(self.count * p / 100)
+        seen = 0
+        for index, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                return min(self.max, SMALLEST * 2 ** ((index + 1) / BUCKETS_PER_DOUBLING))
+        return self.max
+
+
+class Stats:
+    """Opt-in timings of the app's actions and counts of bytes written.
+
+    Nothing is recorded until `enabled` is set, and a call through
+    timed() then costs one attribute check. Timings may come from the background
+    writer and export threads, so updates take a lock. profile(name)
+    additionally runs every call of that action under cProfile until
+    profile(None); save_profile() writes what was captured.
+    """
+
+    def __init__(self):
+        # HABS_STATS=1 records from startup, so load_data is timed too
+        self.enabled = bool(os.environ.get("HABS_STATS"))
+        self.lock = threading.Lock()
+        self.timings = {}
+        self.bytes = {}
+        self.since = time.time()
+        self.profile_action = None
+        self.profiler = None
+        self._profiling = False
+
+    def reset(self):
+        with self.lock:
+            self.timings = {}
+            self.bytes = {}
+            self.since = time.time()
+
+    def record(self, name, seconds):
+        with self.lock:
+            histogram = self.timings.get(name)
+            if histogram is None:
+                histogram = self.timings[name] = Histogram()
+            histogram.add(seconds)
+
+    def add_bytes(self, name, n):
+        if self.enabled:
+            with self.lock:
+                self.bytes[name] = self.bytes.get(name, 0) + n
+
+    def written(self):
+        """{name: bytes written} since the last reset."""
+        with self.lock:
+            return dict(self.bytes)
+
+    @contextmanager
+    def measure(self, name):
+        if not self.enabled:
+            yield
+            return
+        profiler = None
+        if name == self.profile_action:
+            with self.lock:
+                # cProfile can't be enabled twice at once
+                if not self._profiling:
+                    self._profiling = True
+                    profiler = self.profiler
+        start = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                self._profiling = False
+            self.record(name, time.perf_counter() - start)
+
+    def profile(self, name):
+        """Capture calls of action `name` with cProfile from now on; None stops."""
+        self.profile_action = name
+        if name is not None:
+            self.profiler = cProfile.Profile()
+
+    def profile_report(self, limit=40):
+        if self.profiler is None:
+            return ""
+        out = io.StringIO()
+        try:
+            pstats.Stats(self.profiler, stream=out).sort_stats("cumulative").print_stats(limit)
+        except TypeError:
+            # Nothing captured yet
+            return ""
+        return out.getvalue()
+
+    def save_profile(self, path):
+        """Write the captured profile: loadable pstats data for .prof, a text report otherwise."""
+        if self.profiler is None:
+            raise ValueError("No profile has been captured.")
+        if path.endswith(".prof"):
+            self.profiler.dump_stats(path)
+            return
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.profile_report(limit=None))
+
+    def summary(self):
+        """One dict per action timed so far, latencies in milliseconds."""
+        with self.lock:
+            items = sorted(self.timings.items(),
+                           key=lambda item: ACTIONS.index(item[0]) if item[0] in ACTIONS else len(ACTIONS))
+            rows = []
+            for name, h in items:
+                row = {"action": name, "count": h.count, "total_ms": h.total * 1000,
+                       "mean_ms": h.total / h.count * 1000}
+                for p in PERCENTILES:
+                    row[f"p{p}_ms"] = h.percentile(p) * 1000
+                row["max_ms"] = h.max * 1000
+                rows.append(row)
+            return rows
+
+    def export(self, path):
+        """Write summary() and the byte counts as JSON, or as CSV for a .csv path."""
+        rows = self.summary()
+        written = self.written()
+        if path.lower().endswith(".csv"):
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                fields = ["action", "count", "total_ms", "mean_ms"] + [f"p{p}_ms" for p in PERCENTILES] + ["max_ms"]
+                writer = csv.DictWriter(f, fields)
+                writer.writeheader()
+                writer.writerows({k: round(v, 3) if isinstance(v, float) else v for k, v in row.items()}
+                                 for row in rows)
+                f.write("\n")
+                writer = csv.writer(f)
+                writer.writerow(["written", "bytes"])
+                writer.writerows(sorted(written.items()))
+        else:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"since": self.since, "timings": rows, "bytes_written": written}, f, indent=2)
+
+
+STATS = Stats()
+
+
+def timed(name):
+    """Decorator recording each call's latency as action `name` in STATS."""
+    def decorate(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not STATS.enabled:
+                return function(*args, **kwargs)
+            with STATS.measure(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
@@ -0,0 +1,200 @@
+import csv
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from diagnostics import STATS, timed
+
+FORMATS = {"letters": ".txt", "csv": ".csv", "json": ".json"}
+FIELDS = ("appointment_id", "patient", "age", "doctor", "spec", "slot", "status")
+
+# Shard files kept open at once; older ones are closed and reopened on demand
+MAX_OPEN_FILES = 64
+
+_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
+def schedule_rows(hospital, appointments):
+    """One flat row per appointment, as a generator for ExportJob.
+
+    Patients and doctors (the trash included) are looked up now, on the
+    calling thread, so the worker that runs the generator only builds rows
+    and never reads the hospital while the UI changes it.
+    """
+    return _rows([(a, hospital.patient_of(a), hospital.doctor_of(a)) for a in appointments])
+
+
+def _rows(resolved):
+    for a, patient, doctor in resolved:
+        yield {
+            "appointment_id": a.id,
+            "patient": patient.name,
+            "age": patient.age,
+            "doctor": doctor.name,
+            "spec": doctor.spec,
+            "slot": a.slot,
+            "status": a.status,
+        }
+
+
+def letter(row):
+    return (
+        f"Dear {row['patient']},\n"
+        f"You have an appointment with Dr. {row['doctor']} ({row['spec']}) at {row['slot']}.\n"
+        "Please arrive 10 minutes early and bring any necessary documents.\n"
+        "Thank you for choosing Daniel's Hospital.\n"
+        "---------------------------------------------\n\n"
+    )
+
+
+def slot_date(row):
+    match = _DATE.search(row['slot'])
+    return match.group(0) if match else "undated"
+
+
+SHARDS = {
+    "none": None,
+    "doctor": lambda row: f"{row['doctor']} ({row['spec']})",
+    "date": slot_date,
+}
+
+
+class _Letters:
+    newline = None
+
+    def begin(self, f):
+        pass
+
+    def write(self, f, row, first):
+        f.write(letter(row))
+
+    def end(self, f):
+        pass
+
+
+class _Csv:
+    newline = ""
+
+    def begin(self, f):
+        csv.writer(f).writerow(FIELDS)
+
+    def write(self, f, row, first):
+        csv.writer(f).writerow([row[k] for k in FIELDS])
+
+    def end(self, f):
+        pass
+
+
+class _Json:
+    # A JSON array written one element at a time
+    newline = None
+
+    def begin(self, f):
+        f.write("[\n")
+
+    def write(self, f, row, first):
+        if not first:
+            f.write(",\n")
+        f.write(json.dumps(row))
+
+    def end(self, f):
+        f.write("\n]\n")
+
+
+_WRITERS = {"letters": _Letters, "csv": _Csv, "json": _Json}
+
+
+def shard_path(path, key):
+    base, ext = os.path.splitext(path)
+    safe = re.sub(r"[^\w.-]+", "_", key).strip("_") or "unnamed"
+    return f"{base}_{safe}{ext}"
+
+
+class ExportJob:
+    """Writes rows from a generator to one file, or one file per shard.
+
+    Runs on its own thread when start()ed. `done`/`total` report progress,
+    cancel() stops it at the next row. Output goes to temp files that are
+    renamed into place only when every row was written, so a cancelled or
+    failed export leaves no partial files behind.
+    """
+
+    def __init__(self, rows, total, path, fmt="letters", shard="none"):
+        self.rows = rows
+        self.total = total
+        self.path = path
+        self.writer = _WRITERS[fmt]()
+        self.shard_key = SHARDS[shard]
+        self.done = 0
+        self.files = []
+        self.error = None
+        self.cancelled = False
+        self.finished = False
+        self._cancel = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="schedule-export", daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def join(self):
+        if self._thread is not None:
+            self._thread.join()
+
+    @timed("export")
+    def run(self):
+        self._open = OrderedDict()  # final path -> open temp file, most recent last
+        self._seen = {}             # final path -> rows written so far
+        try:
+            for row in self.rows:
+                if self._cancel.is_set():
+                    self.cancelled = True
+                    break
+                target = self.path if self.shard_key is None else shard_path(self.path, self.shard_key(row))
+                f = self._file(target)
+                self.writer.write(f, row, self._seen[target] == 0)
+                self._seen[target] += 1
+                self.done += 1
+            if not self.cancelled:
+                if not self._seen:
+                    # Nothing to export still produces an (empty) file
+                    self._file(self.path)
+                for target in self._seen:
+                    self.writer.end(self._file(target))
+        except Exception as e:
+            self.error = e
+        finally:
+            for f in self._open.values():
+                f.close()
+            if self.cancelled or self.error is not None:
+                for target in self._seen:
+                    if os.path.exists(target + ".tmp"):
+                        os.remove(target + ".tmp")
+            else:
+                for target in self._seen:
+                    os.replace(target + ".tmp", target)
+                self.files = list(self._seen)
+                STATS.add_bytes("export", sum(map(os.path.getsize, self.files)))
+            self.finished = True
+
+    def _file(self, target):
+        f = self._open.get(target)
+        if f is not None:
+            self._open.move_to_end(target)
+            return f
+        if len(self._open) >= MAX_OPEN_FILES:
+            _, oldest = self._open.popitem(last=False)
+            oldest.close()
+        if target in self._seen:
+            f = open(target + ".tmp", "a", newline=self.writer.newline)
+        else:
+            f = open(target + ".tmp", "w", newline=self.writer.newline)
+            self._seen[target] = 0
+            self.writer.begin(f)
+        self._open[target] = f
+        return f
@@ -0,0 +1,617 @@
+from dataclasses import replace
+from datetime import datetime
+
+from analytics import Analytics
+from models import STATUSES, URGENCIES, Appointment, Doctor, Patient, WaitlistEntry, decode, decode_all
+from search import PrefixIndex
+from slots import WEEK, Availability, SlotIndex, canonical_slot, normalize_slots, normalize_template, week_of
+from storage import Section, apply_change, change
+from trash import Trash
+from waitlist import WaitlistIndex
+
+KINDS = ("patients", "doctors", "appointments")
+# Every list a Hospital keeps; waitlist entries are neither trashed nor imported
+LISTS = KINDS + ("waitlist",)
+
+# Fields of active records kept in the prefix search index
+SEARCH_FIELDS = {"patients": ("name",), "doctors": ("name", "spec")}
+
+# Commits with more changes than this (bulk imports) rebuild the slot index
+# once, and the search indexes at the next search, instead of updating them
+# change by change
+BULK_CHANGES = 1000
+
+# Shown in place of a patient or doctor whose trash entry has been emptied
+MISSING_PATIENT = Patient(None, "(removed patient)", "?")
+MISSING_DOCTOR = Doctor(None, "(removed doctor)", "?")
+
+
+class Conflict(ValueError):
+    """A change refused because the records it was made against have changed since.
+
+    Raised when another desk sharing the booking server (server.py) got there first.
+    """
+
+
+class Hospital:
+    """Patients, doctors and appointments plus the indexes kept over them.
+
+    Every record carries a stable integer id; appointments refer to their
+    patient and doctor by id. All mutations go through commit() so the
+    indexes and the journal stay in step with the lists. Deleted records
+    move to `trash`, which the store keeps separately (see trash.py).
+
+    Slots freed by a change are noted in `released`; take_offers() matches
+    them with the waitlist.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.on_loaded = None
+        self._reset()
+
+    def _reset(self):
+        self.patients = []
+        self.doctors = []
+        self.appointments = []
+        self.waitlist = []
+        self.trash = Trash(self.store, lambda kind, record_id: record_id in self.ids[kind])
+        self.next_ids = {kind: 1 for kind in LISTS}
+        # id -> record for every list
+        self.ids = {kind: {} for kind in LISTS}
+        # doctor id -> {slot: number of appointments holding it}
+        self.booked_slots = {}
+        self.search_index = {kind: PrefixIndex() for kind in SEARCH_FIELDS}
+        # Search indexes left to be built by the first search
+        self.search_stale = set(SEARCH_FIELDS)
+        # Weekly templates expanded on demand, and free timed slots of
+        # active doctors by start time
+        self.availability = Availability()
+        self.slot_index = SlotIndex(self.availability)
+        # Waiting patients by doctor and specialty, and the (doctor id,
+        # slot) pairs freed since take_offers() last looked
+        self.waitlist_index = WaitlistIndex()
+        self.released = set()
+        # (entry id, doctor id, slot) of offers turned down, never made again
+        self.declined = set()
+        # Dashboard figures, and what the snapshot says of past appointments
+        # not read in yet
+        self.analytics = Analytics()
+        self.history_summary = None
+        # Bumped on every change to a list or the trash ("trash.doctors"),
+        # so views can tell what is stale
+        self.versions = {name: 0 for kind in KINDS for name in (kind, "trash." + kind)}
+        self.versions["waitlist"] = 0
+        # Appointments whose slot starts before `history_before`, while they
+        # are still on disk; see loaded()
+        self.history = None
+        self.history_before = None
+
+    def loaded(self, name):
+        """The list `name`, first reading in whatever part of it is still on disk.
+
+        That is, for "appointments", those whose slot started before the
+        snapshot's `history_before`. They go at the end, so positions already
+        handed out stay valid; `on_loaded(name)` is then called, if set, so
+        views can show them.
+        """
+        records = getattr(self, name)
+        if name == "appointments" and self.history is not None:
+            past = decode_all("appointments", self.history.read())
+            self.history = None
+            if self.history_summary is not None:
+                # They are counted one by one from here on
+                self.analytics.add_summary(self.history_summary, self.ids["doctors"], -1)
+                self.history_summary = None
+            for record in past:
+                self._index(name, record)
+            records.extend(past)
+            self.versions[name] += 1
+            if self.on_loaded is not None:
+                self.on_loaded(name)
+        return records
+
+    def _history_needed(self, slot):
+        # Bookings of slots before the cutoff are only known once read in;
+        # `slot` may also be a datetime
+        if self.history is not None:
+            if isinstance(slot, datetime):
+                slot = slot.strftime("%Y-%m-%d %H:%M")
+            if slot < self.history_before:
+                self.loaded("appointments")
+
+    def _history_needed_before(self, start):
+        # Template slots from the summary's week on are covered by it;
+        # earlier weeks (and summaries from before it said) need reading in
+        if self.history is not None:
+            week = self.history_summary.get("week") if self.history_summary else None
+            if week is None or start.strftime("%Y-%m-%d %H:%M") < week:
+                self._history_needed(start)
+
+    def state(self):
+        return {
+            "patients": self.patients,
+            "doctors": self.doctors,
+            "appointments": self.appointments,
+            "waitlist": self.waitlist,
+            "history": self.history,
+            "next_ids": self.next_ids,
+            "doctor_specs": self.analytics.removed_specs(self.ids["doctors"])
+        }
+
+    def load(self):
+        data = self.store.load()
+        self._reset()
+        # Rows (or older dict records) become models here. Sectioned
+        # snapshots hold only migrated records; for older files, appointments
+        # that embed their patient and doctor are resolved by _migrate
+        sectioned = "history_before" in data
+        self.history = data.get("history")
+        self.history_before = data.get("history_before")
+        for kind in LISTS:
+            records = data[kind]
+            if sectioned or kind != "appointments":
+                records = decode_all(kind, records)
+            setattr(self, kind, records)
+        # Deleted doctors' appointments count under their specialty
+        self.analytics.add_specs(data.get("doctor_specs", {}))
+        summarized = True
+        if self.history is not None:
+            self.history_summary = data.get("history_summary")
+            if self.history_summary is None:
+                # Snapshots from before the dashboard say nothing about them;
+                # read them in this once, the next save summarizes them
+                self.appointments.extend(decode_all("appointments", self.history.read()))
+                self.history = None
+                summarized = False
+            else:
+                self.analytics.add_summary(self.history_summary, self.ids["doctors"])
+        # Files from before the trash had its own store keep it with the
+        # records; it is handed over to the trash and left out of the next save
+        trash = {}
+        for kind, records in data["trash"].items():
+            if isinstance(records, Section):
+                records = records.read()
+            trash[kind] = records if kind == "appointments" and not sectioned else decode_all(kind, records)
+        self.next_ids.update(data.get("next_ids", {}))
+        migrated = not sectioned and _migrate(self, trash)
+        for kind in LISTS:
+            for record in getattr(self, kind):
+                self._index(kind, record, search=False)
+        self._build_indexes()
+        if any(trash.values()):
+            self.trash.adopt(trash)
+            migrated = True
+        # Data that isn't sectioned is saved in the current form once, so
+        # the next load can skip migrating it
+        if migrated or not summarized or not sectioned:
+            self.save()
+
+    def save(self, *changes):
+        # Changes are appended to the journal; with none, or once the journal
+        # grows past its limits, everything is folded into a new snapshot
+        if changes:
+            self.store.append(changes)
+            if not self.store.needs_compaction():
+                return
+        self.store.compact(self.state())
+
+    def _build_indexes(self):
+        self.search_stale.update(SEARCH_FIELDS)
+        self.slot_index.build(self.doctors, self.booked_slots)
+
+    def _build_search(self, kind):
+        fields = SEARCH_FIELDS[kind]
+        self.search_index[kind].build((r.id, [getattr(r, f) for f in fields]) for r in getattr(self, kind))
+        self.search_stale.discard(kind)
+
+    def build_search_indexes(self):
+        """Build the search indexes now rather than on the first search."""
+        for kind in list(self.search_stale):
+            self._build_search(kind)
+
+    def commit(self, *changes):
+        self.apply(*changes)
+        self.save(*changes)
+        return changes
+
+    def apply(self, *changes):
+        """Apply changes to the lists and indexes without saving them."""
+        state = {kind: getattr(self, kind) for kind in LISTS}
+        search = len(changes) <= BULK_CHANGES
+        if not search:
+            # Empty the slot index so bookings don't update it one by one
+            self.slot_index.build([], self.booked_slots)
+        for c in changes:
+            name = c["kind"]
+            old = apply_change(state, c)
+            self.versions[name] += 1
+            if c["op"] == "clear":
+                for record in old:
+                    self._unindex(name, record, search)
+                continue
+            if old is not None:
+                self._unindex(name, old, search)
+            if "value" in c:
+                self._index(name, c["value"], search)
+        if not search:
+            self._build_indexes()
+
+    def _index(self, name, record, search=True):
+        self.ids[name][record.id] = record
+        if record.id >= self.next_ids[name]:
+            self.next_ids[name] = record.id + 1
+        if name == "appointments":
+            self.analytics.appointment(record, 1)
+            if record.holds_slot:
+                self._count_booking(record, 1)
+            return
+        if name == "waitlist":
+            self.waitlist_index.add(record)
+            return
+        if name == "patients":
+            self.analytics.patient(1)
+        else:
+            self.analytics.doctor_added(record, self.booked_slots.get(record.id, {}))
+        if search and name in SEARCH_FIELDS:
+            if name not in self.search_stale:
+                self.search_index[name].add(record.id, [getattr(record, f) for f in SEARCH_FIELDS[name]])
+            if name == "doctors":
+                self.slot_index.add_doctor(record, self.booked_slots.get(record.id, {}))
+
+    def _unindex(self, name, record, search=True):
+        self.ids[name].pop(record.id, None)
+        if name == "appointments":
+            self.analytics.appointment(record, -1)
+            if record.holds_slot:
+                self._count_booking(record, -1)
+            return
+        if name == "waitlist":
+            self.waitlist_index.remove(record)
+            return
+        if name == "patients":
+            self.analytics.patient(-1)
+        else:
+            self.analytics.doctor_removed(record)
+        if search and name in SEARCH_FIELDS:
+            if name not in self.search_stale:
+                self.search_index[name].remove(record.id, [getattr(record, f) for f in SEARCH_FIELDS[name]])
+            if name == "doctors":
+                self.slot_index.remove_doctor(record)
+                self.availability.forget(record.id)
+
+    def _count_booking(self, appt, delta):
+        slots = self.booked_slots.setdefault(appt.doctor_id, {})
+        before = slots.get(appt.slot, 0)
+        count = before + delta
+        if count > 0:
+            slots[appt.slot] = count
+        else:
+            slots.pop(appt.slot, None)
+        if before == 0 and count > 0:
+            self.slot_index.book(appt.doctor_id, appt.slot)
+            self.analytics.slot_booked(self.ids["doctors"].get(appt.doctor_id), appt.slot, 1)
+        elif before > 0 and count <= 0:
+            self.slot_index.release(appt.doctor_id, appt.slot)
+            self.analytics.slot_booked(self.ids["doctors"].get(appt.doctor_id), appt.slot, -1)
+            self.released.add((appt.doctor_id, appt.slot))
+
+    # --- Lookups ---
+
+    def get(self, kind, record_id):
+        record = self.ids[kind].get(record_id)
+        if record is None:
+            # The trash is read from disk the first time one is needed
+            record = self.trash.get(kind, record_id)
+        return record
+
+    def search(self, kind, query, limit=10):
+        """Active patients or doctors whose name (or specialty) starts with query."""
+        if kind in self.search_stale:
+            self._build_search(kind)
+        return [self.ids[kind][i] for i in self.search_index[kind].search(query, limit)]
+
+    def index_of(self, kind, record):
+        # list.index compares by identity first, so this is a fast C scan
+        return getattr(self, kind).index(record)
+
+    def patient_of(self, appt):
+        return self.get("patients", appt.patient_id) or MISSING_PATIENT
+
+    def doctor_of(self, appt):
+        return self.get("doctors", appt.doctor_id) or MISSING_DOCTOR
+
+    def is_slot_booked(self, doctor_id, slot, ignore=None):
+        self._history_needed(slot)
+        count = self.booked_slots.get(doctor_id, {}).get(slot, 0)
+        if ignore is not None and ignore.holds_slot and ignore.doctor_id == doctor_id and ignore.slot == slot:
+            count -= 1
+        return count > 0
+
+    def available_slots(self, doctor, start=None, end=None):
+        """Free explicit slots plus the free template slots starting in [start, end).
+
+        The window defaults to the current week. Canonical slot strings sort
+        in time order, so the result does too.
+        """
+        if doctor.weekly:
+            start = start or week_of(datetime.now())
+            self._history_needed_before(start)
+        booked = self.booked_slots.get(doctor.id, {})
+        # Slots held by past appointments still on disk, as the snapshot's
+        # summary has them; see summarize()
+        past = self.analytics.history_slots.get(doctor.id, ())
+        free = [s for s in doctor.slots if s not in booked and s not in past]
+        if doctor.weekly:
+            explicit = set(doctor.slots)
+            free.extend(slot for _, _, slot in self.availability.between(doctor, start, end or start + WEEK)
+                        if slot not in booked and slot not in past and slot not in explicit)
+            free.sort()
+        return free
+
+    def has_slot(self, doctor, slot):
+        """Whether `slot` is one of the doctor's explicit slots or falls on its weekly template."""
+        return slot in doctor.slots or self.availability.offers(doctor, slot)
+
+    def check_booking(self, patient, doctor, slot, ignore=None):
+        """Raise ValueError if `patient` can't have `slot` with `doctor`; `ignore` is the appointment being edited."""
+        if patient is None or doctor is None or not slot:
+            raise ValueError("Select patient, doctor, and slot.")
+        if not self.has_slot(doctor, slot):
+            raise ValueError("The doctor does not offer this slot.")
+        if self.is_slot_booked(doctor.id, slot, ignore=ignore):
+            raise ValueError("Slot already booked.")
+
+    def specialties(self):
+        return self.slot_index.specialties()
+
+    def earliest_free(self, spec=None, after=None):
+        """(doctor, slot) for the earliest free slot starting at or after `after`, or None."""
+        if after is not None:
+            self._history_needed(after)
+        found = self.slot_index.earliest(spec, after)
+        if found is None:
+            return None
+        return self.ids["doctors"][found[2]], found[3]
+
+    def take_offers(self, now=None):
+        """Match the slots freed since the last call with the waitlist.
+
+        Returns (entry, doctor, slot) for each freed slot that is still
+        free, still offered and not yet started, earliest slot first,
+        with the entry first in line for it that hasn't declined it. An
+        entry is offered at most one slot per call. Slots passed to
+        decline_offer() come back from the next call, for the next in line.
+        """
+        released, self.released = self.released, set()
+        now = (now or datetime.now()).strftime("%Y-%m-%d %H:%M")
+        offers = []
+        for doctor_id, slot in sorted(released, key=lambda r: r[1]):
+            doctor = self.ids["doctors"].get(doctor_id)
+            if (doctor is None or slot < now or self.booked_slots.get(doctor_id, {}).get(slot)
+                    or not self.has_slot(doctor, slot)):
+                continue
+            skipped = []
+            entry_id = self.waitlist_index.best(doctor)
+            while entry_id is not None and (entry_id, doctor_id, slot) in self.declined:
+                skipped.append(self.ids["waitlist"][entry_id])
+                self.waitlist_index.remove(skipped[-1])
+                entry_id = self.waitlist_index.best(doctor)
+            for entry in skipped:
+                self.waitlist_index.add(entry)
+            if entry_id is None:
+                continue
+            entry = self.ids["waitlist"][entry_id]
+            # Out of line until the others are matched
+            self.waitlist_index.remove(entry)
+            offers.append((entry, doctor, slot))
+        for entry, _, _ in offers:
+            self.waitlist_index.add(entry)
+        return offers
+
+    def decline_offer(self, entry, doctor, slot):
+        """`entry` won't take the offered slot; the next take_offers() offers it to the next in line."""
+        self.declined.add((entry.id, doctor.id, slot))
+        self.released.add((doctor.id, slot))
+
+    def free_slots(self, start, end, spec=None, limit=None):
+        """(doctor, slot) pairs for every free slot starting in [start, end), earliest first."""
+        self._history_needed(start)
+        return [(self.ids["doctors"][doctor_id], slot)
+                for _, _, doctor_id, slot in self.slot_index.window(start, end, spec, limit)]
+
+    # --- Mutations ---
+
+    def add(self, kind, record):
+        record = replace(record, id=self.next_ids[kind])
+        return self.commit(change("append", kind, value=record))[0]["value"]
+
+    def update(self, kind, index, record):
+        record = replace(record, id=getattr(self, kind)[index].id)
+        return self.commit(change("replace", kind, index, record))[0]["value"]
+
+    def set_status(self, index, status):
+        """Mark the appointment at `index` booked, attended, no-show or cancelled."""
+        if status not in STATUSES:
+            raise ValueError(f"Unknown status: {status}")
+        appt = self.appointments[index]
+        if status == appt.status:
+            return appt
+        record = replace(appt, status=status)
+        if record.holds_slot and not appt.holds_slot:
+            if self.is_slot_booked(appt.doctor_id, appt.slot):
+                raise ValueError("That slot has been booked again since this appointment was cancelled.")
+        return self.commit(change("replace", "appointments", index, record))[0]["value"]
+
+    def book_offer(self, entry, doctor, slot):
+        """Book the slot offered to waitlist `entry` and take the entry off the waitlist."""
+        patient = self.ids["patients"].get(entry.patient_id)
+        if self.ids["waitlist"].get(entry.id) is not entry:
+            raise ValueError("This patient is no longer on the waitlist.")
+        self.check_booking(patient, self.ids["doctors"].get(doctor.id), slot)
+        appt = Appointment(self.next_ids["appointments"], patient.id, doctor.id, slot)
+        return self.commit(change("remove", "waitlist", self.index_of("waitlist", entry), record_id=entry.id),
+                           change("append", "appointments", value=appt))[1]["value"]
+
+    def remove(self, kind, index):
+        record = getattr(self, kind)[index]
+        self.commit(change("remove", kind, index, record_id=record.id))
+
+    def delete(self, kind, index):
+        # Move to trash. It is written first, so a crash in between leaves
+        # the record in both places rather than in neither; see Trash
+        record = getattr(self, kind)[index]
+        self.trash.add(kind, record)
+        self.versions["trash." + kind] += 1
+        changes = [change("remove", kind, index, record_id=record.id)]
+        if kind == "patients":
+            # Their waitlist entries go with them, last first so the
+            # positions hold
+            changes.extend(change("remove", "waitlist", i, record_id=w.id)
+                           for i, w in reversed(list(enumerate(self.waitlist))) if w.patient_id == record.id)
+        self.commit(*changes)
+
+    def recover(self, kind, record_id):
+        record = self.trash.get(kind, record_id)
+        self.commit(change("append", kind, value=record))
+        self.trash.remove(kind, [record_id])
+        self.versions["trash." + kind] += 1
+        return record
+
+    def empty_trash(self, kind):
+        self.trash.clear(kind)
+        self.versions["trash." + kind] += 1
+
+    def set_trash_policy(self, max_age_days, max_count):
+        self.trash.set_policy(max_age_days, max_count)
+
+    def purge_trash(self, now=None):
+        """Drop trash entries past the retention limits; returns {kind: number dropped}.
+
+        A trash not read in yet is purged by the store (on the writer
+        thread, with a BackgroundWriter) and stays unread; nothing shows
+        it, so {} is returned.
+        """
+        if self.trash.entries is None:
+            self.store.purge_trash(now)
+            return {}
+        purged = self.trash.purge(now)
+        for kind in purged:
+            self.versions["trash." + kind] += 1
+        return purged
+
+
+def patient_record(name, age):
+    """A new patient from form or import values; ValueError if they aren't valid."""
+    name = str(name).strip()
+    age = str(age).strip()
+    if not name or not age.isdigit():
+        raise ValueError("Enter valid name and age.")
+    return Patient(None, name, int(age))
+
+
+def doctor_record(name, spec, slots, weekly=(), leave=(), keep=()):
+    """A new doctor from form or import values, with slots and weekly hours in canonical form.
+
+    `keep` are the slots of the doctor being edited; see normalize_slots().
+    """
+    name = str(name).strip()
+    spec = str(spec).strip()
+    if not name or not spec or not (slots or weekly):
+        raise ValueError("Fill all fields and at least one slot or weekly hours.")
+    # Weekly hours are expanded into slots only when a week is looked at
+    weekly, leave = normalize_template(weekly, leave)
+    return Doctor(None, name, spec, normalize_slots(slots, keep=keep), weekly, leave)
+
+
+def waitlist_record(patient, doctor=None, spec=None, urgency=None, now=None):
+    """A new waitlist entry for `patient`, waiting on `doctor` or else on any doctor of `spec`."""
+    if patient is None or (doctor is None and not spec):
+        raise ValueError("Select a patient and a doctor or specialty.")
+    if urgency not in URGENCIES:
+        raise ValueError("Select how urgent it is.")
+    requested = (now or datetime.now()).strftime("%Y-%m-%d %H:%M:%S")
+    if doctor is not None:
+        return WaitlistEntry(None, patient.id, doctor.id, doctor.spec, urgency, requested)
+    return WaitlistEntry(None, patient.id, None, spec, urgency, requested)
+
+
+def _migrate(hospital, trash):
+    """Give legacy records ids and turn embedded appointment copies into references.
+
+    `trash` is the file's own {kind: [records]} trash, migrated alongside.
+    """
+    migrated = False
+    lookups = {"patients": ({}, {}), "doctors": ({}, {})}
+    for kind, (key, loose) in _MATCH_KEYS.items():
+        exact, by_name = lookups[kind]
+        for record in getattr(hospital, kind) + trash[kind]:
+            if record.id is None:
+                record.id = hospital.next_ids[kind]
+                migrated = True
+            hospital.next_ids[kind] = max(hospital.next_ids[kind], record.id + 1)
+            exact.setdefault(key(record), record.id)
+            by_name.setdefault(loose(record), record.id)
+
+    def resolve(kind, embedded):
+        key, loose = _MATCH_KEYS[kind]
+        exact, by_name = lookups[kind]
+        record_id = exact.get(key(embedded))
+        if record_id is None:
+            record_id = by_name.get(loose(embedded))
+        if record_id is None:
+            # Deleted and purged: keep it as a trashed record so the
+            # appointment still resolves
+            record_id = hospital.next_ids[kind]
+            hospital.next_ids[kind] += 1
+            trash[kind].append(replace(embedded, id=record_id))
+            exact[key(embedded)] = record_id
+        return record_id
+
+    for appt_list in (hospital.appointments, trash["appointments"]):
+        for i, a in enumerate(appt_list):
+            if isinstance(a, dict) and 'patient' in a:
+                appt_list[i] = Appointment(a.get('id'), resolve("patients", decode("patients", a['patient'])),
+                                           resolve("doctors", decode("doctors", a['doctor'])), a['slot'])
+                migrated = True
+        appt_list[:] = decode_all("appointments", appt_list)
+    all_appts = hospital.appointments + trash["appointments"]
+    for a in all_appts:
+        if a.id is not None:
+            hospital.next_ids["appointments"] = max(hospital.next_ids["appointments"], a.id + 1)
+    for a in all_appts:
+        if a.id is None:
+            a.id = hospital.next_ids["appointments"]
+            hospital.next_ids["appointments"] += 1
+            migrated = True
+    return _migrate_slots(hospital, trash) or migrated
+
+
+def _migrate_slots(hospital, trash):
+    """Rewrite free-form slot strings in the canonical "YYYY-MM-DD HH:MM-HH:MM" form.
+
+    Slots that don't parse (free text such as "Monday morning") are kept
+    as they are; they can still be booked but are not in the slot index.
+    """
+    migrated = False
+    for doctors in (hospital.doctors, trash["doctors"]):
+        for i, doctor in enumerate(doctors):
+            slots = tuple(dict.fromkeys(canonical_slot(s) for s in doctor.slots))
+            if slots != doctor.slots:
+                doctors[i] = replace(doctor, slots=slots)
+                migrated = True
+    for appts in (hospital.appointments, trash["appointments"]):
+        for i, a in enumerate(appts):
+            slot = canonical_slot(a.slot)
+            if slot != a.slot:
+                appts[i] = replace(a, slot=slot)
+                migrated = True
+    return migrated
+
+
+# Exact match on the full record first, then a looser match for records that
+# were edited after the appointment copied them
+_MATCH_KEYS = {
+    "patients": (lambda p: (p.name, p.age), lambda p: p.name),
+    "doctors": (lambda d: (d.name, d.spec, d.slots), lambda d: (d.name, d.spec)),
+}
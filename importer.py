@@ -0,0 +1,389 @@
+"""Bulk import of patients, doctors or appointments from CSV or JSON files.
+
+    python importer.py patients.csv doctors.json appointments.csv --data hospital_data.json
+
+Columns (CSV headers or JSON keys):
+    patients:     name, age
+    doctors:      name, spec, slots, weekly, leave  (lists separated by ";" or ",")
+    appointments: patient_id or patient (name), doctor_id or doctor (name), slot
+
+Files are read one row at a time and checked with the same rules as the
+forms. Valid rows from every file are committed together in one go;
+rejected rows are reported and can be written to a CSV file.
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import threading
+from dataclasses import replace
+
+from hospital import KINDS, Hospital, doctor_record, patient_record
+from models import Appointment, to_dict
+from slots import Availability, canonical_slot
+from storage import SNAPSHOT_FILE, change, open_storage
+
+BATCH_SIZE = 1000
+IMPORT_TYPES = [("CSV or JSON", "*.csv *.json *.jsonl"), ("All files", "*.*")]
+
+_SEPARATOR = re.compile(r"\s*[;,]\s*")
+_AMBIGUOUS = object()
+
+
+def read_rows(path, chunk_size=1 << 16):
+    """Yield (row number, row) from a CSV, JSON array or JSON Lines file without loading it whole."""
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, newline="" if ext == ".csv" else None, encoding="utf-8-sig") as f:
+        if ext == ".csv":
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+        elif ext in (".jsonl", ".ndjson"):
+            for number, line in enumerate(f, 1):
+                if line.strip():
+                    yield number, json.loads(line)
+        else:
+            yield from _json_array(f, chunk_size)
+
+
+def _json_array(f, chunk_size):
+    # Decode the elements of a top-level JSON array one at a time
+    decoder = json.JSONDecoder()
+    buf = f.read(chunk_size)
+    pos = 0
+    number = 0
+    expect = "["
+    while True:
+        while pos < len(buf) and buf[pos].isspace():
+            pos += 1
+        if pos == len(buf):
+            more = f.read(chunk_size)
+            if not more:
+                raise ValueError("JSON import file ends before its closing ']'")
+            buf, pos = buf[pos:] + more, 0
+            continue
+        if expect == "[":
+            if buf[pos] != "[":
+                raise ValueError("JSON import files must hold a list of records")
+            pos += 1
+            expect = "value"
+        elif buf[pos] == "]":
+            return
+        elif expect == "," and buf[pos] == ",":
+            pos += 1
+            expect = "value"
+        else:
+            try:
+                row, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                # Most likely cut off at the end of the buffer
+                more = f.read(chunk_size)
+                if not more:
+                    raise
+                buf, pos = buf[pos:] + more, 0
+                continue
+            number += 1
+            yield number, row
+            pos = end
+            expect = ","
+
+
+def guess_kind(path):
+    """What a file holds: told by the columns of its first row, else by the last kind named in its file name."""
+    rows = read_rows(path)
+    try:
+        first = next(rows, None)
+    except (OSError, ValueError, csv.Error):
+        first = None
+    finally:
+        rows.close()
+    columns = first[1] if first is not None and isinstance(first[1], dict) else {}
+    if "slot" in columns and columns.keys() & {"patient", "patient_id", "doctor", "doctor_id"}:
+        return "appointments"
+    if columns.keys() & {"spec", "specialty"}:
+        return "doctors"
+    if "age" in columns:
+        return "patients"
+    # "doctor_appointments.csv" holds appointments
+    words = re.findall(r"[a-z]+", os.path.splitext(os.path.basename(path))[0].lower())
+    for word in reversed(words):
+        for kind in KINDS:
+            if word in (kind, kind.rstrip("s")):
+                return kind
+    return None
+
+
+def _list(value):
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return [str(v).strip() for v in value if str(v).strip()]
+    return [v for v in _SEPARATOR.split(str(value).strip()) if v]
+
+
+def _text(row, *keys):
+    for key in keys:
+        value = row.get(key)
+        if value not in (None, ""):
+            return value
+    return ""
+
+
+class Importer:
+    """Checks imported rows against a Hospital and gathers them into one commit.
+
+    Rows are validated in batches of BATCH_SIZE. Accepted records get
+    their ids straight away, so appointments later in the same import can
+    refer to patients and doctors earlier in it; slots taken by accepted
+    appointments are tracked so conflicts inside the import are caught
+    too. Rejected rows land in `rejected` as (file, row, reason, data).
+    The hospital is not touched until commit().
+
+    Rows are checked against a copy of what the checks need, taken when
+    the Importer is made, so they can be checked on a worker thread while
+    the hospital changes; commit() checks bookings once more against the
+    hospital itself.
+    """
+
+    def __init__(self, hospital):
+        self.hospital = hospital
+        # Past appointments are read in first, as their slots are taken too
+        hospital.loaded("appointments")
+        self.ids = {kind: dict(hospital.ids[kind]) for kind in ("patients", "doctors")}
+        self.booked = {(doctor_id, slot) for doctor_id, slots in hospital.booked_slots.items()
+                       for slot, n in slots.items() if n}
+        # Its own, as the hospital's caches expanded weeks as it goes
+        self.availability = Availability()
+        self.first_ids = dict(hospital.next_ids)
+        self.next_ids = dict(hospital.next_ids)
+        self.pending = {kind: [] for kind in KINDS}
+        self.pending_ids = {kind: {} for kind in KINDS}
+        self.taken = set()  # (doctor id, slot) of accepted appointments
+        self.rejected = []
+        self.rows = 0
+        self._names = None
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def feed(self, kind, rows, source=""):
+        """Validate (row number, row) pairs of one kind; returns False if cancelled."""
+        batch = []
+        for item in rows:
+            batch.append(item)
+            if len(batch) >= BATCH_SIZE:
+                if self.cancelled:
+                    return False
+                self._batch(kind, batch, source)
+                batch = []
+        self._batch(kind, batch, source)
+        return not self.cancelled
+
+    def feed_file(self, path, kind=None):
+        kind = kind or guess_kind(path)
+        if kind not in KINDS:
+            raise ValueError(f"Can't tell whether {path} holds patients, doctors or appointments")
+        return self.feed(kind, read_rows(path), path)
+
+    def _batch(self, kind, batch, source):
+        check = getattr(self, "_" + kind)
+        for number, row in batch:
+            self.rows += 1
+            try:
+                if not isinstance(row, dict):
+                    raise ValueError("Not a record.")
+                record = check(row)
+            except ValueError as e:
+                self.rejected.append((source, number, str(e), row))
+                continue
+            self._accept(kind, record)
+
+    def _accept(self, kind, record):
+        record = replace(record, id=self.next_ids[kind])
+        self.next_ids[kind] += 1
+        self.pending[kind].append(record)
+        self.pending_ids[kind][record.id] = record
+        if kind == "appointments":
+            self.taken.add((record.doctor_id, record.slot))
+        elif self._names is not None:
+            self._add_name(kind, record)
+
+    def _patients(self, row):
+        return patient_record(_text(row, 'name'), _text(row, 'age'))
+
+    def _doctors(self, row):
+        return doctor_record(_text(row, 'name'), _text(row, 'spec', 'specialty'), _list(row.get('slots')),
+                             _list(row.get('weekly')), _list(row.get('leave')))
+
+    def _appointments(self, row):
+        patient = self._find("patients", row)
+        doctor = self._find("doctors", row)
+        slot = canonical_slot(str(row.get('slot') or "").strip())
+        if not slot:
+            raise ValueError("Missing slot.")
+        if slot not in doctor.slots and not self.availability.offers(doctor, slot):
+            raise ValueError("The doctor does not offer this slot.")
+        if (doctor.id, slot) in self.booked:
+            raise ValueError("Slot already booked.")
+        if (doctor.id, slot) in self.taken:
+            raise ValueError("Slot already booked earlier in this import.")
+        return Appointment(None, patient.id, doctor.id, slot)
+
+    def _find(self, kind, row):
+        # By id if given, otherwise by (unique) name among active records
+        singular = kind.rstrip("s")
+        ref = row.get(singular + "_id")
+        if ref not in (None, ""):
+            try:
+                record_id = int(ref)
+            except (TypeError, ValueError):
+                raise ValueError(f"Bad {singular} id '{ref}'.") from None
+            record = self.ids[kind].get(record_id) or self.pending_ids[kind].get(record_id)
+            if record is None:
+                raise ValueError(f"No {singular} with id {record_id}.")
+            return record
+        name = str(row.get(singular) or "").strip()
+        if not name:
+            raise ValueError(f"Missing {singular} or {singular}_id.")
+        if self._names is None:
+            self._names = {k: {} for k in ("patients", "doctors")}
+            for k in self._names:
+                for record in [*self.ids[k].values(), *self.pending[k]]:
+                    self._add_name(k, record)
+        record_id = self._names[kind].get(name.casefold())
+        if record_id is None:
+            raise ValueError(f"No {singular} named '{name}'.")
+        if record_id is _AMBIGUOUS:
+            raise ValueError(f"More than one {singular} is named '{name}'; use {singular}_id.")
+        return self.ids[kind].get(record_id) or self.pending_ids[kind][record_id]
+
+    def _add_name(self, kind, record):
+        key = record.name.casefold()
+        names = self._names[kind]
+        names[key] = _AMBIGUOUS if key in names else record.id
+
+    def commit(self):
+        """Add every accepted record in one Hospital.commit; returns counts per kind."""
+        hospital = self.hospital
+        # The hospital may have changed while the rows were checked (the GUI
+        # keeps running), so bookings and references are checked once more
+        appointments = []
+        for a in self.pending["appointments"]:
+            if (a.patient_id not in hospital.ids["patients"] and a.patient_id not in self.pending_ids["patients"]
+                    or a.doctor_id not in hospital.ids["doctors"] and a.doctor_id not in self.pending_ids["doctors"]):
+                self.rejected.append(("", None, "Patient or doctor was deleted during the import.", a))
+            elif hospital.is_slot_booked(a.doctor_id, a.slot):
+                self.rejected.append(("", None, "Slot was booked during the import.", a))
+            else:
+                appointments.append(a)
+        self.pending["appointments"] = appointments
+        # Records added while the import ran took the ids set aside for it
+        shift = {kind: max(0, hospital.next_ids[kind] - self.first_ids[kind]) for kind in KINDS}
+        if any(shift.values()):
+            for kind in KINDS:
+                self.pending[kind] = [replace(r, id=r.id + shift[kind]) for r in self.pending[kind]]
+            self.pending["appointments"] = [
+                replace(a, **{key: getattr(a, key) + shift[kind] for key, kind in (('patient_id', "patients"), ('doctor_id', "doctors"))
+                              if getattr(a, key) in self.pending_ids[kind]})
+                for a in self.pending["appointments"]]
+        changes = [change("append", kind, value=record) for kind in KINDS for record in self.pending[kind]]
+        if changes:
+            hospital.commit(*changes)
+        return {kind: len(self.pending[kind]) for kind in KINDS}
+
+    def write_rejected(self, path):
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(("file", "row", "reason", "data"))
+            for source, number, reason, row in self.rejected:
+                writer.writerow((source, number, reason, json.dumps(row, default=to_dict)))
+
+
+class ImportJob:
+    """Runs an Importer over files on a worker thread; commit() on the UI thread afterwards.
+
+    Make it on the UI thread: the Importer takes its copy of the hospital then.
+    """
+
+    def __init__(self, hospital, paths, kind=None):
+        self.importer = Importer(hospital)
+        self.paths = paths
+        self.kind = kind
+        self.error = None
+        self.finished = False
+        self._thread = None
+
+    @property
+    def rows(self):
+        return self.importer.rows
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="bulk-import", daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        self.importer.cancel()
+
+    def run(self):
+        try:
+            for path in self.paths:
+                if not self.importer.feed_file(path, self.kind):
+                    break
+        except (OSError, ValueError, csv.Error) as e:
+            self.error = e
+        finally:
+            self.finished = True
+
+
+def summary(counts, rejected):
+    text = (f"Imported {counts['patients']} patients, {counts['doctors']} doctors and "
+            f"{counts['appointments']} appointments.")
+    if rejected:
+        text += f" Rejected {len(rejected)} rows."
+    return text
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import patients, doctors or appointments from CSV/JSON files.")
+    parser.add_argument("files", nargs="+", help="CSV, JSON (a list of records) or JSON Lines files")
+    parser.add_argument("--kind", choices=KINDS, help="what the files hold (default: told by each file's columns or name)")
+    parser.add_argument("--data", default=SNAPSHOT_FILE, help="hospital data file (.json, or .db for SQLite)")
+    parser.add_argument("--rejects", help="write rejected rows to this CSV file")
+    parser.add_argument("--dry-run", action="store_true", help="check the files without saving anything")
+    args = parser.parse_args(argv)
+    # Patients and doctors first so appointments in the same run can refer to them
+    files = sorted(args.files, key=lambda path: KINDS.index(args.kind or guess_kind(path) or "appointments"))
+    hospital = Hospital(open_storage(args.data))
+    try:
+        hospital.load()
+        importer = Importer(hospital)
+        for path in files:
+            importer.feed_file(path, args.kind)
+        if args.dry_run:
+            counts = {kind: len(records) for kind, records in importer.pending.items()}
+        else:
+            counts = importer.commit()
+    except (OSError, ValueError, csv.Error) as e:
+        print(f"Import failed: {e}", file=sys.stderr)
+        return 1
+    finally:
+        hospital.store.close()
+    for source, number, reason, _ in importer.rejected[:20]:
+        print(f"{source}:{number}: {reason}", file=sys.stderr)
+    if len(importer.rejected) > 20:
+        print(f"... and {len(importer.rejected) - 20} more", file=sys.stderr)
+    if args.rejects and importer.rejected:
+        importer.write_rejected(args.rejects)
+    print(("Dry run: " if args.dry_run else "") + summary(counts, importer.rejected))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
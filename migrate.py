@@ -0,0 +1,44 @@
+import argparse
+import sys
+
+from hospital import Hospital
+from storage import JournalStore, SqliteStorage
+
+
+def migrate(json_path, db_path, force=False):
+    """Copy everything in a hospital_data.json (plus its journal) into a SQLite database."""
+    source = Hospital(JournalStore(json_path))
+    source.load()
+    for name in source.ids:
+        # Past appointments are otherwise read on first use
+        source.loaded(name)
+    target = SqliteStorage(db_path)
+    try:
+        if not force and any(target.count(kind) for kind in ("patients", "doctors", "appointments")):
+            raise ValueError(f"{db_path} already holds data; use --force to overwrite it")
+        target.compact(source.state())
+        target.compact_trash(source.trash.ops())
+        return {kind: len(getattr(source, kind)) for kind in ("patients", "doctors", "appointments")}
+    finally:
+        target.close()
+        source.store.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Migrate hospital_data.json to a SQLite database.")
+    parser.add_argument("source", nargs="?", default="hospital_data.json")
+    parser.add_argument("target", nargs="?", default="hospital.db")
+    parser.add_argument("--force", action="store_true", help="overwrite a database that already has data")
+    args = parser.parse_args(argv)
+    try:
+        counts = migrate(args.source, args.target, args.force)
+    except (OSError, ValueError) as e:
+        print(f"Migration failed: {e}", file=sys.stderr)
+        return 1
+    print(f"Migrated {counts['patients']} patients, {counts['doctors']} doctors and "
+          f"{counts['appointments']} appointments to {args.target}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
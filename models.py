@@ -0,0 +1,128 @@
+import sys
+from dataclasses import dataclass, fields
+from itertools import starmap
+from operator import attrgetter
+
+# Records are replaced, never changed in place, once they are in a Hospital
+# list; the dataclasses are only left mutable so loading can fill in ids.
+# Specialties and slots repeat across thousands of records, so they are
+# interned to share one string object each.
+
+
+@dataclass(slots=True)
+class Patient:
+    id: int
+    name: str
+    age: int
+
+
+@dataclass(slots=True)
+class Doctor:
+    id: int
+    name: str
+    spec: str
+    slots: tuple = ()
+    weekly: tuple = ()
+    leave: tuple = ()
+
+    def __post_init__(self):
+        self.spec = sys.intern(self.spec)
+        self.slots = tuple(map(sys.intern, self.slots))
+        self.weekly = tuple(self.weekly)
+        self.leave = tuple(self.leave)
+
+
+# What became of an appointment. Cancelled ones stay listed but free their
+# slot; rows written before statuses existed read back as booked
+BOOKED = "booked"
+ATTENDED = "attended"
+NO_SHOW = "no-show"
+CANCELLED = "cancelled"
+STATUSES = (BOOKED, ATTENDED, NO_SHOW, CANCELLED)
+
+
+@dataclass(slots=True)
+class Appointment:
+    id: int
+    patient_id: int
+    doctor_id: int
+    slot: str
+    status: str = BOOKED
+
+    def __post_init__(self):
+        self.slot = sys.intern(self.slot)
+        self.status = sys.intern(self.status)
+
+    @property
+    def holds_slot(self):
+        return self.status != CANCELLED
+
+
+# How soon a waiting patient needs to be seen; lower goes first
+URGENT = 0
+SOON = 1
+ROUTINE = 2
+URGENCIES = {URGENT: "urgent", SOON: "soon", ROUTINE: "routine"}
+
+
+@dataclass(slots=True)
+class WaitlistEntry:
+    """A patient waiting for a freed slot with one doctor, or with any
+    doctor of `spec` when doctor_id is None."""
+    id: int
+    patient_id: int
+    doctor_id: int
+    spec: str
+    urgency: int = ROUTINE
+    # "YYYY-MM-DD HH:MM:SS", so entries sort by it as text
+    requested: str = ""
+
+    def __post_init__(self):
+        self.spec = sys.intern(self.spec)
+
+
+MODELS = {"patients": Patient, "doctors": Doctor, "appointments": Appointment, "waitlist": WaitlistEntry}
+FIELDS = {kind: tuple(f.name for f in fields(model)) for kind, model in MODELS.items()}
+_ROW = {MODELS[kind]: attrgetter(*names) for kind, names in FIELDS.items()}
+
+
+def encode(record):
+    """A record as a JSON row: its field values in FIELDS order.
+
+    Usable as the `default` hook of json.dumps.
+    """
+    row = _ROW.get(type(record))
+    if row is None:
+        raise TypeError(f"Object of type {type(record).__name__} is not JSON serializable")
+    return row(record)
+
+
+def rows(records):
+    """encode() over a list of records of one kind, without a Python call per record."""
+    if not records:
+        return []
+    return list(map(_ROW[type(records[0])], records))
+
+
+def decode(kind, value):
+    """A record of `kind` from a JSON row, an older dict record or a record itself."""
+    model = MODELS[kind]
+    if isinstance(value, model):
+        return value
+    if isinstance(value, dict):
+        values = {name: value[name] for name in FIELDS[kind] if name in value}
+        # Records from before ids were added get theirs when they are loaded
+        values.setdefault('id', None)
+        return model(**values)
+    return model(*value)
+
+
+def decode_all(kind, values):
+    """decode() over a list; rows written by rows() take the fast path."""
+    if values and all(type(value) is list for value in values):
+        return list(starmap(MODELS[kind], values))
+    return [decode(kind, value) for value in values]
+
+
+def to_dict(record):
+    return {name: getattr(record, name) for name in record.__slots__}
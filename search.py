@@ -0,0 +1,53 @@
+from bisect import bisect_left, insort
+
+
+def _keys(texts):
+    # The whole text and each word in it, so "smi" finds "John Smith"
+    keys = set()
+    for text in texts:
+        text = " ".join(str(text).casefold().split())
+        if text:
+            keys.add(text)
+            keys.update(text.split())
+    return keys
+
+
+class PrefixIndex:
+    """Sorted (key, id) pairs searched by prefix with bisect.
+
+    Lookups cost O(log n) plus the number of matches returned; adding or
+    removing a record is a bisect and a list insert/delete per key.
+    """
+
+    def __init__(self):
+        self.keys = []
+
+    def build(self, entries):
+        """Replace the index contents from (record_id, texts) pairs in one sort."""
+        self.keys = sorted((key, record_id) for record_id, texts in entries for key in _keys(texts))
+
+    def add(self, record_id, texts):
+        for key in _keys(texts):
+            insort(self.keys, (key, record_id))
+
+    def remove(self, record_id, texts):
+        for key in _keys(texts):
+            pos = bisect_left(self.keys, (key, record_id))
+            if pos < len(self.keys) and self.keys[pos] == (key, record_id):
+                del self.keys[pos]
+
+    def search(self, prefix, limit=10):
+        """Ids of up to `limit` records with a key starting with `prefix`, in key order."""
+        prefix = " ".join(prefix.casefold().split())
+        found = []
+        seen = set()
+        pos = bisect_left(self.keys, (prefix,))
+        while pos < len(self.keys) and len(found) < limit:
+            key, record_id = self.keys[pos]
+            if not key.startswith(prefix):
+                break
+            if record_id not in seen:
+                seen.add(record_id)
+                found.append(record_id)
+            pos += 1
+        return found
@@ -0,0 +1,311 @@
+"""Booking server that lets several front desks share one hospital.
+
+    python server.py [data file] [--port 8765]
+
+The server owns the data file; desks connect with `python HABS.py
+--connect [port]`. It only listens on localhost. Messages are JSON lines:
+a desk sends {"id", "op", ...} and gets {"id", "result"} or {"id",
+"error"} back, and every desk is sent {"seq", "changes", "trash"} for
+each change made, by any desk, in the order the server made them.
+"""
+import argparse
+import asyncio
+import json
+import sys
+from dataclasses import replace
+
+from hospital import KINDS, LISTS, Conflict, Hospital
+from models import decode, encode
+from storage import SNAPSHOT_FILE, BackgroundWriter, Storage, change, open_storage
+
+HOST = "127.0.0.1"
+PORT = 8765
+COMPACT_INTERVAL = 60
+TRASH_PURGE_INTERVAL = 60
+# Replies to "load" and large imports are far longer than asyncio's default line limit
+LINE_LIMIT = 1 << 28
+
+SINGULAR = {"patients": "patient", "doctors": "doctor", "appointments": "appointment", "waitlist": "waitlist entry"}
+
+
+def _line(message):
+    return json.dumps(message, separators=(",", ":"), default=encode).encode("utf-8") + b"\n"
+
+
+class _Recorder(Storage):
+    """Passes writes on to the real store and keeps them to be sent to the desks."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.changes = []
+        self.trash = []
+
+    @property
+    def records(self):
+        return self.backend.records
+
+    @property
+    def errors(self):
+        return self.backend.errors
+
+    def load(self):
+        return self.backend.load()
+
+    def append(self, changes):
+        self.changes.extend(changes)
+        self.backend.append(changes)
+
+    def needs_compaction(self):
+        return self.backend.needs_compaction()
+
+    def compact(self, state):
+        self.backend.compact(state)
+
+    def load_trash(self):
+        return self.backend.load_trash()
+
+    def append_trash(self, ops):
+        self.trash.extend(ops)
+        self.backend.append_trash(ops)
+
+    def compact_trash(self, ops):
+        self.backend.compact_trash(ops)
+
+    def purge_trash(self, now=None):
+        # Only while the trash isn't loaded, so no desk has it to update
+        self.backend.purge_trash(now)
+
+    def flush(self):
+        self.backend.flush()
+
+    def close(self):
+        self.backend.close()
+
+    def take(self):
+        changes, trash = self.changes, self.trash
+        self.changes, self.trash = [], []
+        return changes, trash
+
+
+class BookingServer:
+    """Serves one Hospital to any number of desks.
+
+    Each request is checked and applied within one step of the event
+    loop, so no other request can come in between. Instead of locks,
+    desks send the record they expect to change along with each change
+    (compare-and-swap). Changes made against a record that has changed
+    since, or bookings of a slot that was taken meanwhile, are refused
+    with a Conflict. New records whose id another desk took first get
+    the next free one.
+    """
+
+    def __init__(self, hospital):
+        self.hospital = hospital
+        self.recorder = hospital.store
+        self.desks = set()
+        self.seq = 0
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                request = json.loads(line)
+                try:
+                    result = self.dispatch(request, writer)
+                except Conflict as e:
+                    # Says how far the desk has to catch up to see why
+                    reply = {"id": request["id"], "error": str(e), "conflict": True, "seq": self.seq}
+                except (KeyError, TypeError, ValueError) as e:
+                    reply = {"id": request["id"], "error": str(e)}
+                else:
+                    # The desk's own change is sent before the reply, like
+                    # everyone else's; the reply says whether there was one
+                    changed = self.broadcast()
+                    reply = {"id": request["id"], "result": dict(result, seq=self.seq, changed=changed)}
+                writer.write(_line(reply))
+                await writer.drain()
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            self.desks.discard(writer)
+            writer.close()
+
+    def broadcast(self):
+        # Each desk matches the slots its own changes free with the waitlist
+        self.hospital.released.clear()
+        changes, trash = self.recorder.take()
+        if not changes and not trash:
+            return False
+        self.seq += 1
+        line = _line({"seq": self.seq, "changes": changes, "trash": trash})
+        for desk in self.desks:
+            desk.write(line)
+        return True
+
+    def dispatch(self, request, writer):
+        h = self.hospital
+        op = request["op"]
+        if op == "load":
+            self.desks.add(writer)
+            state = {kind: getattr(h, kind) for kind in LISTS}
+            state.update(next_ids=h.next_ids, history=None, history_before=None,
+                         doctor_specs=h.analytics.removed_specs(h.ids["doctors"]))
+            return {"state": state}
+        if op == "trash":
+            return {"ops": h.trash.ops()}
+        if op == "commit":
+            h.commit(*self._resolve(request["changes"]))
+            return {}
+        kind = request.get("kind")
+        if kind is not None and kind not in KINDS:
+            raise ValueError(f"Unknown list: {kind}")
+        if op == "delete":
+            current = self._current(kind, request["record_id"], request["expect"])
+            h.delete(kind, h.index_of(kind, current))
+        elif op == "recover":
+            record = h.trash.get(kind, request["record_id"])
+            if record is None or record.id in h.ids[kind]:
+                raise Conflict(f"This {SINGULAR[kind]} was already recovered or removed at another desk.")
+            if kind == "appointments" and record.holds_slot and h.is_slot_booked(record.doctor_id, record.slot):
+                raise Conflict("That slot has been booked again since this appointment was deleted.")
+            h.recover(kind, record.id)
+        elif op == "empty_trash":
+            h.empty_trash(kind)
+        elif op == "purge":
+            return {"purged": h.purge_trash()}
+        elif op == "policy":
+            h.set_trash_policy(request["max_age_days"], request["max_count"])
+        else:
+            raise ValueError(f"Unknown request: {op}")
+        return {}
+
+    def _current(self, kind, record_id, expect):
+        current = self.hospital.ids[kind].get(record_id)
+        if current is None or current != decode(kind, expect):
+            raise Conflict(f"This {SINGULAR[kind]} was changed or removed at another desk.")
+        return current
+
+    def _resolve(self, changes):
+        """Check a desk's changes against the current records and give them this server's positions."""
+        h = self.hospital
+        resolved = []
+        touched = set()
+        removed = {kind: [] for kind in LISTS}
+        # New ids for records whose id was taken, and how this commit
+        # changes the number of bookings of each (doctor, slot)
+        remap = {kind: {} for kind in LISTS}
+        next_ids = dict(h.next_ids)
+        added = {kind: set() for kind in LISTS}
+        booked = {}
+        for c in changes:
+            kind, op = c["kind"], c["op"]
+            if kind not in LISTS or op not in ("append", "replace", "remove"):
+                raise ValueError(f"Unsupported change: {op} {kind}")
+            index = value = None
+            if op != "append":
+                if (kind, c["id"]) in touched:
+                    raise ValueError("A record was changed twice in one commit.")
+                touched.add((kind, c["id"]))
+                current = self._current(kind, c["id"], c["expect"])
+                position = h.index_of(kind, current)
+                # Removals earlier in this commit move later records up
+                index = position - sum(1 for i in removed[kind] if i < position)
+                if op == "remove":
+                    removed[kind].append(position)
+                if kind == "appointments" and current.holds_slot:
+                    key = (current.doctor_id, current.slot)
+                    booked[key] = booked.get(key, 0) - 1
+            if op != "remove":
+                value = decode(kind, c["value"])
+                if op == "append":
+                    if value.id is None or value.id < next_ids[kind] or value.id in h.ids[kind]:
+                        remap[kind][value.id] = next_ids[kind]
+                        value = replace(value, id=next_ids[kind])
+                    next_ids[kind] = max(next_ids[kind], value.id + 1)
+                    added[kind].add(value.id)
+                elif value.id != c["id"]:
+                    raise ValueError("A record's id can't be changed.")
+                if kind in ("appointments", "waitlist"):
+                    value = replace(value, patient_id=remap["patients"].get(value.patient_id, value.patient_id),
+                                    doctor_id=remap["doctors"].get(value.doctor_id, value.doctor_id))
+                    for ref in ("patients", "doctors"):
+                        ref_id = getattr(value, SINGULAR[ref] + "_id")
+                        # Waitlist entries for any doctor of a specialty name none
+                        if ref_id is None and kind == "waitlist":
+                            continue
+                        if ref_id not in h.ids[ref] and ref_id not in added[ref]:
+                            raise Conflict(f"The {SINGULAR[ref]} was deleted at another desk.")
+                if kind == "appointments" and value.holds_slot:
+                    key = (value.doctor_id, value.slot)
+                    count = booked.get(key, 0) + 1
+                    if h.booked_slots.get(value.doctor_id, {}).get(value.slot, 0) + count > 1:
+                        raise Conflict("Slot already booked at another desk.")
+                    booked[key] = count
+            resolved.append(change(op, kind, index, value, c["id"] if op != "append" else None))
+        return resolved
+
+    async def housekeeping(self):
+        # What HABS does on its timers when it owns the data file itself
+        elapsed = 0
+        while True:
+            await asyncio.sleep(1)
+            elapsed += 1
+            h = self.hospital
+            while not h.store.errors.empty():
+                print(f"Save failed, retried on the next save: {h.store.errors.get_nowait()}", file=sys.stderr)
+            if elapsed % COMPACT_INTERVAL == 0 and (h.store.records or h.store.needs_compaction()):
+                h.save()
+            if elapsed % TRASH_PURGE_INTERVAL == 0:
+                h.purge_trash()
+                self.broadcast()
+
+
+def open_hospital(path):
+    hospital = Hospital(_Recorder(BackgroundWriter(open_storage(path))))
+    hospital.load()
+    # Every desk gets the full appointment list, so positions agree everywhere
+    hospital.loaded("appointments")
+    hospital.build_search_indexes()
+    hospital.store.take()
+    return hospital
+
+
+async def serve(path=SNAPSHOT_FILE, port=PORT, started=None):
+    server = BookingServer(open_hospital(path))
+    listener = await asyncio.start_server(server.handle, HOST, port, limit=LINE_LIMIT)
+    housekeeping = asyncio.create_task(server.housekeeping())
+    if started is not None:
+        started(listener)
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        housekeeping.cancel()
+        store = server.hospital.store
+        store.flush()
+        # A failed write leaves nothing in the journal count, only the
+        # need for a full snapshot
+        if store.records or store.needs_compaction():
+            server.hospital.save()
+        store.close()
+        while not store.errors.empty():
+            print(f"Save failed: {store.errors.get_nowait()}", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Share one hospital data file between several desks.")
+    parser.add_argument("data", nargs="?", default=SNAPSHOT_FILE)
+    parser.add_argument("--port", type=int, default=PORT)
+    args = parser.parse_args(argv)
+    print(f"Serving {args.data} on {HOST}:{args.port}")
+    try:
+        asyncio.run(serve(args.data, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
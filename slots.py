@@ -0,0 +1,446 @@
+import re
+from bisect import bisect_left, insort
+from collections import Counter, OrderedDict
+from datetime import date, datetime, timedelta
+
+DEFAULT_MINUTES = 30
+SLOT_FORMAT_HELP = "YYYY-MM-DD HH:MM or YYYY-MM-DD HH:MM-HH:MM"
+RULE_FORMAT_HELP = "Mon-Fri 09:00-12:00/30"
+LEAVE_FORMAT_HELP = "YYYY-MM-DD or YYYY-MM-DD..YYYY-MM-DD"
+DAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+WEEK = timedelta(days=7)
+
+# How far ahead earliest() looks for a free slot in weekly templates
+HORIZON_WEEKS = 52
+
+_CANONICAL = re.compile(r"\d{4}-\d\d-\d\d \d\d:\d\d-\d\d:\d\d$")
+_RULE = re.compile(r"^\s*(daily|[a-z]{3})[a-z]*(?:\s*-\s*([a-z]{3})[a-z]*)?\s+(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})"
+                   r"(?:\s*/\s*(\d+))?\s*$", re.I)
+_LEAVE = re.compile(r"^\s*(\d{4}-\d{1,2}-\d{1,2})(?:\s*(?:\.\.|to)\s*(\d{4}-\d{1,2}-\d{1,2}))?\s*$", re.I)
+_TIME = r"(\d{1,2})(?::(\d{2}))?\s*([ap]\.?m\.?)?"
+_SLOT = re.compile(r"^\s*(\d{4})-(\d{1,2})-(\d{1,2})[ T]+" + _TIME +
+                   r"(?:\s*(?:-|–|to)\s*(?:(\d{4})-(\d{1,2})-(\d{1,2})[ T]+)?" + _TIME + r")?\s*$", re.I)
+
+
+def _clock(hour, minute, meridiem):
+    hour = int(hour)
+    minute = int(minute or 0)
+    if meridiem:
+        if not 1 <= hour <= 12:
+            raise ValueError("bad 12-hour time")
+        hour = hour % 12 + (12 if meridiem.lower().startswith("p") else 0)
+    return hour, minute
+
+
+def parse_slot(text, minutes=DEFAULT_MINUTES):
+    """(start, end) datetimes for a slot string, or None if it has no date and time.
+
+    Accepts "2025-01-06 09:00", "2025-01-06 9:30am", "2025-01-06 09:00-09:45"
+    and the canonical form written by format_slot. Slots without an end
+    last `minutes`.
+    """
+    if _CANONICAL.match(text):
+        # Fast path for the canonical "YYYY-MM-DD HH:MM-HH:MM"
+        try:
+            start = datetime(int(text[0:4]), int(text[5:7]), int(text[8:10]), int(text[11:13]), int(text[14:16]))
+            end = start.replace(hour=int(text[17:19]), minute=int(text[20:22]))
+        except ValueError:
+            return None
+        return (start, end) if end > start else None
+    m = _SLOT.match(text)
+    if m is None:
+        return None
+    g = m.groups()
+    try:
+        day = datetime(int(g[0]), int(g[1]), int(g[2]))
+        hour, minute = _clock(g[3], g[4], g[5])
+        start = day.replace(hour=hour, minute=minute)
+        if g[9] is None:
+            return start, start + timedelta(minutes=minutes)
+        end_day = day if g[6] is None else datetime(int(g[6]), int(g[7]), int(g[8]))
+        hour, minute = _clock(g[9], g[10], g[11])
+        end = end_day.replace(hour=hour, minute=minute)
+        if g[11] and not g[5] and int(g[3]) <= 12:
+            # "9-11am" is 9am to 11am, "11-1pm" is 11am to 1pm
+            hour, minute = _clock(g[3], g[4], g[11])
+            if day.replace(hour=hour, minute=minute) < end:
+                start = day.replace(hour=hour, minute=minute)
+    except ValueError:
+        return None
+    if end <= start:
+        return None
+    return start, end
+
+
+def format_slot(start, end):
+    if end.date() == start.date():
+        return f"{start:%Y-%m-%d %H:%M}-{end:%H:%M}"
+    return f"{start:%Y-%m-%d %H:%M}-{end:%Y-%m-%d %H:%M}"
+
+
+def canonical_slot(text):
+    """The canonical form of a slot string; text that doesn't parse is returned unchanged."""
+    if _CANONICAL.match(text):
+        return text
+    interval = parse_slot(text)
+    return text if interval is None else format_slot(*interval)
+
+
+def normalize_slots(texts, minutes=DEFAULT_MINUTES, keep=()):
+    """Canonical, chronologically sorted slot strings for a doctor.
+
+    Raises ValueError naming the first slot that can't be read or that
+    overlaps another one. Unreadable slots found in `keep` (the doctor's
+    current slots, which may hold labels kept by the migration) are kept
+    as they are, after the timed ones.
+    """
+    intervals = []
+    labels = []
+    for text in texts:
+        interval = parse_slot(text, minutes)
+        if interval is None:
+            if text not in keep:
+                raise ValueError(f"Could not read slot '{text}'. Use {SLOT_FORMAT_HELP}.")
+            labels.append(text)
+            continue
+        intervals.append(interval)
+    intervals.sort()
+    for (s1, e1), (s2, e2) in zip(intervals, intervals[1:]):
+        if s2 < e1:
+            raise ValueError(f"Slots {format_slot(s1, e1)} and {format_slot(s2, e2)} overlap.")
+    return [format_slot(s, e) for s, e in intervals] + list(dict.fromkeys(labels))
+
+
+def week_of(moment):
+    """Midnight on the Monday of the week containing `moment`."""
+    day = datetime(moment.year, moment.month, moment.day)
+    return day - timedelta(days=day.weekday())
+
+
+def _day(text, rule):
+    for i, name in enumerate(DAYS):
+        if text.lower() == name.lower():
+            return i
+    raise ValueError(f"Unknown day '{text}' in weekly hours '{rule}'. Use {RULE_FORMAT_HELP}.")
+
+
+def parse_rule(text):
+    """(days, start, end, minutes) for a weekly rule such as "Mon-Fri 09:00-12:00/20".
+
+    `days` are weekday numbers (Monday is 0); `start` and `end` are minutes
+    since midnight. A rule without "/minutes" makes 30 minute slots.
+    """
+    m = _RULE.match(text)
+    if m is None:
+        raise ValueError(f"Could not read weekly hours '{text}'. Use {RULE_FORMAT_HELP}.")
+    first, last, h1, m1, h2, m2, minutes = m.groups()
+    if first.lower() == "daily":
+        days = tuple(range(7))
+    else:
+        first = _day(first, text)
+        count = 1 if last is None else (_day(last, text) - first) % 7 + 1
+        days = tuple((first + i) % 7 for i in range(count))
+    start, end = int(h1) * 60 + int(m1), int(h2) * 60 + int(m2)
+    minutes = int(minutes or DEFAULT_MINUTES)
+    if int(m1) > 59 or int(m2) > 59 or not 0 <= start < end <= 24 * 60 or not 0 < minutes <= end - start:
+        raise ValueError(f"Weekly hours '{text}' are not a valid time range.")
+    return days, start, end, minutes
+
+
+def format_rule(rule):
+    days, start, end, minutes = rule
+    if len(days) == 7:
+        names = "Daily"
+    elif len(days) == 1:
+        names = DAYS[days[0]]
+    else:
+        names = f"{DAYS[days[0]]}-{DAYS[days[-1]]}"
+    return f"{names} {start // 60:02d}:{start % 60:02d}-{end // 60:02d}:{end % 60:02d}/{minutes}"
+
+
+def parse_leave(text):
+    """(first day, last day) as dates for "2025-12-25" or "2025-12-20..2025-12-31"."""
+    m = _LEAVE.match(text)
+    try:
+        first = date(*map(int, m.group(1).split("-")))
+        last = first if m.group(2) is None else date(*map(int, m.group(2).split("-")))
+    except (AttributeError, ValueError):
+        raise ValueError(f"Could not read leave '{text}'. Use {LEAVE_FORMAT_HELP}.") from None
+    if last < first:
+        raise ValueError(f"Leave '{text}' ends before it starts.")
+    return first, last
+
+
+def format_leave(leave):
+    first, last = leave
+    return first.isoformat() if first == last else f"{first.isoformat()}..{last.isoformat()}"
+
+
+def normalize_template(weekly, leave):
+    """Canonical weekly rules and leave entries; ValueError if any can't be read or rules overlap."""
+    rules = [parse_rule(text) for text in weekly]
+    for day in range(7):
+        hours = sorted((start, end) for days, start, end, _ in rules if day in days)
+        for (s1, e1), (s2, e2) in zip(hours, hours[1:]):
+            if s2 < e1:
+                raise ValueError(f"Weekly hours overlap on {DAYS[day]}.")
+    return [format_rule(r) for r in rules], sorted(format_leave(parse_leave(text)) for text in leave)
+
+
+class Availability:
+    """Concrete slots expanded from doctors' weekly templates, a week at a time.
+
+    A doctor's 'weekly' rules (e.g. "Mon-Fri 09:00-12:00/30") less the
+    days in its 'leave' list are only turned into slots for weeks that
+    are looked at. Expanded weeks are cached and the least recently used
+    are evicted past `max_weeks`. Cache entries remember the doctor
+    record they came from; records are replaced on edit, so an edited
+    doctor never sees a stale expansion.
+    """
+
+    def __init__(self, max_weeks=4096):
+        self.max_weeks = max_weeks
+        self._rules = {}             # doctor id -> (record, rules, leave)
+        self._weeks = OrderedDict()  # (doctor id, week start) -> (record, [(start, end, slot)])
+
+    def _parsed(self, doctor):
+        cached = self._rules.get(doctor.id)
+        if cached is None or cached[0] is not doctor:
+            rules = [parse_rule(text) for text in doctor.weekly]
+            leave = [parse_leave(text) for text in doctor.leave]
+            cached = self._rules[doctor.id] = (doctor, rules, leave)
+        return cached[1], cached[2]
+
+    def week(self, doctor, week_start):
+        """(start, end, slot) for every template slot in the week starting `week_start`."""
+        if not doctor.weekly:
+            return []
+        key = (doctor.id, week_start)
+        cached = self._weeks.get(key)
+        if cached is not None and cached[0] is doctor:
+            self._weeks.move_to_end(key)
+            return cached[1]
+        rules, leave = self._parsed(doctor)
+        slots = []
+        for offset in range(7):
+            day = week_start + timedelta(days=offset)
+            if any(first <= day.date() <= last for first, last in leave):
+                continue
+            for days, start, end, minutes in rules:
+                if day.weekday() in days:
+                    for t in range(start, end - minutes + 1, minutes):
+                        begin = day + timedelta(minutes=t)
+                        finish = begin + timedelta(minutes=minutes)
+                        slots.append((begin, finish, format_slot(begin, finish)))
+        slots.sort()
+        self._weeks[key] = (doctor, slots)
+        if len(self._weeks) > self.max_weeks:
+            self._weeks.popitem(last=False)
+        return slots
+
+    def between(self, doctor, start, end):
+        """Template slots of `doctor` starting in [start, end), in time order."""
+        found = []
+        week = week_of(start)
+        while week < end and doctor.weekly:
+            found.extend(e for e in self.week(doctor, week) if start <= e[0] < end)
+            week += WEEK
+        return found
+
+    def offers(self, doctor, slot):
+        interval = parse_slot(slot)
+        if interval is None or not doctor.weekly:
+            return False
+        return any(e[2] == slot for e in self.week(doctor, week_of(interval[0])))
+
+    def forget(self, doctor_id):
+        self._rules.pop(doctor_id, None)
+
+
+class SlotIndex:
+    """Free timed slots kept in start-time order, overall and per specialty.
+
+    Each list holds (start, end, doctor_id, slot) tuples, so the earliest
+    free slot after a time, or every free slot in a window, is a bisect
+    plus the results. Booking or releasing a slot is one bisect and one
+    insert or delete per list. Slots that don't parse (legacy free text)
+    are simply not indexed.
+
+    Explicit slots are always indexed. Slots from weekly templates are
+    added a week at a time when a query reaches that week, and the least
+    recently queried weeks beyond `max_weeks` are dropped again.
+    """
+
+    def __init__(self, availability=None, max_weeks=26):
+        self.availability = availability or Availability()
+        self.max_weeks = max_weeks
+        self.free = {None: []}
+        self.doctors = {}    # doctor id -> (spec, {slot: (start, end)}) for explicit slots
+        self.templated = {}  # doctor id -> record, for doctors with weekly templates
+        self.template_specs = Counter()
+        self.weeks = OrderedDict()  # week start of each indexed template week
+        self.booked = {}
+
+    def build(self, doctors, booked):
+        self.free = {None: []}
+        self.doctors = {}
+        self.templated = {}
+        self.template_specs = Counter()
+        self.weeks = OrderedDict()
+        # The Hospital's own doctor id -> {slot: count} dict, kept up to date by it
+        self.booked = booked
+        for d in doctors:
+            times = self._times(d)
+            taken = booked.get(d.id, {})
+            for slot, (start, end) in times.items():
+                if slot not in taken:
+                    entry = (start, end, d.id, slot)
+                    self.free[None].append(entry)
+                    self.free.setdefault(d.spec, []).append(entry)
+        for entries in self.free.values():
+            entries.sort()
+
+    def _times(self, doctor):
+        times = {}
+        for slot in doctor.slots:
+            interval = parse_slot(slot)
+            if interval is not None:
+                times[slot] = interval
+        self.doctors[doctor.id] = (doctor.spec, times)
+        if doctor.weekly:
+            self.templated[doctor.id] = doctor
+            self.template_specs[doctor.spec] += 1
+        return times
+
+    def _lists(self, spec):
+        return (self.free[None], self.free.setdefault(spec, []))
+
+    def _template_slots(self, doctor, week):
+        # Template slots that aren't also explicit slots, booked or not
+        times = self.doctors[doctor.id][1]
+        return [e for e in self.availability.week(doctor, week) if e[2] not in times]
+
+    def add_doctor(self, doctor, booked):
+        for slot, (start, end) in self._times(doctor).items():
+            if slot not in booked:
+                for entries in self._lists(doctor.spec):
+                    insort(entries, (start, end, doctor.id, slot))
+        if doctor.weekly:
+            for week in self.weeks:
+                for start, end, slot in self._template_slots(doctor, week):
+                    if slot not in booked:
+                        for entries in self._lists(doctor.spec):
+                            insort(entries, (start, end, doctor.id, slot))
+
+    def remove_doctor(self, doctor):
+        spec, times = self.doctors.get(doctor.id, (None, {}))
+        for slot, (start, end) in times.items():
+            self._discard(spec, (start, end, doctor.id, slot))
+        if self.templated.pop(doctor.id, None) is not None:
+            self.template_specs[spec] -= 1
+            for week in self.weeks:
+                for start, end, slot in self._template_slots(doctor, week):
+                    self._discard(spec, (start, end, doctor.id, slot))
+        self.doctors.pop(doctor.id, None)
+
+    def _discard(self, spec, entry):
+        for entries in self._lists(spec):
+            pos = bisect_left(entries, entry)
+            if pos < len(entries) and entries[pos] == entry:
+                del entries[pos]
+
+    def _entry(self, doctor_id, slot):
+        # The index entry for a slot of this doctor, if it is currently indexed
+        spec, times = self.doctors.get(doctor_id, (None, {}))
+        if slot in times:
+            return spec, times[slot] + (doctor_id, slot)
+        doctor = self.templated.get(doctor_id)
+        interval = parse_slot(slot) if doctor is not None else None
+        if interval is not None and week_of(interval[0]) in self.weeks and self.availability.offers(doctor, slot):
+            return spec, interval + (doctor_id, slot)
+        return spec, None
+
+    def book(self, doctor_id, slot):
+        spec, entry = self._entry(doctor_id, slot)
+        if entry is not None:
+            self._discard(spec, entry)
+
+    def release(self, doctor_id, slot):
+        spec, entry = self._entry(doctor_id, slot)
+        if entry is not None:
+            for entries in self._lists(spec):
+                pos = bisect_left(entries, entry)
+                if pos == len(entries) or entries[pos] != entry:
+                    entries.insert(pos, entry)
+
+    def _materialize(self, week):
+        if week in self.weeks:
+            self.weeks.move_to_end(week)
+            return
+        added = {None: []}
+        for doctor_id, doctor in self.templated.items():
+            taken = self.booked.get(doctor_id, {})
+            for start, end, slot in self._template_slots(doctor, week):
+                if slot not in taken:
+                    entry = (start, end, doctor_id, slot)
+                    added[None].append(entry)
+                    added.setdefault(doctor.spec, []).append(entry)
+        for spec, new in added.items():
+            # Two sorted runs, which sort() merges in linear time
+            entries = self.free.setdefault(spec, [])
+            entries.extend(new)
+            entries.sort()
+        self.weeks[week] = True
+        if len(self.weeks) > self.max_weeks:
+            self._evict(self.weeks.popitem(last=False)[0])
+
+    def _evict(self, week):
+        for entries in self.free.values():
+            lo = bisect_left(entries, (week,))
+            hi = bisect_left(entries, (week + WEEK,))
+            entries[lo:hi] = [e for e in entries[lo:hi] if e[3] in self.doctors[e[2]][1]]
+
+    def _has_templates(self, spec):
+        return bool(self.templated) if spec is None else self.template_specs[spec] > 0
+
+    def earliest(self, spec=None, after=None):
+        """The first free (start, end, doctor_id, slot) starting at or after `after` (default now)."""
+        if after is None:
+            after = datetime.now()
+        if self._has_templates(spec):
+            week = week_of(after)
+            for _ in range(HORIZON_WEEKS):
+                self._materialize(week)
+                entries = self.free.get(spec, ())
+                pos = bisect_left(entries, (after,))
+                if pos < len(entries) and entries[pos][0] < week + WEEK:
+                    return entries[pos]
+                week += WEEK
+        entries = self.free.get(spec, [])
+        pos = bisect_left(entries, (after,))
+        return entries[pos] if pos < len(entries) else None
+
+    def window(self, start, end, spec=None, limit=None):
+        """Free slots starting in [start, end), in time order."""
+        if not self._has_templates(spec):
+            entries = self.free.get(spec, [])
+            lo = bisect_left(entries, (start,))
+            hi = bisect_left(entries, (end,))
+            if limit is not None:
+                hi = min(hi, lo + limit)
+            return entries[lo:hi]
+        found = []
+        week = week_of(start)
+        while week < end and (limit is None or len(found) < limit):
+            self._materialize(week)
+            entries = self.free.get(spec, ())
+            lo = bisect_left(entries, (max(start, week),))
+            hi = bisect_left(entries, (min(end, week + WEEK),))
+            if limit is not None:
+                hi = min(hi, lo + limit - len(found))
+            found.extend(entries[lo:hi])
+            week += WEEK
+        return found
+
+    def specialties(self):
+        return sorted({spec for spec, _ in self.doctors.values()})
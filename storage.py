@@ -0,0 +1,958 @@
+import json
+import mmap
+import os
+import queue
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import datetime
+
+from analytics import summarize
+from diagnostics import STATS
+from models import MODELS, Doctor, encode, rows
+from slots import week_of
+from trash import Trash
+
+SNAPSHOT_FILE = "hospital_data.json"
+
+# First line of a sectioned snapshot; the second is a JSON header giving
+# each section's [offset, length, count] from the end of the header line
+SECTIONED_MAGIC = b"HABS-SECTIONS 1\n"
+# Read by load(); past appointments wait for first use
+EAGER_SECTIONS = ("patients", "doctors", "appointments", "waitlist")
+
+
+def empty_state():
+    # "trash" only holds what older data files kept with the records; the
+    # trash now has its own part of the store, see trash.py
+    return {
+        "patients": [],
+        "doctors": [],
+        "appointments": [],
+        "waitlist": [],
+        "trash": {"patients": [], "doctors": [], "appointments": []}
+    }
+
+
+def change(op, kind, index=None, value=None, record_id=None):
+    # A single mutation: op is append/replace/remove/clear, kind is a list
+    # name such as "patients" or "trash.doctors". Removals also carry the
+    # record id so backends that do not keep list positions can find it.
+    c = {"op": op, "kind": kind}
+    if index is not None:
+        c["index"] = index
+    if value is not None:
+        c["value"] = value
+    if record_id is not None:
+        c["id"] = record_id
+    return c
+
+
+def _target(state, kind):
+    if kind.startswith("trash."):
+        return state["trash"][kind[len("trash."):]]
+    return state[kind]
+
+
+def apply_change(state, c):
+    """Apply one change to state in place and return the value it displaced."""
+    items = _target(state, c["kind"])
+    op = c["op"]
+    if op == "append":
+        items.append(c["value"])
+        return None
+    if op == "replace":
+        old = items[c["index"]]
+        items[c["index"]] = c["value"]
+        return old
+    if op == "remove":
+        return items.pop(c["index"])
+    if op == "clear":
+        old = list(items)
+        items.clear()
+        return old
+    raise ValueError(f"Unknown change op: {op}")
+
+
+def _row_id(row):
+    return row[0] if isinstance(row, list) else row.get("id")
+
+
+def _locate(state, c):
+    # The change may have been made after past appointments were read in at
+    # the end of the list, so replace/remove find their appointment by id
+    items = state["appointments"]
+    record_id = c["id"] if "id" in c else _row_id(c["value"])
+    index = c.get("index")
+    if index is not None and index < len(items) and _row_id(items[index]) == record_id:
+        return c
+    while True:
+        for i, row in enumerate(items):
+            if _row_id(row) == record_id:
+                return dict(c, index=i)
+        history = state.get("history")
+        if not isinstance(history, Section):
+            return c
+        items.extend(history.read())
+        state["history"] = None
+
+
+def _encode(record):
+    payload = json.dumps(record, separators=(",", ":"), default=encode).encode("utf-8")
+    return b"%08x %s\n" % (zlib.crc32(payload), payload)
+
+
+def _decode(line):
+    # Anything that is not a complete, checksummed line is a torn write
+    if not line.endswith(b"\n"):
+        return None
+    crc, _, payload = line[:-1].partition(b" ")
+    try:
+        if int(crc, 16) != zlib.crc32(payload):
+            return None
+        return json.loads(payload)
+    except ValueError:
+        return None
+
+
+def _fsync_dir(path):
+    # Make a rename durable; not every platform can open a directory
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def open_storage(path):
+    """Pick a backend from the file name: SQLite for .db/.sqlite, JSON otherwise."""
+    if os.path.splitext(path)[1].lower() in (".db", ".sqlite", ".sqlite3"):
+        return SqliteStorage(path)
+    return JournalStore(path)
+
+
+class Section:
+    """A list in a sectioned snapshot that is read from disk on first use.
+
+    Records appended before then are kept in `appended` and come after
+    the stored ones; read() returns both.
+    """
+
+    def __init__(self, store, name, count):
+        self.store = store
+        self.name = name
+        self.count = count
+        self.appended = []
+        self.origin = self
+
+    def __len__(self):
+        return self.count + len(self.appended)
+
+    def append(self, record):
+        self.appended.append(record)
+
+    def copy(self):
+        copy = Section(self.store, self.name, self.count)
+        copy.appended = list(self.appended)
+        copy.origin = self.origin
+        return copy
+
+    def read(self):
+        return self.store.read_section(self)
+
+    def _written(self, n):
+        # A compaction stored the first n appended records with the rest
+        self.count += n
+        del self.appended[:n]
+
+
+class Storage:
+    """Interface shared by the storage backends used by Hospital.
+
+    load() returns the full state dict, append() durably records the
+    changes of one user action, and compact() replaces the stored state
+    wholesale. `records` counts changes not yet folded into a snapshot.
+    """
+
+    records = 0
+
+    def load(self):
+        raise NotImplementedError
+
+    def append(self, changes):
+        raise NotImplementedError
+
+    def needs_compaction(self):
+        return False
+
+    def compact(self, state):
+        raise NotImplementedError
+
+    def load_trash(self):
+        """All stored trash ops, oldest first (see trash.Trash)."""
+        raise NotImplementedError
+
+    def append_trash(self, ops):
+        raise NotImplementedError
+
+    def compact_trash(self, ops):
+        """Replace the stored trash with `ops`."""
+
+    def purge_trash(self, now=None):
+        """Drop expired trash entries, reading the trash here rather than into the app."""
+        Trash(self).purge(now)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class JournalStore(Storage):
+    """Snapshot file plus an append-only journal of changes.
+
+    Every commit appends one checksummed line to the journal. Compaction
+    writes a new snapshot (atomically, via a temp file) tagged with the
+    last journal sequence number it contains, then truncates the journal.
+    Loading replays the journal records newer than the snapshot and stops
+    at the first torn or corrupt record.
+
+    Snapshots are sectioned: a header gives the offset of each list, and
+    load() only parses the active patients and doctors, the upcoming
+    appointments and the waitlist. The appointments whose slot started before
+    `history_before` are handed out as a Section and read (through a
+    memory map where the platform allows) when first needed; the header
+    keeps a summary of them for the dashboard (see analytics.py). Older
+    single-document JSON snapshots are still read.
+
+    The trash is kept in a second checksummed log of trash ops next to
+    the snapshot, which compact_trash() rewrites.
+    """
+
+    def __init__(self, path=SNAPSHOT_FILE, journal_path=None, max_records=500,
+                 max_bytes=1 << 20, fsync=True):
+        self.path = path
+        self.journal_path = journal_path or os.path.splitext(path)[0] + ".journal"
+        self.trash_path = os.path.splitext(self.journal_path)[0] + ".trash"
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        self.seq = 0
+        self.records = 0
+        self.journal_bytes = 0
+        self._journal = None
+        self._trash = None
+        self.sections = None
+        self.history_before = None
+        self.history_summary = None
+        self.lock = threading.RLock()
+        self._file = None
+        self._map = None
+        self._body = 0
+
+    def _open_snapshot(self):
+        f = open(self.path, "rb")
+        if f.read(len(SECTIONED_MAGIC)) != SECTIONED_MAGIC:
+            f.close()
+            return None
+        header = json.loads(f.readline())
+        self._file = f
+        self._body = f.tell()
+        try:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # Not mappable here; sections are read with seek() instead
+            self._map = None
+        self.sections = header["sections"]
+        self.history_before = header["history_before"]
+        self.history_summary = header.get("history_summary")
+        return header
+
+    def _close_snapshot(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self.sections = None
+
+    def _read(self, name):
+        offset, length, _ = self.sections[name]
+        start = self._body + offset
+        if self._map is not None:
+            return self._map[start:start + length]
+        self._file.seek(start)
+        return self._file.read(length)
+
+    def read_section(self, section):
+        with self.lock:
+            return json.loads(self._read(section.name)) + section.appended
+
+    def load(self):
+        state = empty_state()
+        snapshot_seq = 0
+        with self.lock:
+            self._close_snapshot()
+            header = self._open_snapshot() if os.path.exists(self.path) else None
+        if header is not None:
+            snapshot_seq = header["seq"]
+            for name in EAGER_SECTIONS:
+                # Snapshots from before the waitlist have no section for it
+                if name in self.sections:
+                    state[name] = json.loads(self._read(name))
+            # Snapshots written before the trash had its own log
+            for kind in state["trash"]:
+                if "trash." + kind in self.sections:
+                    state["trash"][kind] = Section(self, "trash." + kind, self.sections["trash." + kind][2])
+            state["history"] = Section(self, "history", self.sections["history"][2])
+            state["history_before"] = self.history_before
+            state["history_summary"] = self.history_summary
+            state["doctor_specs"] = header.get("doctor_specs", {})
+            state["next_ids"] = header["next_ids"]
+        elif os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                data = json.load(f)
+            snapshot_seq = data.pop("seq", 0)
+            state.update(data)
+        self.seq = snapshot_seq
+        self.records = 0
+        self.journal_bytes = 0
+        if os.path.exists(self.journal_path):
+            valid = 0
+            with open(self.journal_path, "rb") as f:
+                for line in f:
+                    record = _decode(line)
+                    if record is None:
+                        break
+                    valid += len(line)
+                    # Records already folded into the snapshot (crash between
+                    # snapshot rename and journal truncation) are skipped
+                    if record["seq"] <= snapshot_seq:
+                        continue
+                    for c in record["changes"]:
+                        self._replay(state, c)
+                    self.seq = record["seq"]
+                    self.records += 1
+            if valid < os.path.getsize(self.journal_path):
+                with open(self.journal_path, "r+b") as f:
+                    f.truncate(valid)
+            self.journal_bytes = valid
+        return state
+
+    def _replay(self, state, c):
+        # Sections still on disk are read in when a change needs their records
+        kind = c["kind"]
+        items = _target(state, kind)
+        if isinstance(items, Section) and c["op"] != "append":
+            state["trash"][kind[len("trash."):]] = items.read()
+        elif kind == "appointments" and c["op"] in ("replace", "remove") and "history" in state:
+            c = _locate(state, c)
+        elif c["op"] == "append" and kind in EAGER_SECTIONS:
+            # A record added and deleted since the snapshot must not have its
+            # id handed out again; the trash may still hold it
+            record_id = _row_id(c["value"])
+            next_ids = state.setdefault("next_ids", {})
+            if record_id is not None and record_id >= next_ids.get(kind, 1):
+                next_ids[kind] = record_id + 1
+        old = apply_change(state, c)
+        if kind == "doctors" and c["op"] in ("remove", "clear"):
+            # Their appointments still count under the doctor's specialty
+            specs = state.setdefault("doctor_specs", {})
+            for row in (old if c["op"] == "clear" else [old]):
+                if _row_id(row) is not None:
+                    specs[str(_row_id(row))] = row[2] if isinstance(row, list) else row["spec"]
+
+    def append(self, changes):
+        # All changes of one user action go into a single record so they are
+        # replayed together or not at all
+        self.seq += 1
+        line = _encode({"seq": self.seq, "changes": list(changes)})
+        if self._journal is None:
+            self._journal = open(self.journal_path, "ab")
+        self._journal.write(line)
+        self._journal.flush()
+        STATS.add_bytes("journal", len(line))
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+        self.records += 1
+        self.journal_bytes += len(line)
+
+    def needs_compaction(self):
+        return self.records >= self.max_records or self.journal_bytes >= self.max_bytes
+
+    def load_trash(self):
+        ops = []
+        if not os.path.exists(self.trash_path):
+            return ops
+        valid = 0
+        with open(self.trash_path, "rb") as f:
+            for line in f:
+                record = _decode(line)
+                if record is None:
+                    break
+                valid += len(line)
+                ops.extend(record["ops"])
+        if valid < os.path.getsize(self.trash_path):
+            with open(self.trash_path, "r+b") as f:
+                f.truncate(valid)
+        return ops
+
+    def append_trash(self, ops):
+        if self._trash is None:
+            self._trash = open(self.trash_path, "ab")
+        line = _encode({"ops": list(ops)})
+        self._trash.write(line)
+        self._trash.flush()
+        STATS.add_bytes("trash", len(line))
+        if self.fsync:
+            os.fsync(self._trash.fileno())
+
+    def compact_trash(self, ops):
+        tmp = self.trash_path + ".tmp"
+        line = _encode({"ops": list(ops)})
+        with open(tmp, "wb") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        STATS.add_bytes("trash", len(line))
+        if self._trash is not None:
+            self._trash.close()
+            self._trash = None
+        os.replace(tmp, self.trash_path)
+        _fsync_dir(self.trash_path)
+
+    def _section_bytes(self, records):
+        # Records are written as rows of field values, see models.encode;
+        # a Section not read yet is copied over without being parsed
+        stored, extra = b"[]", records
+        if isinstance(records, Section):
+            stored, extra = self._read(records.name), records.appended
+        if not extra:
+            return stored
+        data = json.dumps(rows(extra), separators=(",", ":")).encode("utf-8")
+        return data if stored == b"[]" else stored[:-1] + b"," + data[1:]
+
+    def compact(self, state):
+        with self.lock:
+            self._compact(state)
+
+    def _compact(self, state):
+        history = state.get("history")
+        if isinstance(history, Section):
+            # Past appointments not read in yet keep their cutoff and summary
+            before = self.history_before
+            summary = self.history_summary
+            upcoming = state["appointments"]
+        else:
+            now = datetime.now()
+            before = now.strftime("%Y-%m-%d %H:%M")
+            history = [a for a in state["appointments"] if a.slot < before]
+            upcoming = [a for a in state["appointments"] if not a.slot < before]
+            summary = summarize(history, state["doctors"], week_of(now).strftime("%Y-%m-%d %H:%M"))
+        lists = {"patients": state["patients"], "doctors": state["doctors"], "appointments": upcoming,
+                 "waitlist": state.get("waitlist", []), "history": history}
+        sections = {}
+        body = []
+        offset = 0
+        for name, records in lists.items():
+            data = self._section_bytes(records)
+            sections[name] = [offset, len(data), len(records)]
+            body.append(data)
+            offset += len(data)
+        header = {"seq": self.seq, "next_ids": state.get("next_ids", {}), "history_before": before,
+                  "history_summary": summary, "doctor_specs": state.get("doctor_specs", {}),
+                  "sections": sections}
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(SECTIONED_MAGIC)
+            f.write(json.dumps(header).encode("utf-8") + b"\n")
+            for data in body:
+                f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+            STATS.add_bytes("snapshot", f.tell())
+        # Some platforms can't replace a file that is open or mapped
+        self._close_snapshot()
+        try:
+            os.replace(tmp, self.path)
+            _fsync_dir(self.path)
+        finally:
+            self._open_snapshot()
+        for records in lists.values():
+            if isinstance(records, Section):
+                records.origin._written(len(records.appended))
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        open(self.journal_path, "wb").close()
+        self.records = 0
+        self.journal_bytes = 0
+
+    def close(self):
+        for f in (self._journal, self._trash):
+            if f is not None:
+                f.close()
+        self._journal = self._trash = None
+        with self.lock:
+            self._close_snapshot()
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS patients (
+    id INTEGER PRIMARY KEY, pos INTEGER NOT NULL, name TEXT NOT NULL, age INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS patients_pos ON patients(pos);
+CREATE INDEX IF NOT EXISTS patients_name ON patients(name);
+CREATE TABLE IF NOT EXISTS doctors (
+    id INTEGER PRIMARY KEY, pos INTEGER NOT NULL, name TEXT NOT NULL, spec TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS doctors_pos ON doctors(pos);
+CREATE INDEX IF NOT EXISTS doctors_spec ON doctors(spec);
+CREATE TABLE IF NOT EXISTS slots (
+    doctor_id INTEGER NOT NULL, pos INTEGER NOT NULL, slot TEXT NOT NULL,
+    PRIMARY KEY (doctor_id, pos));
+CREATE TABLE IF NOT EXISTS availability (
+    doctor_id INTEGER NOT NULL, kind TEXT NOT NULL, pos INTEGER NOT NULL, rule TEXT NOT NULL,
+    PRIMARY KEY (doctor_id, kind, pos));
+CREATE TABLE IF NOT EXISTS appointments (
+    id INTEGER PRIMARY KEY, pos INTEGER NOT NULL, patient_id INTEGER NOT NULL,
+    doctor_id INTEGER NOT NULL, slot TEXT NOT NULL, status TEXT NOT NULL DEFAULT 'booked',
+    history INTEGER NOT NULL DEFAULT 0);
+CREATE INDEX IF NOT EXISTS appointments_pos ON appointments(pos);
+CREATE INDEX IF NOT EXISTS appointments_history ON appointments(history, pos);
+CREATE INDEX IF NOT EXISTS appointments_doctor_slot ON appointments(doctor_id, slot);
+CREATE INDEX IF NOT EXISTS appointments_patient ON appointments(patient_id);
+CREATE TABLE IF NOT EXISTS waitlist (
+    id INTEGER PRIMARY KEY, pos INTEGER NOT NULL, patient_id INTEGER NOT NULL, doctor_id INTEGER,
+    spec TEXT NOT NULL, urgency INTEGER NOT NULL, requested TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS waitlist_pos ON waitlist(pos);
+CREATE TABLE IF NOT EXISTS trash (
+    kind TEXT NOT NULL, id INTEGER NOT NULL, pos INTEGER NOT NULL, data TEXT NOT NULL,
+    deleted_at REAL NOT NULL DEFAULT 0, PRIMARY KEY (kind, id));
+CREATE INDEX IF NOT EXISTS trash_pos ON trash(kind, pos);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS doctor_specs (id INTEGER PRIMARY KEY, spec TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS snapshot (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS trash_deleted ON trash(deleted_at);
+"""
+
+# Set in meta by compact(), which only ever writes migrated records
+MIGRATED = "migrated"
+
+# Columns stored for each active table, in order; doctors' slots and their
+# weekly hours and leave live in their own tables
+_COLUMNS = {
+    "patients": ("id", "name", "age"),
+    "doctors": ("id", "name", "spec"),
+    "appointments": ("id", "patient_id", "doctor_id", "slot", "status"),
+    "waitlist": ("id", "patient_id", "doctor_id", "spec", "urgency", "requested"),
+}
+
+
+class SqliteStorage(Storage):
+    """SQLite database with one indexed table per record type.
+
+    Each append() is one transaction. Rows keep a `pos` column so lists
+    come back in the order the app shows them. As with a sectioned JSON
+    snapshot, compact() marks the appointments whose slot started before
+    now as `history`; load() leaves those out and hands them out as a
+    Section, read with one query when first needed, and the `snapshot`
+    table keeps the cutoff and their summary. The trash table is not part
+    of load(); trash ops are applied to its rows directly. Records are
+    only ever written from loaded models, so once a database has been
+    compacted (see MIGRATED) they need no migrating on load.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # Writes may come from the BackgroundWriter thread
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.RLock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(trash)")]
+        if columns and "deleted_at" not in columns:
+            # Databases from before trash retention: their entries count
+            # as deleted now
+            with self.conn:
+                self.conn.execute("ALTER TABLE trash ADD COLUMN deleted_at REAL NOT NULL DEFAULT 0")
+                self.conn.execute("UPDATE trash SET deleted_at = ?", (time.time(),))
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(appointments)")]
+        if columns and "status" not in columns:
+            # Databases from before appointment statuses: all still booked
+            with self.conn:
+                self.conn.execute("ALTER TABLE appointments ADD COLUMN status TEXT NOT NULL DEFAULT 'booked'")
+        if columns and "history" not in columns:
+            # Databases from before past appointments were kept aside; the
+            # next compaction marks them
+            with self.conn:
+                self.conn.execute("ALTER TABLE appointments ADD COLUMN history INTEGER NOT NULL DEFAULT 0")
+        self.conn.executescript(_SCHEMA)
+
+    def load(self):
+        state = empty_state()
+        with self.lock:
+            for kind in _COLUMNS:
+                state[kind] = self._records(kind)
+            if self.conn.execute("SELECT 1 FROM meta WHERE key = ?", (MIGRATED,)).fetchone():
+                # Like a sectioned snapshot; databases compacted before past
+                # appointments were kept aside have no cutoff yet
+                snapshot = {key: json.loads(value) for key, value in self.conn.execute("SELECT key, value FROM snapshot")}
+                state["history_before"] = snapshot.get("history_before")
+                if state["history_before"] is not None:
+                    count = self.conn.execute("SELECT COUNT(*) FROM appointments WHERE history = 1").fetchone()[0]
+                    state["history"] = Section(self, "history", count)
+                    state["history_summary"] = snapshot.get("history_summary")
+        state["next_ids"] = {key[len("next_id."):]: value for key, value in
+                             self.conn.execute("SELECT key, value FROM meta WHERE key LIKE 'next_id.%'")}
+        state["doctor_specs"] = dict(self.conn.execute("SELECT id, spec FROM doctor_specs"))
+        return state
+
+    def _slots(self):
+        slots = {}
+        for doctor_id, slot in self.conn.execute("SELECT doctor_id, slot FROM slots ORDER BY doctor_id, pos"):
+            slots.setdefault(doctor_id, []).append(slot)
+        return slots
+
+    def _availability(self):
+        rules = {}
+        for doctor_id, kind, rule in self.conn.execute(
+                "SELECT doctor_id, kind, rule FROM availability ORDER BY doctor_id, kind, pos"):
+            rules.setdefault(doctor_id, {}).setdefault(kind, []).append(rule)
+        return rules
+
+    def read_section(self, section):
+        with self.lock:
+            return self._records("appointments", history=1) + section.appended
+
+    def _records(self, kind, history=0):
+        # One list in display order; for appointments, the upcoming or the past ones
+        columns = _COLUMNS[kind]
+        if kind == "appointments":
+            rows = self.conn.execute("SELECT %s FROM appointments WHERE history = ? ORDER BY pos" % ", ".join(columns),
+                                     (history,))
+        else:
+            rows = self.conn.execute("SELECT %s FROM %s ORDER BY pos" % (", ".join(columns), kind))
+        if kind != "doctors":
+            return [MODELS[kind](*row) for row in rows]
+        rows = rows.fetchall()
+        slots = self._slots()
+        rules = self._availability()
+        records = []
+        for row in rows:
+            doctor_rules = rules.get(row[0], {})
+            records.append(Doctor(*row, slots.get(row[0], ()), doctor_rules.get("weekly", ()),
+                                  doctor_rules.get("leave", ())))
+        return records
+
+    def count(self, kind):
+        with self.lock:
+            return self._count(kind)
+
+    def _count(self, kind):
+        if kind not in _COLUMNS:
+            raise ValueError(f"Unknown list: {kind}")
+        return self.conn.execute("SELECT COUNT(*) FROM %s" % kind).fetchone()[0]
+
+    def _next_pos(self, table, kind=None):
+        if kind is None:
+            row = self.conn.execute("SELECT MAX(pos) FROM %s" % table).fetchone()
+        else:
+            row = self.conn.execute("SELECT MAX(pos) FROM trash WHERE kind = ?", (kind,)).fetchone()
+        return (row[0] or 0) + 1
+
+    def _insert(self, kind, record, pos):
+        columns = _COLUMNS[kind]
+        self.conn.execute("INSERT INTO %s (pos, %s) VALUES (?, %s)" % (kind, ", ".join(columns), ", ".join("?" * len(columns))),
+                          (pos,) + tuple(getattr(record, c) for c in columns))
+        if kind == "doctors":
+            self._write_slots(record)
+        self.conn.execute("INSERT INTO meta (key, value) VALUES (?, ?) "
+                          "ON CONFLICT(key) DO UPDATE SET value = MAX(value, excluded.value)",
+                          ("next_id." + kind, record.id + 1))
+
+    def _write_slots(self, doctor):
+        self.conn.execute("DELETE FROM slots WHERE doctor_id = ?", (doctor.id,))
+        self.conn.executemany("INSERT INTO slots (doctor_id, pos, slot) VALUES (?, ?, ?)",
+                              [(doctor.id, i, s) for i, s in enumerate(doctor.slots)])
+        self.conn.execute("DELETE FROM availability WHERE doctor_id = ?", (doctor.id,))
+        self.conn.executemany("INSERT INTO availability (doctor_id, kind, pos, rule) VALUES (?, ?, ?, ?)",
+                              [(doctor.id, kind, i, rule) for kind in ("weekly", "leave")
+                               for i, rule in enumerate(getattr(doctor, kind))])
+
+    def _delete(self, kind, record_id=None):
+        if record_id is None:
+            if kind == "doctors":
+                self.conn.execute("DELETE FROM slots")
+                self.conn.execute("DELETE FROM availability")
+            self.conn.execute("DELETE FROM %s" % kind)
+            return
+        if kind == "doctors":
+            # Their appointments still count under the doctor's specialty
+            self.conn.execute("INSERT OR REPLACE INTO doctor_specs (id, spec) SELECT id, spec FROM doctors WHERE id = ?",
+                              (record_id,))
+            self.conn.execute("DELETE FROM slots WHERE doctor_id = ?", (record_id,))
+            self.conn.execute("DELETE FROM availability WHERE doctor_id = ?", (record_id,))
+        self.conn.execute("DELETE FROM %s WHERE id = ?" % kind, (record_id,))
+
+    def _apply(self, c):
+        kind, op = c["kind"], c["op"]
+        if kind == "appointments" and op in ("replace", "remove"):
+            self._unsummarize(c["value"].id if op == "replace" else c["id"])
+        if op == "append":
+            self._insert(kind, c["value"], self._next_pos(kind))
+        elif op == "replace":
+            columns = _COLUMNS[kind][1:]
+            self.conn.execute("UPDATE %s SET %s WHERE id = ?" % (kind, ", ".join(col + " = ?" for col in columns)),
+                              tuple(getattr(c["value"], col) for col in columns) + (c["value"].id,))
+            if kind == "doctors":
+                self._write_slots(c["value"])
+        elif op == "remove":
+            self._delete(kind, c["id"])
+        elif op == "clear":
+            if kind == "doctors":
+                self.conn.execute("INSERT OR REPLACE INTO doctor_specs (id, spec) SELECT id, spec FROM doctors")
+            self._delete(kind)
+        else:
+            raise ValueError(f"Unknown change op: {op}")
+
+    def append(self, changes):
+        with self.lock, self.conn:
+            for c in changes:
+                self._apply(c)
+
+    def _unsummarize(self, appointment_id):
+        # A past appointment changed after its summary was saved: like a
+        # JSON journal replay, the next load reads them all in and the next
+        # compaction sets them aside again
+        row = self.conn.execute("SELECT history FROM appointments WHERE id = ?", (appointment_id,)).fetchone()
+        if row is not None and row[0]:
+            self.conn.execute("UPDATE appointments SET history = 0 WHERE history = 1")
+            self.conn.execute("DELETE FROM snapshot")
+
+    def compact(self, state):
+        # Replace the whole database contents in one transaction
+        history = state.get("history")
+        with self.lock, self.conn:
+            for kind in _COLUMNS:
+                if kind == "appointments" and isinstance(history, Section):
+                    # Past appointments not read in yet keep their rows,
+                    # cutoff and summary
+                    self.conn.execute("DELETE FROM appointments WHERE history = 0")
+                else:
+                    self._delete(kind)
+                for pos, record in enumerate(state.get(kind, ())):
+                    self._insert(kind, record, pos)
+            if not isinstance(history, Section):
+                now = datetime.now()
+                before = now.strftime("%Y-%m-%d %H:%M")
+                past = [a for a in state.get("appointments", ()) if a.slot < before]
+                summary = summarize(past, state["doctors"], week_of(now).strftime("%Y-%m-%d %H:%M"))
+                self.conn.execute("UPDATE appointments SET history = 1 WHERE slot < ?", (before,))
+                self.conn.executemany("INSERT OR REPLACE INTO snapshot (key, value) VALUES (?, ?)",
+                                      [("history_before", json.dumps(before)), ("history_summary", json.dumps(summary))])
+            for kind, value in state.get("next_ids", {}).items():
+                self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", ("next_id." + kind, value))
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, 1)", (MIGRATED,))
+            self.conn.execute("DELETE FROM doctor_specs")
+            self.conn.executemany("INSERT INTO doctor_specs (id, spec) VALUES (?, ?)",
+                                  list(state.get("doctor_specs", {}).items()))
+
+    def load_trash(self):
+        with self.lock:
+            ops = [{"op": "policy", "max_age_days": days, "max_count": count} for days, count in self.conn.execute(
+                "SELECT a.value, b.value FROM meta a, meta b "
+                "WHERE a.key = 'trash.max_age_days' AND b.key = 'trash.max_count'")]
+            ops.extend({"op": "add", "kind": kind, "at": at, "value": json.loads(data)} for kind, at, data in
+                       self.conn.execute("SELECT kind, deleted_at, data FROM trash ORDER BY kind, pos"))
+            return ops
+
+    def _apply_trash(self, op):
+        if op["op"] == "add":
+            record = op["value"]
+            self.conn.execute("INSERT OR REPLACE INTO trash (kind, id, pos, data, deleted_at) VALUES (?, ?, ?, ?, ?)",
+                              (op["kind"], record.id, self._next_pos("trash", op["kind"]),
+                               json.dumps(record, default=encode), op["at"]))
+        elif op["op"] == "remove":
+            self.conn.executemany("DELETE FROM trash WHERE kind = ? AND id = ?",
+                                  [(op["kind"], record_id) for record_id in op["ids"]])
+        elif op["op"] == "clear":
+            self.conn.execute("DELETE FROM trash WHERE kind = ?", (op["kind"],))
+        elif op["op"] == "policy":
+            self.conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                                  [("trash.max_age_days", op["max_age_days"]), ("trash.max_count", op["max_count"])])
+        else:
+            raise ValueError(f"Unknown trash op: {op['op']}")
+
+    def append_trash(self, ops):
+        with self.lock, self.conn:
+            for op in ops:
+                self._apply_trash(op)
+
+    def compact_trash(self, ops):
+        # Removed entries are deleted from the table as they go, so there
+        # is nothing to fold; the table is still rewritten to renumber pos
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM trash")
+            for op in ops:
+                self._apply_trash(op)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def _freeze(state):
+    # Records are replaced, never mutated, once loaded, so copying the
+    # containers is enough to hand a consistent snapshot to another thread
+    frozen = {key: value.copy() if isinstance(value, (list, Section)) else value for key, value in state.items()}
+    if "next_ids" in state:
+        frozen["next_ids"] = dict(state["next_ids"])
+    return frozen
+
+
+class BackgroundWriter(Storage):
+    """Runs another backend's writes on a worker thread.
+
+    append() and compact() only queue work. The worker waits `delay`
+    seconds after the first queued item so that bursts of mutations are
+    written as one journal record or transaction. A queued compaction
+    supersedes every append queued before it; trash writes are made in
+    the order they were queued with the rest. Failures are collected in
+    `errors` for the UI thread to report. A failed write doesn't stop the
+    trash writes after it, and trash ops that failed are kept and written
+    before the next ones. The next save after any failure is a full
+    compaction, which also retries them, so nothing that was lost stays
+    lost.
+    """
+
+    def __init__(self, backend, delay=0.05):
+        self.backend = backend
+        self.delay = delay
+        self.errors = queue.Queue()
+        self._queue = queue.Queue()
+        # Set on the worker thread, read and cleared on the UI thread
+        self._lock = threading.Lock()
+        self._failed = False
+        self._unwritten_trash = []
+        self._thread = None
+
+    @property
+    def records(self):
+        return self.backend.records
+
+    def load(self):
+        state = self.backend.load()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="storage-writer", daemon=True)
+            self._thread.start()
+        return state
+
+    def append(self, changes):
+        self._queue.put(("append", list(changes)))
+
+    def needs_compaction(self):
+        with self._lock:
+            failed = self._failed or bool(self._unwritten_trash)
+        return failed or self.backend.needs_compaction()
+
+    def compact(self, state):
+        with self._lock:
+            self._failed = False
+        self._queue.put(("compact", _freeze(state)))
+
+    def load_trash(self):
+        self.flush()
+        return self.backend.load_trash()
+
+    def append_trash(self, ops):
+        self._queue.put(("trash", list(ops)))
+
+    def compact_trash(self, ops):
+        self._queue.put(("trash_compact", list(ops)))
+
+    def purge_trash(self, now=None):
+        # Reading the whole trash log is the slow part; it happens here too
+        self._queue.put(("purge", now))
+
+    def flush(self):
+        self._queue.join()
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(("stop", None))
+            self._thread.join()
+            self._thread = None
+        self.backend.close()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            if batch[0][0] != "stop":
+                time.sleep(self.delay)
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(kind == "stop" for kind, _ in batch)
+            self._write([item for item in batch if item[0] != "stop"])
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                return
+
+    def _write(self, batch):
+        last = max((i for i, (kind, _) in enumerate(batch) if kind == "compact"), default=-1)
+        changes = []
+        # Once a change is lost, later ones aren't journaled after it; the
+        # compaction that follows the failure writes them all
+        failed = False
+        for i, (kind, payload) in enumerate(batch):
+            if kind == "append":
+                if i > last:
+                    changes.extend(payload)
+                continue
+            if changes and not failed:
+                failed = not self._attempt(self.backend.append, changes)
+            changes = []
+            if kind == "compact" and i == last:
+                failed = not self._attempt(self.backend.compact, payload)
+                if not failed:
+                    self._write_trash([])
+            elif kind == "trash":
+                self._write_trash(payload)
+            elif kind == "trash_compact":
+                # The whole trash, so it supersedes ops that failed before
+                if self._attempt(self.backend.compact_trash, payload, trash=True):
+                    with self._lock:
+                        self._unwritten_trash = []
+            elif kind == "purge":
+                self._attempt(self.backend.purge_trash, payload, trash=True)
+        if changes and not failed:
+            self._attempt(self.backend.append, changes)
+
+    def _write_trash(self, ops):
+        with self._lock:
+            ops, self._unwritten_trash = self._unwritten_trash + ops, []
+        if ops and not self._attempt(self.backend.append_trash, ops, trash=True):
+            with self._lock:
+                self._unwritten_trash = ops + self._unwritten_trash
+
+    def _attempt(self, write, payload, trash=False):
+        # Trash writes leave the main data alone, so they don't call for a compaction
+        try:
+            write(payload)
+            return True
+        except Exception as e:
+            if not trash:
+                with self._lock:
+                    self._failed = True
+            self.errors.put(e)
+            return False
@@ -0,0 +1,38 @@
+import os
+import sys
+
+import pytest
+
+# The modules live flat in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hospital import Hospital  # noqa: E402
+from models import Doctor, Patient  # noqa: E402
+from storage import open_storage  # noqa: E402
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    return str(tmp_path / "hospital_data.json")
+
+
+@pytest.fixture
+def open_hospital(data_file):
+    """Opens (and on teardown closes) a Hospital on `data_file`, or another path; .db is SQLite."""
+    opened = []
+
+    def open_(path=data_file, store=None):
+        hospital = Hospital(store or open_storage(path))
+        hospital.load()
+        opened.append(hospital)
+        return hospital
+    yield open_
+    for hospital in opened:
+        hospital.store.close()
+
+
+def add_people(hospital, patients=3, slots=("2099-01-05 09:00",)):
+    """Some patients and one doctor with `slots`; returns (patients, doctor)."""
+    added = [hospital.add("patients", Patient(None, f"Patient {i}", 30 + i)) for i in range(patients)]
+    doctor = hospital.add("doctors", Doctor(None, "Doctor A", "Cardiology", tuple(slots)))
+    return added, doctor
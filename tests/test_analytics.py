@@ -0,0 +1,143 @@
+import random
+from collections import Counter
+from dataclasses import replace
+from datetime import datetime, timedelta
+
+import pytest
+
+from analytics import UNKNOWN_SPEC
+from bench import generate
+from conftest import add_people
+from hospital import Hospital
+from models import CANCELLED, STATUSES, Appointment
+from storage import BackgroundWriter, open_storage
+
+LISTS = ("patients", "doctors", "appointments")
+
+
+def figures(h):
+    """Every dashboard figure, with the zero counts dropped."""
+    an = h.analytics
+    return {"patients": an.patients, "statuses": +an.statuses, "held": +an.held,
+            "demand": +an.demand, "booked_patients": +an.booked_patients,
+            "free": {d.id: an.free(d.id) for d in h.doctors}}
+
+
+def recount(h):
+    """figures() worked out from the lists; reads the history in."""
+    appointments = h.loaded("appointments")
+    holding = [a for a in appointments if a.holds_slot]
+    booked = Counter((a.doctor_id, a.slot) for a in holding)
+
+    def spec(doctor_id):
+        doctor = h.get("doctors", doctor_id)
+        return doctor.spec if doctor is not None else UNKNOWN_SPEC
+    return {"patients": len(h.patients), "statuses": Counter(a.status for a in appointments),
+            "held": Counter(a.doctor_id for a in holding),
+            "demand": Counter(spec(a.doctor_id) for a in holding),
+            "booked_patients": Counter(a.patient_id for a in holding),
+            "free": {d.id: sum(1 for s in d.slots if not booked[d.id, s]) for d in h.doctors}}
+
+
+def check_indexes(h):
+    for kind in LISTS:
+        assert h.ids[kind] == {r.id: r for r in getattr(h, kind)}
+        assert all(h.ids[kind][r.id] is r for r in getattr(h, kind))
+    booked = {}
+    for a in h.appointments:
+        if a.holds_slot:
+            slots = booked.setdefault(a.doctor_id, {})
+            slots[a.slot] = slots.get(a.slot, 0) + 1
+    assert {d: slots for d, slots in h.booked_slots.items() if slots} == booked
+
+
+def random_change(h, rnd, now):
+    op = rnd.random()
+    if op < 0.25 and h.appointments:
+        try:
+            h.set_status(rnd.randrange(len(h.appointments)), rnd.choice(STATUSES))
+        except ValueError:
+            pass
+    elif op < 0.45:
+        doctor = rnd.choice(h.doctors)
+        free = h.available_slots(doctor, now - timedelta(days=12), now + timedelta(days=30))
+        if free:
+            h.add("appointments", Appointment(None, rnd.choice(h.patients).id, doctor.id, rnd.choice(free)))
+    elif op < 0.6 and h.appointments:
+        h.delete("appointments", rnd.randrange(len(h.appointments)))
+    elif op < 0.7:
+        i = rnd.randrange(len(h.doctors))
+        h.update("doctors", i, replace(h.doctors[i], spec=rnd.choice(["Cardiology", "Dermatology", "X"])))
+    elif op < 0.8 and len(h.doctors) > 2:
+        h.delete("doctors", rnd.randrange(len(h.doctors)))
+    elif op < 0.9:
+        kind = rnd.choice(["doctors", "appointments"])
+        h.trash.count(kind)
+        ids = list(h.trash.entries[kind])
+        if ids:
+            try:
+                h.recover(kind, rnd.choice(ids))
+            except ValueError:
+                pass
+    else:
+        h.save()
+
+
+def test_status_changes_move_counts_between_statuses(open_hospital):
+    h = open_hospital()
+    patients, doctor = add_people(h, slots=("2099-01-05 09:00", "2099-01-05 10:00"))
+    for patient, slot in zip(patients, doctor.slots):
+        h.add("appointments", Appointment(None, patient.id, doctor.id, slot))
+    assert h.analytics.free(doctor.id) == 0
+
+    h.set_status(0, CANCELLED)
+    assert h.analytics.statuses[CANCELLED] == 1
+    assert h.analytics.booked(doctor.id) == 1
+    assert h.analytics.free(doctor.id) == 1
+    assert h.analytics.cancel_rate() == 0.5
+    assert figures(h) == recount(h)
+    check_indexes(h)
+
+
+def test_deleting_a_doctor_keeps_its_specialty(open_hospital):
+    h = open_hospital()
+    patients, doctor = add_people(h)
+    h.add("appointments", Appointment(None, patients[0].id, doctor.id, doctor.slots[0]))
+    h.delete("doctors", 0)
+
+    assert h.analytics.specialties() == [("Cardiology", 1)]
+    h.save()
+    h.store.close()
+    assert open_hospital().analytics.specialties() == [("Cardiology", 1)]
+
+
+@pytest.mark.parametrize("name", ["hospital_data.json", "hospital.db"])
+@pytest.mark.parametrize("seed", range(4))
+def test_figures_match_a_recount_and_survive_restarts(tmp_path, name, seed):
+    rnd = random.Random(seed)
+    path = str(tmp_path / name)
+    now = datetime.now().replace(minute=0, second=0, microsecond=0)
+    # Some appointments are past, so the snapshot leaves them on disk
+    state = generate(60, 8, 12, seed=seed, start=now - timedelta(days=10))
+    state["appointments"] = [replace(a, status=rnd.choice(STATUSES)) for a in state["appointments"]]
+    open_storage(path).compact(state)
+
+    def reopen():
+        store = open_storage(path)
+        hospital = Hospital(BackgroundWriter(store) if seed % 2 else store)
+        hospital.load()
+        return hospital
+    h = reopen()
+    try:
+        for step in range(150):
+            random_change(h, rnd, now)
+            if step % 30 == 29:
+                live = figures(h)
+                h.store.close()
+                h = reopen()
+                assert figures(h) == live
+        live = figures(h)
+        assert live == recount(h)
+        check_indexes(h)
+    finally:
+        h.store.close()
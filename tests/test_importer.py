@@ -0,0 +1,147 @@
+import csv
+import json
+
+import pytest
+
+from conftest import add_people
+from importer import Importer, guess_kind, main
+from models import Appointment, Patient
+
+SLOT = "2099-01-05 09:00-09:30"
+OTHER_SLOT = "2099-01-05 10:00-10:30"
+
+
+def write_csv(path, header, *rows):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+    return str(path)
+
+
+def write_json(path, records, lines=False):
+    with open(path, "w") as f:
+        if lines:
+            f.writelines(json.dumps(r) + "\n" for r in records)
+        else:
+            json.dump(records, f)
+    return str(path)
+
+
+def test_kind_is_told_by_the_columns_then_the_name(tmp_path):
+    appointments = write_csv(tmp_path / "doctor_appointments.csv", ("doctor", "patient", "slot"), ("A", "B", SLOT))
+    doctors = write_json(tmp_path / "patients_doctors.json", [{"name": "A", "spec": "Cardiology"}])
+    patients = write_json(tmp_path / "export.jsonl", [{"name": "A", "age": 3}], lines=True)
+    empty = write_csv(tmp_path / "new_patients.csv", ("name", "age"))
+
+    assert guess_kind(appointments) == "appointments"
+    assert guess_kind(doctors) == "doctors"
+    assert guess_kind(patients) == "patients"
+    assert guess_kind(empty) == "patients"
+    assert guess_kind(str(tmp_path / "doctor_appointments_2024.csv")) == "appointments"
+    assert guess_kind(str(tmp_path / "notes.csv")) is None
+
+
+def test_rows_are_checked_like_the_forms(open_hospital, tmp_path):
+    h = open_hospital()
+    path = write_csv(tmp_path / "patients.csv", ("name", "age"),
+                     ("Ana", "40"), ("", "3"), ("Ben", "old"), ("Cy", " 7 "))
+    importer = Importer(h)
+    importer.feed_file(path)
+
+    assert [p.name for p in importer.pending["patients"]] == ["Ana", "Cy"]
+    assert [(number, reason) for _, number, reason, _ in importer.rejected] == [
+        (3, "Enter valid name and age."), (4, "Enter valid name and age.")]
+    # Nothing is saved before commit()
+    assert h.patients == []
+
+
+def test_slot_conflicts_inside_the_import_and_with_the_data(open_hospital, tmp_path):
+    h = open_hospital()
+    patients, doctor = add_people(h, slots=(SLOT, OTHER_SLOT))
+    h.add("appointments", Appointment(None, patients[0].id, doctor.id, SLOT))
+    path = write_json(tmp_path / "appointments.json", [
+        {"patient_id": patients[1].id, "doctor_id": doctor.id, "slot": "2099-01-05 10:00"},
+        {"patient_id": patients[2].id, "doctor_id": doctor.id, "slot": OTHER_SLOT},
+        {"patient_id": patients[2].id, "doctor_id": doctor.id, "slot": SLOT},
+        {"patient_id": patients[2].id, "doctor_id": doctor.id, "slot": "2099-01-05 11:00"},
+        {"patient_id": 99, "doctor_id": doctor.id, "slot": OTHER_SLOT},
+    ])
+    importer = Importer(h)
+    importer.feed_file(path)
+
+    assert [(a.patient_id, a.slot) for a in importer.pending["appointments"]] == [(patients[1].id, OTHER_SLOT)]
+    assert [reason for _, _, reason, _ in importer.rejected] == [
+        "Slot already booked earlier in this import.", "Slot already booked.",
+        "The doctor does not offer this slot.", "No patient with id 99."]
+
+
+def test_appointments_can_refer_to_people_earlier_in_the_import(open_hospital, tmp_path):
+    h = open_hospital()
+    h.add("patients", Patient(None, "Twin", 1))
+    h.add("patients", Patient(None, "Twin", 1))
+    patients = write_csv(tmp_path / "patients.csv", ("name", "age"), ("Ana", "40"))
+    doctors = write_csv(tmp_path / "doctors.csv", ("name", "spec", "slots"), ("House", "Diagnostics", f"{SLOT};{OTHER_SLOT}"))
+    appointments = write_csv(tmp_path / "appointments.csv", ("patient", "doctor", "slot"),
+                             ("ana", "House", SLOT), ("Twin", "House", OTHER_SLOT), ("Nobody", "House", OTHER_SLOT))
+    importer = Importer(h)
+    for path in (patients, doctors, appointments):
+        importer.feed_file(path)
+
+    [booked] = importer.pending["appointments"]
+    assert (booked.patient_id, booked.doctor_id) == (importer.pending["patients"][0].id, importer.pending["doctors"][0].id)
+    assert [reason for _, _, reason, _ in importer.rejected] == [
+        "More than one patient is named 'Twin'; use patient_id.", "No patient named 'Nobody'."]
+
+
+def test_one_commit_and_ids_shifted_past_records_added_meanwhile(open_hospital, tmp_path):
+    h = open_hospital()
+    patients = write_csv(tmp_path / "patients.csv", ("name", "age"), ("Ana", "40"), ("Ben", "7"))
+    doctors = write_json(tmp_path / "doctors.json", [{"name": "House", "spec": "Diagnostics", "slots": [SLOT]}])
+    appointments = write_json(tmp_path / "appointments.jsonl", [{"patient": "Ben", "doctor": "House", "slot": SLOT}],
+                              lines=True)
+    importer = Importer(h)
+    for path in (patients, doctors, appointments):
+        importer.feed_file(path)
+    # Added at the desk while the rows were being checked
+    added = h.add("patients", Patient(None, "Walk-in", 30))
+    records = h.store.records
+
+    assert importer.commit() == {"patients": 2, "doctors": 1, "appointments": 1}
+    assert h.store.records == records + 1
+    assert [p.name for p in h.patients] == ["Walk-in", "Ana", "Ben"]
+    assert len({p.id for p in h.patients}) == 3 and added.id == 1
+    assert h.patient_of(h.appointments[0]).name == "Ben"
+    assert h.doctor_of(h.appointments[0]).name == "House"
+    assert [p.name for p in open_hospital().patients] == ["Walk-in", "Ana", "Ben"]
+
+
+def test_slot_booked_during_the_import_is_rejected_on_commit(open_hospital, tmp_path):
+    h = open_hospital()
+    patients, doctor = add_people(h, slots=(SLOT,))
+    path = write_csv(tmp_path / "appointments.csv", ("patient_id", "doctor_id", "slot"), (patients[0].id, doctor.id, SLOT))
+    importer = Importer(h)
+    importer.feed_file(path)
+    h.add("appointments", Appointment(None, patients[1].id, doctor.id, SLOT))
+
+    assert importer.commit()["appointments"] == 0
+    assert importer.rejected[-1][2] == "Slot was booked during the import."
+    assert [a.patient_id for a in h.appointments] == [patients[1].id]
+
+
+def test_rejected_rows_are_written_out(data_file, tmp_path, capsys):
+    path = write_csv(tmp_path / "patients.csv", ("name", "age"), ("Ana", "40"), ("Ben", "x"))
+    rejects = str(tmp_path / "rejected.csv")
+
+    assert main([path, "--data", data_file, "--rejects", rejects]) == 0
+    assert "Imported 1 patients" in capsys.readouterr().out
+    with open(rejects, newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [(r["file"], r["row"], r["reason"]) for r in rows] == [(path, "3", "Enter valid name and age.")]
+    assert json.loads(rows[0]["data"]) == {"name": "Ben", "age": "x"}
+
+
+def test_a_file_of_unknown_kind_is_refused(open_hospital, tmp_path):
+    path = write_csv(tmp_path / "notes.csv", ("text",), ("hello",))
+    with pytest.raises(ValueError):
+        Importer(open_hospital()).feed_file(path)
@@ -0,0 +1,85 @@
+import os
+
+from conftest import add_people
+from models import Patient
+from storage import JournalStore
+
+
+def journal_lines(data_file):
+    with open(os.path.splitext(data_file)[0] + ".journal", "rb") as f:
+        return f.readlines()
+
+
+def write_journal(data_file, lines):
+    with open(os.path.splitext(data_file)[0] + ".journal", "wb") as f:
+        f.writelines(lines)
+
+
+def test_changes_survive_a_restart_without_compaction(open_hospital):
+    h = open_hospital()
+    patients, doctor = add_people(h)
+    h.update("patients", 0, Patient(None, "Renamed", 50))
+    h.delete("patients", 1)
+
+    reopened = open_hospital()
+    assert [p.name for p in reopened.patients] == ["Renamed", "Patient 2"]
+    assert reopened.doctors == [doctor]
+    assert reopened.store.records == len(journal_lines(h.store.path))
+
+
+def test_torn_last_record_is_dropped_and_truncated(open_hospital, data_file):
+    h = open_hospital()
+    add_people(h, patients=2)
+    h.store.close()
+    lines = journal_lines(data_file)
+    write_journal(data_file, lines[:-1] + [lines[-1][:len(lines[-1]) // 2]])
+
+    reopened = open_hospital()
+    assert [p.name for p in reopened.patients] == ["Patient 0", "Patient 1"]
+    assert reopened.doctors == []
+    assert journal_lines(data_file) == lines[:-1]
+    # The next append goes after the last good record
+    reopened.add("patients", Patient(None, "After", 1))
+    assert [p.name for p in open_hospital().patients] == ["Patient 0", "Patient 1", "After"]
+
+
+def test_replay_stops_at_a_record_with_a_bad_checksum(open_hospital, data_file):
+    h = open_hospital()
+    add_people(h, patients=3)
+    h.store.close()
+    lines = journal_lines(data_file)
+    # Flip one byte of the second record's payload
+    bad = bytearray(lines[1])
+    bad[-3] ^= 1
+    write_journal(data_file, [lines[0], bytes(bad)] + lines[2:])
+
+    reopened = open_hospital()
+    assert [p.name for p in reopened.patients] == ["Patient 0"]
+    assert journal_lines(data_file) == [lines[0]]
+
+
+def test_records_already_in_the_snapshot_are_not_replayed_twice(open_hospital, data_file):
+    h = open_hospital()
+    add_people(h, patients=2)
+    h.store.close()
+    lines = journal_lines(data_file)
+    # A crash between writing the snapshot and truncating the journal
+    compacted = open_hospital()
+    compacted.save()
+    compacted.store.close()
+    write_journal(data_file, lines)
+
+    reopened = open_hospital()
+    assert [p.name for p in reopened.patients] == ["Patient 0", "Patient 1"]
+    assert len(reopened.doctors) == 1
+
+
+def test_compaction_folds_the_journal_into_the_snapshot(open_hospital, data_file):
+    h = open_hospital(store=JournalStore(data_file, max_records=3))
+    add_people(h, patients=5)
+    assert h.store.records < 3
+    assert len(journal_lines(data_file)) == h.store.records
+
+    reopened = open_hospital()
+    assert len(reopened.patients) == 5
+    assert reopened.next_ids["patients"] == 6
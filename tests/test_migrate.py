@@ -0,0 +1,77 @@
+import json
+
+from models import Appointment
+from storage import SECTIONED_MAGIC
+
+# hospital_data.json as the app wrote it before records had ids:
+# appointments embed copies of their patient and doctor
+ANA = {"name": "Ana", "age": 40}
+BEN = {"name": "Ben", "age": 7}
+GONE = {"name": "Gone", "age": 90}
+HOUSE = {"name": "House", "spec": "Diagnostics", "slots": ["2099-01-05 9am", "Monday morning"]}
+LEGACY = {
+    "patients": [ANA, BEN],
+    "doctors": [HOUSE],
+    "appointments": [
+        {"patient": ANA, "doctor": HOUSE, "slot": "2099-01-05 9am"},
+        # Ben's age was edited after booking; matched by name
+        {"patient": {"name": "Ben", "age": 6}, "doctor": HOUSE, "slot": "Monday morning"},
+    ],
+    "trash": {
+        "patients": [],
+        "doctors": [],
+        # Its patient was deleted and the trash emptied since
+        "appointments": [{"patient": GONE, "doctor": HOUSE, "slot": "2099-01-06 10:00"}],
+    },
+}
+
+
+def write_legacy(path, data=LEGACY):
+    with open(path, "w") as f:
+        json.dump(data, f)
+
+
+def test_legacy_records_get_ids_and_references(open_hospital, data_file):
+    write_legacy(data_file)
+    h = open_hospital()
+
+    assert [(p.id, p.name) for p in h.patients] == [(1, "Ana"), (2, "Ben")]
+    house = h.doctors[0]
+    assert house.id == 1
+    assert [(a.patient_id, a.doctor_id) for a in h.appointments] == [(1, 1), (2, 1)]
+    assert h.patient_of(h.appointments[1]).name == "Ben"
+    # The slot is rewritten in canonical form, the label kept as it is
+    assert house.slots == ("2099-01-05 09:00-09:30", "Monday morning")
+    assert h.appointments[0].slot == "2099-01-05 09:00-09:30"
+    assert h.is_slot_booked(house.id, "2099-01-05 09:00-09:30")
+    assert h.is_slot_booked(house.id, "Monday morning")
+
+
+def test_trash_moves_to_its_own_store_and_purged_people_are_kept(open_hospital, data_file):
+    write_legacy(data_file)
+    h = open_hospital()
+
+    assert h.trash.count("appointments") == 1
+    trashed = h.trash.page("appointments")[0]
+    # A patient nothing else refers to any more lives on as a trash entry
+    gone = h.get("patients", trashed.patient_id)
+    assert gone is not None and gone.name == "Gone"
+    assert trashed.patient_id not in h.ids["patients"]
+    assert h.next_ids["patients"] > trashed.patient_id
+
+
+def test_migrated_file_is_rewritten_and_reloads_unchanged(open_hospital, data_file):
+    write_legacy(data_file)
+    h = open_hospital()
+    state = {kind: list(getattr(h, kind)) for kind in ("patients", "doctors", "appointments")}
+    h.store.close()
+
+    with open(data_file, "rb") as f:
+        assert f.read(len(SECTIONED_MAGIC)) == SECTIONED_MAGIC
+    reopened = open_hospital()
+    assert {kind: list(getattr(reopened, kind)) for kind in state} == state
+    assert reopened.trash.count("appointments") == 1
+    # New records never take an id handed out by the migration
+    added = reopened.add("appointments", Appointment(None, 1, 1, "2099-01-07 10:00"))
+    assert added.id not in {a.id for a in state["appointments"]}
+    assert reopened.trash.get("appointments", added.id) is None
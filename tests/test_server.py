@@ -0,0 +1,115 @@
+import asyncio
+import socket
+import threading
+import time
+
+import pytest
+
+import server
+from client import RemoteHospital, RemoteStore
+from conftest import add_people
+from hospital import Conflict
+from models import Appointment, Patient
+
+SLOT = "2099-01-05 09:00-09:30"
+
+
+@pytest.fixture
+def desks(data_file):
+    """Returns a function opening a desk on a server for `data_file` run in a thread."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    ready = threading.Event()
+    running = {}
+
+    def started(listener):
+        running["loop"] = asyncio.get_running_loop()
+        running["listener"] = listener
+        ready.set()
+
+    def run():
+        try:
+            asyncio.run(server.serve(data_file, port, started))
+        except asyncio.CancelledError:
+            pass
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    assert ready.wait(5)
+    opened = []
+
+    def desk():
+        hospital = RemoteHospital(RemoteStore(port))
+        hospital.load()
+        opened.append(hospital)
+        return hospital
+    yield desk
+    for hospital in opened:
+        hospital.store.close()
+    running["loop"].call_soon_threadsafe(running["listener"].close)
+    thread.join(5)
+
+
+def wait_until(desk, arrived):
+    """Polls `desk` until `arrived()` holds; changes come in as they are sent."""
+    deadline = time.monotonic() + 5
+    desk.poll()
+    while not arrived():
+        assert time.monotonic() < deadline, "the change never arrived"
+        time.sleep(0.01)
+        desk.poll()
+
+
+def test_changes_reach_the_other_desk(desks):
+    a, b = desks(), desks()
+    patients, doctor = add_people(a, slots=(SLOT,))
+
+    wait_until(b, lambda: b.doctors)
+    assert b.patients == a.patients
+    assert b.doctors == [doctor]
+    added = b.add("patients", Patient(None, "From B", 20))
+    # Ids come from the server, so the desks never hand out the same one
+    assert added.id not in {p.id for p in patients}
+
+
+def test_booking_a_slot_taken_at_another_desk_conflicts(desks):
+    a, b = desks(), desks()
+    patients, doctor = add_people(a, slots=(SLOT,))
+    wait_until(b, lambda: b.doctors)
+    booked = a.add("appointments", Appointment(None, patients[0].id, doctor.id, SLOT))
+
+    with pytest.raises(Conflict):
+        b.add("appointments", Appointment(None, patients[1].id, doctor.id, SLOT))
+    # The refusal brings the desk up to date
+    b.poll()
+    assert b.appointments == [booked]
+    assert b.is_slot_booked(doctor.id, SLOT)
+
+
+def test_editing_a_record_changed_at_another_desk_conflicts(desks):
+    a, b = desks(), desks()
+    patients, _ = add_people(a)
+    wait_until(b, lambda: b.doctors)
+    a.update("patients", 0, Patient(None, "From A", 31))
+
+    with pytest.raises(Conflict):
+        b.update("patients", 0, Patient(None, "From B", 32))
+    b.poll()
+    assert b.ids["patients"][patients[0].id].name == "From A"
+    # Against the current version the edit goes through
+    b.update("patients", 0, Patient(None, "From B", 32))
+    wait_until(a, lambda: a.ids["patients"][patients[0].id].name == "From B")
+
+
+def test_recovering_twice_conflicts(desks):
+    a, b = desks(), desks()
+    patients, _ = add_people(a)
+    a.delete("patients", 1)
+    wait_until(b, lambda: b.trash.count("patients") == 1)
+
+    b.recover("patients", patients[1].id)
+    with pytest.raises(Conflict):
+        a.recover("patients", patients[1].id)
+    a.poll()
+    assert a.patients == b.patients
+    assert a.trash.count("patients") == b.trash.count("patients") == 0
@@ -0,0 +1,41 @@
+from datetime import datetime, timedelta
+
+from models import Appointment, Doctor, Patient
+
+MONDAY = datetime(2099, 1, 5)
+
+
+def weekly_doctor(h, leave=()):
+    return h.add("doctors", Doctor(None, "Weekly", "Derm", (), ("Mon 09:00-10:00/30",), leave))
+
+
+def test_weekly_only_specialty_on_leave_the_first_week(open_hospital):
+    h = open_hospital()
+    h.add("doctors", Doctor(None, "Other", "Cardiology", ("2099-01-05 08:00",)))
+    doctor = weekly_doctor(h, leave=("2099-01-05",))
+
+    assert h.free_slots(MONDAY, MONDAY + timedelta(days=7), "Derm") == []
+    assert h.earliest_free("Derm", MONDAY) == (doctor, "2099-01-12 09:00-09:30")
+    assert h.free_slots(MONDAY, MONDAY + timedelta(days=14), "Derm") == [
+        (doctor, "2099-01-12 09:00-09:30"), (doctor, "2099-01-12 09:30-10:00")]
+
+
+def test_weekly_only_specialty_fully_booked(open_hospital):
+    h = open_hospital()
+    doctor = weekly_doctor(h)
+    patient = h.add("patients", Patient(None, "Ana", 40))
+    for slot in ("2099-01-05 09:00-09:30", "2099-01-05 09:30-10:00"):
+        h.add("appointments", Appointment(None, patient.id, doctor.id, slot))
+
+    assert h.earliest_free("Derm", MONDAY) == (doctor, "2099-01-12 09:00-09:30")
+    assert h.free_slots(MONDAY, MONDAY + timedelta(days=7), "Derm") == []
+    h.delete("appointments", 0)
+    assert h.earliest_free("Derm", MONDAY) == (doctor, "2099-01-05 09:00-09:30")
+
+
+def test_no_free_slot_within_the_horizon(open_hospital):
+    h = open_hospital()
+    weekly_doctor(h, leave=("2099-01-01..2100-12-31",))
+
+    assert h.earliest_free("Derm", MONDAY) is None
+    assert h.free_slots(MONDAY, MONDAY + timedelta(days=21), "Derm") == []
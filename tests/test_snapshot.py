@@ -0,0 +1,101 @@
+import pytest
+
+from conftest import add_people
+from models import CANCELLED, Appointment
+from storage import Section
+
+PAST = ("2000-01-03 09:00-09:30", "2000-01-03 10:00-10:30")
+UPCOMING = ("2099-01-05 09:00-09:30", "2099-01-05 10:00-10:30")
+
+
+@pytest.fixture(params=["hospital_data.json", "hospital.db"])
+def data_file(request, tmp_path):
+    # Both backends keep past appointments aside the same way
+    return str(tmp_path / request.param)
+
+
+def hospital_with_history(open_hospital):
+    """Two past and two upcoming appointments, compacted; returns the reopened Hospital."""
+    h = open_hospital()
+    patients, doctor = add_people(h, slots=PAST + UPCOMING + ("2000-01-04 09:00-09:30",))
+    for patient, slot in zip(patients, PAST + UPCOMING[:1]):
+        h.add("appointments", Appointment(None, patient.id, doctor.id, slot))
+    h.add("appointments", Appointment(None, patients[0].id, doctor.id, UPCOMING[1]))
+    h.save()
+    h.store.close()
+    return open_hospital()
+
+
+def test_past_appointments_stay_on_disk_until_needed(open_hospital):
+    h = hospital_with_history(open_hospital)
+
+    assert isinstance(h.history, Section)
+    assert [a.slot for a in h.appointments] == list(UPCOMING)
+    # The dashboard counts them from the summary meanwhile
+    assert h.analytics.appointments() == 4
+    assert h.analytics.booked(h.doctors[0].id) == 4
+
+    appointments = h.loaded("appointments")
+    assert h.history is None
+    assert sorted(a.slot for a in appointments) == sorted(PAST + UPCOMING)
+    assert h.analytics.appointments() == 4
+
+
+def test_reading_history_in_keeps_positions(open_hospital):
+    h = hospital_with_history(open_hospital)
+    seen = []
+    h.on_loaded = seen.append
+    first = h.appointments[0]
+
+    assert h.is_slot_booked(h.doctors[0].id, PAST[0])
+    assert seen == ["appointments"]
+    # Read in at the end, so a position held by the UI still names the same appointment
+    assert h.appointments[0] is first
+    assert [a.slot for a in h.appointments[2:]] == list(PAST)
+
+
+def test_free_slots_need_no_history(open_hospital):
+    h = hospital_with_history(open_hospital)
+    doctor = h.doctors[0]
+
+    assert h.available_slots(doctor) == ["2000-01-04 09:00-09:30"]
+    assert isinstance(h.history, Section)
+    assert h.analytics.free(doctor.id) == 1
+
+
+def test_changes_to_past_appointments_replay_from_the_journal(open_hospital):
+    h = hospital_with_history(open_hospital)
+    h.loaded("appointments")
+    index = next(i for i, a in enumerate(h.appointments) if a.slot == PAST[1])
+    cancelled = h.set_status(index, CANCELLED)
+    h.store.close()
+
+    # The change brings the history back in with the upcoming appointments
+    reopened = open_hospital()
+    assert reopened.get("appointments", cancelled.id) == cancelled
+    assert len(reopened.loaded("appointments")) == 4
+    assert not reopened.is_slot_booked(cancelled.doctor_id, PAST[1])
+    assert reopened.analytics.statuses[CANCELLED] == 1
+
+
+def test_compaction_keeps_unread_history(open_hospital):
+    h = hospital_with_history(open_hospital)
+    h.add("appointments", Appointment(None, 1, 1, "2099-02-02 09:00-09:30"))
+    h.save()
+    assert isinstance(h.history, Section)
+    h.store.close()
+
+    reopened = open_hospital()
+    assert len(reopened.appointments) == 3
+    assert len(reopened.loaded("appointments")) == 5
+
+
+def test_ids_of_records_added_and_deleted_since_the_snapshot_are_not_reused(open_hospital):
+    h = hospital_with_history(open_hospital)
+    added = h.add("appointments", Appointment(None, 1, 1, "2099-02-02 09:00-09:30"))
+    h.delete("appointments", len(h.appointments) - 1)
+    h.store.close()
+
+    reopened = open_hospital()
+    assert reopened.next_ids["appointments"] > added.id
+    assert reopened.trash.get("appointments", added.id) == added
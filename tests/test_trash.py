@@ -0,0 +1,102 @@
+import os
+import time
+
+import pytest
+
+import trash
+from models import Patient
+
+DAY = 86400
+
+
+@pytest.fixture(params=["hospital_data.json", "hospital.db"])
+def data_file(request, tmp_path):
+    return str(tmp_path / request.param)
+
+
+def trashed(h, ages, kind="patients"):
+    """Trash one patient per age in days, oldest first; returns them."""
+    now = time.time()
+    records = [Patient(i + 1, f"Patient {i}", 30) for i in range(len(ages))]
+    for record, age in zip(records, ages):
+        h.trash.add(kind, record, at=now - age * DAY)
+    return records
+
+
+def names(records):
+    return [r.name for r in records]
+
+
+def test_entries_past_the_age_limit_are_purged(open_hospital):
+    h = open_hospital()
+    trashed(h, [40, 31, 29, 1])
+    assert h.trash.count("patients") == 4
+
+    assert h.purge_trash() == {"patients": 2}
+    assert names(h.trash.page("patients")) == ["Patient 3", "Patient 2"]
+    # Nothing more to drop until they age
+    assert h.purge_trash() == {}
+    assert h.purge_trash(time.time() + 2 * DAY) == {"patients": 1}
+
+
+def test_only_the_newest_entries_are_kept_past_the_count_limit(open_hospital):
+    h = open_hospital()
+    trashed(h, [400, 300, 3, 2, 1])
+    # 0 turns the age limit off
+    h.set_trash_policy(0, 3)
+
+    assert h.purge_trash() == {"patients": 2}
+    assert names(h.trash.page("patients")) == ["Patient 4", "Patient 3", "Patient 2"]
+    h.set_trash_policy(0, 0)
+    trashed(h, [500] * 10)
+    assert h.purge_trash() == {}
+
+
+def test_purge_and_policy_survive_a_reload(open_hospital):
+    h = open_hospital()
+    trashed(h, [40, 20, 10])
+    h.set_trash_policy(15, 100)
+    h.store.close()
+
+    # Purged by the store, without reading the trash into the app
+    reopened = open_hospital()
+    assert reopened.purge_trash() == {}
+    assert reopened.trash.entries is None
+    reopened.store.close()
+    again = open_hospital()
+    assert names(again.trash.page("patients")) == ["Patient 2"]
+    assert again.trash.policy() == (15, 100)
+
+
+def test_pages_are_newest_first(open_hospital):
+    h = open_hospital()
+    records = trashed(h, [120 - i for i in range(120)])
+    newest_first = names(reversed(records))
+
+    assert names(h.trash.page("patients")) == newest_first[:50]
+    assert names(h.trash.page("patients", 50)) == newest_first[50:100]
+    assert names(h.trash.page("patients", 100)) == newest_first[100:]
+    assert h.trash.page("patients", 120) == []
+    assert names(h.trash.page("patients", 10, 5)) == newest_first[10:15]
+    # Deleted again after a recover, an entry is the newest
+    h.recover("patients", records[0].id)
+    h.delete("patients", 0)
+    assert names(h.trash.page("patients", 0, 1)) == ["Patient 0"]
+    assert h.trash.count("patients") == 120
+
+
+def test_log_is_rewritten_once_mostly_dead(open_hospital, data_file, monkeypatch):
+    monkeypatch.setattr(trash, "COMPACT_DEAD", 5)
+    h = open_hospital()
+    records = trashed(h, [10] * 8)
+    h.trash.remove("patients", [r.id for r in records[:4]])
+    assert h.trash.dead == 4
+    h.trash.remove("patients", [records[4].id])
+
+    # Five dead entries against three live ones: compacted
+    assert h.trash.dead == 0
+    if data_file.endswith(".json"):
+        with open(os.path.splitext(data_file)[0] + ".trash", "rb") as f:
+            assert len(f.readlines()) == 1
+    h.store.close()
+    assert names(open_hospital().trash.page("patients")) == ["Patient 7", "Patient 6", "Patient 5"]
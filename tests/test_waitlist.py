@@ -0,0 +1,123 @@
+from datetime import datetime
+
+from conftest import add_people
+from hospital import waitlist_record
+from models import CANCELLED, ROUTINE, SOON, URGENT, Appointment, Doctor, WaitlistEntry
+from waitlist import WaitlistIndex
+
+SLOT = "2099-01-05 09:00-09:30"
+
+
+def entry(entry_id, urgency, requested, doctor_id=None, spec="Cardiology"):
+    return WaitlistEntry(entry_id, entry_id, doctor_id, spec, urgency, requested)
+
+
+def booked_hospital(open_hospital, patients=4):
+    """Patient 0 holds the doctor's only slot; returns (hospital, patients, doctor)."""
+    h = open_hospital()
+    patients, doctor = add_people(h, patients=patients, slots=(SLOT,))
+    h.add("appointments", Appointment(None, patients[0].id, doctor.id, SLOT))
+    return h, patients, doctor
+
+
+def wait(h, patient, urgency, minute, doctor=None, spec=None):
+    now = datetime(2098, 12, 1, 8, minute)
+    return h.add("waitlist", waitlist_record(patient, doctor, spec, urgency, now))
+
+
+def test_most_urgent_first_then_longest_waiting():
+    index = WaitlistIndex()
+    doctor = Doctor(1, "A", "Cardiology")
+    entries = [entry(1, ROUTINE, "2098-01-01 08:00:00"), entry(2, URGENT, "2098-01-03 08:00:00"),
+               entry(3, URGENT, "2098-01-02 08:00:00"), entry(4, SOON, "2098-01-01 08:00:00")]
+    for e in entries:
+        index.add(e)
+
+    order = []
+    while index.best(doctor) is not None:
+        best = entries[index.best(doctor) - 1]
+        order.append(best.id)
+        index.remove(best)
+    assert order == [3, 2, 4, 1]
+
+
+def test_doctor_and_specialty_queues():
+    index = WaitlistIndex()
+    cardiology, other = Doctor(1, "A", "Cardiology"), Doctor(2, "B", "Cardiology")
+    for_doctor = entry(1, ROUTINE, "2098-01-01 08:00:00", doctor_id=1)
+    for_spec = entry(2, ROUTINE, "2098-01-02 08:00:00")
+    index.add(for_doctor)
+    index.add(for_spec)
+
+    # Whichever of the doctor's and the specialty's heads comes first
+    assert index.best(cardiology) == 1
+    assert index.best(other) == 2
+    assert index.best(Doctor(3, "C", "Dermatology")) is None
+    index.remove(for_doctor)
+    assert index.best(cardiology) == 2
+    # Removing an entry twice, or one never added, changes nothing
+    index.remove(for_doctor)
+    index.remove(entry(9, URGENT, "2098-01-01 08:00:00"))
+    assert index.best(cardiology) == 2
+
+
+def test_freed_slot_is_offered_first_in_line(open_hospital):
+    h, patients, doctor = booked_hospital(open_hospital)
+    wait(h, patients[1], ROUTINE, 0, doctor=doctor)
+    urgent = wait(h, patients[2], URGENT, 5, spec="Cardiology")
+
+    h.set_status(0, CANCELLED)
+    assert h.take_offers() == [(urgent, doctor, SLOT)]
+    # Nothing freed since
+    assert h.take_offers() == []
+
+
+def test_declined_slot_goes_to_the_next_in_line(open_hospital):
+    h, patients, doctor = booked_hospital(open_hospital)
+    first = wait(h, patients[1], URGENT, 0, doctor=doctor)
+    second = wait(h, patients[2], SOON, 0, doctor=doctor)
+    third = wait(h, patients[3], ROUTINE, 0, spec="Cardiology")
+
+    h.delete("appointments", 0)
+    [(offered, _, _)] = h.take_offers()
+    assert offered == first
+    h.decline_offer(first, doctor, SLOT)
+    [(offered, _, _)] = h.take_offers()
+    assert offered == second
+    h.decline_offer(second, doctor, SLOT)
+    [(offered, _, slot)] = h.take_offers()
+    assert offered == third
+    h.book_offer(third, doctor, slot)
+
+    assert h.waitlist == [first, second]
+    assert h.is_slot_booked(doctor.id, SLOT)
+    assert h.take_offers() == []
+
+
+def test_declined_by_everyone(open_hospital):
+    h, patients, doctor = booked_hospital(open_hospital, patients=2)
+    only = wait(h, patients[1], URGENT, 0, doctor=doctor)
+
+    h.delete("appointments", 0)
+    h.take_offers()
+    h.decline_offer(only, doctor, SLOT)
+    assert h.take_offers() == []
+    # Still in line for other slots
+    assert h.waitlist_index.best(doctor) == only.id
+
+
+def test_deleting_a_patient_takes_them_off_the_waitlist(open_hospital):
+    h, patients, doctor = booked_hospital(open_hospital)
+    gone = wait(h, patients[1], URGENT, 0, doctor=doctor)
+    gone_too = wait(h, patients[1], URGENT, 1, spec="Cardiology")
+    kept = wait(h, patients[2], ROUTINE, 0, spec="Cardiology")
+
+    h.delete("patients", 1)
+    assert h.waitlist == [kept]
+    assert gone.id not in h.ids["waitlist"] and gone_too.id not in h.ids["waitlist"]
+    h.set_status(0, CANCELLED)
+    assert h.take_offers() == [(kept, doctor, SLOT)]
+
+    reopened = open_hospital()
+    assert reopened.waitlist == [kept]
+    assert reopened.waitlist_index.best(doctor) == kept.id
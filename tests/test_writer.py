@@ -0,0 +1,87 @@
+from conftest import add_people
+from models import Patient
+from storage import BackgroundWriter, JournalStore
+
+
+class FailingStore(JournalStore):
+    """A JournalStore whose writes named in `failing` raise."""
+
+    failing = ()
+
+    def append(self, changes):
+        if "append" in self.failing:
+            raise OSError("disk full")
+        super().append(changes)
+
+    def append_trash(self, ops):
+        if "append_trash" in self.failing:
+            raise OSError("disk full")
+        super().append_trash(ops)
+
+
+def open_writer(open_hospital, data_file):
+    backend = FailingStore(data_file)
+    # Long enough for each test's writes to go as one batch
+    return open_hospital(store=BackgroundWriter(backend, delay=0.2)), backend
+
+
+def errors(store):
+    found = []
+    while not store.errors.empty():
+        found.append(store.errors.get_nowait())
+    return found
+
+
+def test_trash_is_written_after_a_failed_append(open_hospital, data_file):
+    h, backend = open_writer(open_hospital, data_file)
+    patients, _ = add_people(h)
+    h.store.flush()
+    backend.failing = ("append",)
+    h.add("patients", Patient(None, "Lost", 1))
+    h.delete("patients", 0)
+    h.store.flush()
+
+    assert len(errors(h.store)) == 1
+    assert h.store.needs_compaction()
+    backend.failing = ()
+    h.save()
+    h.store.close()
+    reopened = open_hospital()
+    assert [p.name for p in reopened.patients] == ["Patient 1", "Patient 2", "Lost"]
+    assert reopened.trash.get("patients", patients[0].id) == patients[0]
+
+
+def test_failed_trash_ops_are_written_by_the_next_save(open_hospital, data_file):
+    h, backend = open_writer(open_hospital, data_file)
+    patients, _ = add_people(h)
+    h.store.flush()
+    backend.failing = ("append_trash",)
+    h.delete("patients", 0)
+    h.store.flush()
+
+    assert len(errors(h.store)) == 1
+    assert h.store.needs_compaction()
+    backend.failing = ()
+    h.save()
+    h.store.flush()
+    assert not h.store.needs_compaction()
+    h.store.close()
+    reopened = open_hospital()
+    assert [p.name for p in reopened.patients] == ["Patient 1", "Patient 2"]
+    assert reopened.trash.get("patients", patients[0].id) == patients[0]
+
+
+def test_failed_trash_ops_go_before_later_ones(open_hospital, data_file):
+    h, backend = open_writer(open_hospital, data_file)
+    add_people(h)
+    h.store.flush()
+    backend.failing = ("append_trash",)
+    h.delete("patients", 0)
+    h.store.flush()
+    backend.failing = ()
+    h.delete("patients", 0)
+    h.store.close()
+
+    reopened = open_hospital()
+    assert [p.name for p in reopened.trash.page("patients")] == ["Patient 1", "Patient 0"]
+    assert [p.name for p in reopened.patients] == ["Patient 2"]
@@ -0,0 +1,178 @@
+import time
+from itertools import islice
+
+from models import decode
+
+KINDS = ("patients", "doctors", "appointments")
+
+# Default retention; 0 means no limit. Both can be changed on the Settings page
+MAX_AGE_DAYS = 30
+MAX_COUNT = 5000
+
+# The store's trash log is rewritten once it holds this many entries that
+# were since recovered, purged or emptied (and more of those than live ones)
+COMPACT_DEAD = 1000
+
+
+def add_ops(records, at=None):
+    """Trash ops adding {kind: [records]}, all deleted at `at` (default now)."""
+    at = at or time.time()
+    return [{"op": "add", "kind": kind, "at": at, "value": record}
+            for kind, items in records.items() for record in items]
+
+
+class Trash:
+    """Deleted patients, doctors and appointments, kept apart from the live data.
+
+    Entries live in their own part of the store (a log file next to the
+    JSON snapshot, or the SQLite trash table) and every change is written
+    as a small op, so recovering or purging one entry touches only that
+    entry. Nothing is read until the trash is first used. Entries are
+    kept per kind in the order they were deleted, as id -> (time, record),
+    and dropped by purge() once older than `max_age_days` or beyond the
+    newest `max_count`.
+
+    `is_live(kind, id)` tells whether a record is active again; a crash
+    between the two writes of a delete or recover can leave it in both
+    places, and such entries are dropped on load.
+    """
+
+    def __init__(self, store, is_live=lambda kind, record_id: False):
+        self.store = store
+        self.is_live = is_live
+        self.entries = None
+        self.max_age_days = MAX_AGE_DAYS
+        self.max_count = MAX_COUNT
+        self.dead = 0
+
+    def _loaded(self):
+        if self.entries is not None:
+            return self.entries
+        self.entries = {kind: {} for kind in KINDS}
+        self.dead = 0
+        for op in self.store.load_trash():
+            self._apply(op)
+        for kind, entries in self.entries.items():
+            stale = [record_id for record_id in entries if self.is_live(kind, record_id)]
+            if stale:
+                self.remove(kind, stale)
+        return self.entries
+
+    def _apply(self, op):
+        if op["op"] == "policy":
+            self.max_age_days = op["max_age_days"]
+            self.max_count = op["max_count"]
+            return
+        entries = self.entries[op["kind"]]
+        if op["op"] == "add":
+            record = decode(op["kind"], op["value"])
+            # Deleted again after a recover: it moves to the end
+            if entries.pop(record.id, None) is not None:
+                self.dead += 1
+            entries[record.id] = (op["at"], record)
+        elif op["op"] == "remove":
+            for record_id in op["ids"]:
+                if entries.pop(record_id, None) is not None:
+                    self.dead += 1
+        elif op["op"] == "clear":
+            self.dead += len(entries)
+            entries.clear()
+        else:
+            raise ValueError(f"Unknown trash op: {op['op']}")
+
+    def _write(self, *ops):
+        if self.entries is not None:
+            for op in ops:
+                self._apply(op)
+        self.store.append_trash(list(ops))
+        live = sum(map(len, self.entries.values())) if self.entries is not None else 0
+        if self.dead >= COMPACT_DEAD and self.dead > live:
+            self.store.compact_trash(self.ops())
+            self.dead = 0
+
+    # --- Reading ---
+
+    def count(self, kind):
+        return len(self._loaded()[kind])
+
+    def get(self, kind, record_id):
+        entry = self._loaded()[kind].get(record_id)
+        return entry[1] if entry is not None else None
+
+    def deleted_at(self, kind, record_id):
+        entry = self._loaded()[kind].get(record_id)
+        return entry[0] if entry is not None else None
+
+    def policy(self):
+        """(max_age_days, max_count) as stored."""
+        self._loaded()
+        return self.max_age_days, self.max_count
+
+    def page(self, kind, offset=0, limit=50):
+        """Records of one kind, most recently deleted first, from `offset`."""
+        return [record for _, record in islice(reversed(self._loaded()[kind].values()), offset, offset + limit)]
+
+    def ops(self):
+        """Ops that rebuild the whole trash, oldest entries first."""
+        ops = [{"op": "policy", "max_age_days": self.max_age_days, "max_count": self.max_count}]
+        for kind, entries in self._loaded().items():
+            ops.extend({"op": "add", "kind": kind, "at": at, "value": record} for at, record in entries.values())
+        return ops
+
+    # --- Changes ---
+
+    def replay(self, ops):
+        """Apply ops already written elsewhere (by the booking server) if the trash is loaded."""
+        if self.entries is not None:
+            for op in ops:
+                self._apply(op)
+
+    def add(self, kind, record, at=None):
+        # Needs no read: a trash not loaded yet gets it from the store later
+        self._write(*add_ops({kind: [record]}, at))
+
+    def adopt(self, records, at=None):
+        """Take over {kind: [records]} from a data file that kept its own trash."""
+        ops = add_ops(records, at)
+        if ops:
+            self._write(*ops)
+
+    def remove(self, kind, record_ids):
+        self._loaded()
+        self._write({"op": "remove", "kind": kind, "ids": list(record_ids)})
+
+    def clear(self, kind):
+        self._write({"op": "clear", "kind": kind})
+
+    def set_policy(self, max_age_days, max_count):
+        if max_age_days < 0 or max_count < 0:
+            raise ValueError("Retention limits can't be negative.")
+        self._loaded()
+        self._write({"op": "policy", "max_age_days": max_age_days, "max_count": max_count})
+
+    def expired(self, now=None):
+        """{kind: [ids]} of entries past the age limit or beyond the newest `max_count`."""
+        # Read first: the stored policy comes with the entries
+        loaded = self._loaded()
+        now = now or time.time()
+        cutoff = now - self.max_age_days * 86400
+        expired = {}
+        for kind, entries in loaded.items():
+            # Oldest first, so both limits cut a prefix
+            over = len(entries) - self.max_count if self.max_count else 0
+            ids = []
+            for record_id, (at, _) in entries.items():
+                if len(ids) < over or self.max_age_days and at < cutoff:
+                    ids.append(record_id)
+                else:
+                    break
+            if ids:
+                expired[kind] = ids
+        return expired
+
+    def purge(self, now=None):
+        """Drop expired entries; returns {kind: number dropped}."""
+        expired = self.expired(now)
+        for kind, ids in expired.items():
+            self.remove(kind, ids)
+        return {kind: len(ids) for kind, ids in expired.items()}
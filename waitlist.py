@@ -0,0 +1,77 @@
+from heapq import heapify, heappop, heappush
+
+
+def priority(entry):
+    """Sort key of a waitlist entry: most urgent first, then first come."""
+    return (entry.urgency, entry.requested, entry.id)
+
+
+class _Queue:
+    """A heap of priority() keys with lazy removal.
+
+    Removed entries stay in the heap until they reach the top, where
+    best() drops them; `live` says which keys are current. Once more
+    than half the heap is stale it is rebuilt from `live`.
+    """
+
+    __slots__ = ("heap", "live")
+
+    def __init__(self):
+        self.heap = []
+        self.live = {}
+
+    def push(self, key):
+        self.live[key[-1]] = key
+        heappush(self.heap, key)
+
+    def discard(self, key):
+        if self.live.get(key[-1]) == key:
+            del self.live[key[-1]]
+            if len(self.heap) > 2 * len(self.live) + 16:
+                self.heap = list(self.live.values())
+                heapify(self.heap)
+
+    def best(self):
+        heap = self.heap
+        while heap and self.live.get(heap[0][-1]) != heap[0]:
+            heappop(heap)
+        return heap[0] if heap else None
+
+
+class WaitlistIndex:
+    """Waiting patients queued per doctor and per specialty.
+
+    Entries naming a doctor wait in that doctor's queue, the others in
+    their specialty's. When one of a doctor's slots is freed, the best
+    entry is whichever of the heads of those two queues goes first, so
+    matching is O(log n) however long the waitlist is and never looks
+    at appointments. Adding or removing an entry is one heap push or
+    (amortized) pop.
+    """
+
+    def __init__(self):
+        self.doctors = {}
+        self.specialties = {}
+
+    def _queue(self, entry, create=False):
+        queues, key = ((self.doctors, entry.doctor_id) if entry.doctor_id is not None
+                       else (self.specialties, entry.spec))
+        queue = queues.get(key)
+        if queue is None and create:
+            queue = queues[key] = _Queue()
+        return queue
+
+    def add(self, entry):
+        self._queue(entry, create=True).push(priority(entry))
+
+    def remove(self, entry):
+        queue = self._queue(entry)
+        if queue is not None:
+            queue.discard(priority(entry))
+
+    def best(self, doctor):
+        """Id of the entry first in line for a slot of `doctor`, or None."""
+        heads = [queue.best() for queue in (self.doctors.get(doctor.id), self.specialties.get(doctor.spec))
+                 if queue is not None]
+        heads = [key for key in heads if key is not None]
+        return min(heads)[-1] if heads else None
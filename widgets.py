@@ -0,0 +1,255 @@
+import tkinter as tk
+from tkinter import ttk
+
+
+class VirtualList(ttk.Frame):
+    """A list view that only formats and renders the rows currently visible.
+
+    `items` is any sequence (usually one of the Hospital lists) and
+    `formatter` turns one item into its display string. The Listbox holds
+    at most `height` rows; scrolling re-renders that window. Indexes handed
+    out by curselection() are positions in `items`, not in the Listbox.
+    """
+
+    def __init__(self, parent, items, formatter, height=10, **listbox_options):
+        super().__init__(parent)
+        self.items = items
+        self.formatter = formatter
+        self.height = height
+        self.top = 0
+        self.selected = None
+        self.listbox = tk.Listbox(self, height=height, exportselection=False, **listbox_options)
+        self.scrollbar = ttk.Scrollbar(self, orient='vertical', command=self._on_scrollbar)
+        self.listbox.pack(side='left', fill='both', expand=True)
+        self.scrollbar.pack(side='left', fill='y')
+        self.listbox.bind("<<ListboxSelect>>", self._on_select)
+        self.listbox.bind("<MouseWheel>", lambda e: self.scroll(-1 if e.delta > 0 else 1))
+        self.listbox.bind("<Button-4>", lambda e: self.scroll(-1))
+        self.listbox.bind("<Button-5>", lambda e: self.scroll(1))
+        self.listbox.bind("<Up>", lambda e: self._move_selection(-1))
+        self.listbox.bind("<Down>", lambda e: self._move_selection(1))
+        self.listbox.bind("<Prior>", lambda e: self.scroll(-self.height))
+        self.listbox.bind("<Next>", lambda e: self.scroll(self.height))
+        self.refresh()
+
+    # --- Rendering ---
+
+    def _clamp_top(self, top):
+        return max(0, min(top, len(self.items) - self.height))
+
+    def refresh(self):
+        """Re-render the visible window from `items`."""
+        n = len(self.items)
+        self.top = self._clamp_top(self.top)
+        end = min(n, self.top + self.height)
+        self.listbox.delete(0, tk.END)
+        for i in range(self.top, end):
+            self.listbox.insert(tk.END, self.formatter(self.items[i]))
+        if self.selected is not None and self.top <= self.selected < end:
+            self.listbox.selection_set(self.selected - self.top)
+        self._update_scrollbar()
+
+    def _update_scrollbar(self):
+        n = len(self.items)
+        if n:
+            self.scrollbar.set(self.top / n, min(n, self.top + self.height) / n)
+        else:
+            self.scrollbar.set(0, 1)
+
+    def set_items(self, items):
+        self.items = items
+        self.top = 0
+        self.selected = None
+        self.refresh()
+
+    def scroll(self, rows):
+        top = self._clamp_top(self.top + rows)
+        if top != self.top:
+            self.top = top
+            self.refresh()
+        return "break"
+
+    def see(self, index):
+        if index < self.top:
+            self.top = index
+        elif index >= self.top + self.height:
+            self.top = index - self.height + 1
+        self.refresh()
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == 'moveto':
+            self.top = self._clamp_top(int(float(amount) * len(self.items)))
+            self.refresh()
+        elif action == 'scroll':
+            step = self.height if unit == 'pages' else 1
+            self.scroll(int(amount) * step)
+
+    # --- Selection ---
+
+    def _on_select(self, event=None):
+        sel = self.listbox.curselection()
+        self.selected = self.top + sel[0] if sel else None
+
+    def _move_selection(self, delta):
+        if not len(self.items):
+            return "break"
+        index = 0 if self.selected is None else max(0, min(self.selected + delta, len(self.items) - 1))
+        self.selected = index
+        self.see(index)
+        return "break"
+
+    def curselection(self):
+        if self.selected is None or self.selected >= len(self.items):
+            return ()
+        return (self.selected,)
+
+    def select(self, index):
+        self.selected = index
+        self.see(index)
+
+    # --- Incremental updates, called after the backing sequence changed ---
+
+    def row_inserted(self, index, see=True):
+        if self.selected is not None and index <= self.selected:
+            self.selected += 1
+        if see:
+            self.see(index)
+        elif index < self.top:
+            # Keep the same rows on screen
+            self.top += 1
+            self._update_scrollbar()
+        elif index < self.top + self.height:
+            self.refresh()
+        else:
+            self._update_scrollbar()
+
+    def row_updated(self, index):
+        if self.top <= index < self.top + self.height:
+            self.listbox.delete(index - self.top)
+            self.listbox.insert(index - self.top, self.formatter(self.items[index]))
+            if self.selected == index:
+                self.listbox.selection_set(index - self.top)
+
+    def row_deleted(self, index):
+        if self.selected == index:
+            self.selected = None
+        elif self.selected is not None and index < self.selected:
+            self.selected -= 1
+        if index < self.top + self.height:
+            if index < self.top:
+                self.top -= 1
+            self.refresh()
+        else:
+            self._update_scrollbar()
+
+
+class PagedList(ttk.Frame):
+    """A VirtualList showing one page at a time of records read on demand.
+
+    `fetch(offset, limit)` returns the records of one page and `count()`
+    how many there are in all, so only `page_size` records are held.
+    """
+
+    def __init__(self, parent, fetch, count, formatter, page_size=50, **options):
+        super().__init__(parent)
+        self.fetch = fetch
+        self.count = count
+        self.page_size = page_size
+        self.page = 0
+        self.view = VirtualList(self, [], formatter, **options)
+        self.view.pack(fill='both', expand=True)
+        self.listbox = self.view.listbox
+        bar = ttk.Frame(self)
+        bar.pack(fill='x')
+        ttk.Button(bar, text="< Prev", command=lambda: self.turn(-1)).pack(side='left')
+        ttk.Button(bar, text="Next >", command=lambda: self.turn(1)).pack(side='right')
+        self.label = ttk.Label(bar)
+        self.label.pack(side='left', expand=True)
+        self.refresh()
+
+    def pages(self):
+        return max(1, -(-self.count() // self.page_size))
+
+    def refresh(self):
+        """Re-read the current page, e.g. after records were added or removed."""
+        pages = self.pages()
+        self.page = min(self.page, pages - 1)
+        self.view.set_items(self.fetch(self.page * self.page_size, self.page_size))
+        self.label.configure(text=f"Page {self.page + 1} of {pages}")
+
+    def turn(self, delta):
+        page = max(0, min(self.page + delta, self.pages() - 1))
+        if page != self.page:
+            self.page = page
+            self.refresh()
+
+    def selected(self):
+        index = self.view.curselection()
+        return self.view.items[index[0]] if index else None
+
+
+class SearchBox(ttk.Frame):
+    """An entry with a short list of matches that updates on every keystroke.
+
+    `search(query, limit)` returns matching records and `formatter` turns
+    one into its display string. Picking a match (click, or Enter for the
+    first one) stores it in `choice` and calls `on_pick(record)`.
+    """
+
+    def __init__(self, parent, search, formatter, on_pick=None, limit=8, width=30, **listbox_options):
+        super().__init__(parent)
+        self.search = search
+        self.formatter = formatter
+        self.on_pick = on_pick
+        self.limit = limit
+        self.matches = []
+        self.choice = None
+        self._picking = False
+        self.var = tk.StringVar()
+        self.entry = ttk.Entry(self, textvariable=self.var, width=width)
+        self.entry.pack(fill='x')
+        self.listbox = tk.Listbox(self, height=min(limit, 5), width=width, exportselection=False, **listbox_options)
+        self.listbox.pack(fill='x')
+        self.var.trace_add("write", self._on_type)
+        self.listbox.bind("<<ListboxSelect>>", self._on_select)
+        self.entry.bind("<Return>", self._pick_first)
+        self.refresh()
+
+    def refresh(self):
+        """Re-run the current query, e.g. after the searched records changed."""
+        self.matches = self.search(self.var.get(), self.limit)
+        self.listbox.delete(0, tk.END)
+        for record in self.matches:
+            self.listbox.insert(tk.END, self.formatter(record))
+
+    def _on_type(self, *args):
+        if self._picking:
+            return
+        self.choice = None
+        self.refresh()
+
+    def _on_select(self, event=None):
+        sel = self.listbox.curselection()
+        if sel:
+            self.pick(self.matches[sel[0]])
+
+    def _pick_first(self, event=None):
+        if self.matches:
+            self.pick(self.matches[0])
+        return "break"
+
+    def pick(self, record):
+        self.set_choice(record)
+        if self.on_pick is not None:
+            self.on_pick(record)
+
+    def set_choice(self, record):
+        # Show the picked record in the entry without searching for it again
+        self.choice = record
+        self._picking = True
+        self.var.set(self.formatter(record))
+        self._picking = False
+
+    def clear(self):
+        self.choice = None
+        self.var.set("")